@@ -0,0 +1,225 @@
+"""Benchmarks the preprocessing and serving-file pipeline on synthetic data.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --output bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json
+
+With --baseline, the run exits non-zero when any stage is slower (or uses
+more peak memory) than the stored result by more than --tolerance.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from benchmarks.synthetic import (WINDOWS, eiaPayload, electricityFrame,
+                                  splitToObjects, weatherFrame)
+from params import (ELECTRICITY_CATEGORICAL_COLUMNS, ELECTRICITY_FEATURES,
+                    FEATURE_DTYPE, WEATHER_CATEGORICAL_COLUMNS,
+                    WEATHER_FEATURES)
+from utils.align import alignSources, sourceArrays
+from utils.ingest import readCsvFrames
+from utils.local import FakeS3
+from utils.preprocessing import (electricityFrameFromJSON,
+                                 getPreprocessedElectricityData,
+                                 getPreprocessedWeatherData,
+                                 preprocessElectricHourlyDemandJSON,
+                                 reformatFrameColumns)
+from utils.serialization import frameToJSONLines
+from utils.timestamps import formatTimestamps, parseWallClock, roundUpHours
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "deep_ar/data/raw"
+WEATHER_BUCKET = "bench-weather"
+ELECTRIC_BUCKET = "bench-electric"
+
+
+def measure(fn, repeat=1, memory=True):
+    """Runs fn, returning (result, best wall seconds, peak traced MB)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / (1024 * 1024)
+    return result, best, peak_mb
+
+
+def runScenario(window, stations, respondents, repeat=1, memory=True,
+                objects_per_day=1):
+    """Runs every pipeline stage for one window/fleet size."""
+    days = WINDOWS[window]
+    scenario = "{}-{}st-{}resp".format(window, stations, respondents)
+    s3 = FakeS3()
+    for bucket, df, column in [
+            (WEATHER_BUCKET, weatherFrame(days, stations), "properties.timestamp"),
+            (ELECTRIC_BUCKET, electricityFrame(days, respondents), "period")]:
+        for key, body in splitToObjects(df, column, PREFIX, objects_per_day).items():
+            s3.put_object(Bucket=bucket, Key=key, Body=body)
+    payload = eiaPayload(days, respondents)
+    results = []
+
+    def record(stage, fn, rows):
+        out, seconds, peak_mb = measure(fn, repeat, memory)
+        n = rows(out) if callable(rows) else rows
+        results.append({
+            "scenario": scenario, "stage": stage, "rows": n,
+            "seconds": round(seconds, 6),
+            "rows_per_sec": round(n / seconds, 1) if seconds > 0 else None,
+            "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+        })
+        logger.info("%s %-10s %9.4fs %10s rows", scenario, stage, seconds, n)
+        return out
+
+    def load():
+        weather = pd.concat(readCsvFrames(s3, WEATHER_BUCKET, PREFIX, None, None))
+        electric = pd.concat(readCsvFrames(s3, ELECTRIC_BUCKET, PREFIX, None, None))
+        return (weather.drop_duplicates().reset_index(),
+                electric.drop_duplicates().reset_index())
+
+    weather_raw, electric_raw = record(
+        "load", load, lambda out: len(out[0]) + len(out[1]))
+
+    def loadPreprocessed(projected):
+        # The same loader with and without column projection, so the two
+        # stages differ only in what is parsed and how it is stored
+        def run():
+            weather_options, electricity_options = {}, {}
+            if projected:
+                weather_options = {"features": WEATHER_FEATURES,
+                                   "categories": WEATHER_CATEGORICAL_COLUMNS,
+                                   "feature_dtype": FEATURE_DTYPE}
+                electricity_options = {"features": ELECTRICITY_FEATURES,
+                                       "categories": ELECTRICITY_CATEGORICAL_COLUMNS,
+                                       "feature_dtype": FEATURE_DTYPE}
+            return (getPreprocessedWeatherData(s3, WEATHER_BUCKET, PREFIX, None, None,
+                                               **weather_options),
+                    getPreprocessedElectricityData(s3, ELECTRIC_BUCKET, PREFIX, None, None,
+                                                   **electricity_options))
+        return run
+
+    record("load_full", loadPreprocessed(False),
+           lambda out: len(out[0]) + len(out[1]))
+    record("load_projected", loadPreprocessed(True),
+           lambda out: len(out[0]) + len(out[1]))
+
+    def reformat():
+        return (reformatFrameColumns(weather_raw.copy()),
+                reformatFrameColumns(electric_raw.copy()))
+
+    weather, electric = record(
+        "reformat", reformat, lambda out: len(out[0]) + len(out[1]))
+
+    def roundTimestamps():
+        return formatTimestamps(roundUpHours(parseWallClock(weather.timestamp)))
+
+    weather["timestamp"] = record("timestamps", roundTimestamps, len)
+
+    record("eia_json", lambda: preprocessElectricHourlyDemandJSON(payload), len)
+    payload_bytes = json.dumps(payload).encode("utf-8")
+    record("eia_stream", lambda: electricityFrameFromJSON(
+        payload_bytes, features=ELECTRICITY_FEATURES, feature_dtype=FEATURE_DTYPE), len)
+
+    def merge():
+        w = weather[weather.station == weather.station.iloc[0]]
+        e = electric[electric.respondent == electric.respondent.iloc[0]]
+        w = w.set_index("timestamp")[WEATHER_FEATURES]
+        e = e.rename(columns={"period": "timestamp"}).set_index("timestamp")
+        return w.merge(e[ELECTRICITY_FEATURES], how="inner",
+                       left_index=True, right_index=True)
+
+    X = record("merge", merge, len)
+
+    def align():
+        w = weather[weather.station == weather.station.iloc[0]].set_index("timestamp")
+        e = electric[electric.respondent == electric.respondent.iloc[0]]
+        e = e.rename(columns={"period": "timestamp"}).set_index("timestamp")
+        return alignSources([sourceArrays(w, WEATHER_FEATURES),
+                             sourceArrays(e, ELECTRICITY_FEATURES)])
+
+    record("align", align, lambda out: len(out.values))
+    record("serialize", lambda: frameToJSONLines(X), lambda out: X.size)
+    return results
+
+
+def compareToBaseline(results, baseline, tolerance, min_seconds):
+    """Lists stages that regressed against a stored baseline."""
+    stored = {(r["scenario"], r["stage"]): r for r in baseline["results"]}
+    failures = []
+    for r in results:
+        base = stored.get((r["scenario"], r["stage"]))
+        if base is None:
+            continue
+        if (r["seconds"] > min_seconds
+                and r["seconds"] > base["seconds"] * (1 + tolerance)):
+            failures.append("{scenario} {stage}: {seconds}s vs baseline "
+                            "{base}s".format(base=base["seconds"], **r))
+        if (r["peak_mb"] is not None and base.get("peak_mb")
+                and r["peak_mb"] > base["peak_mb"] * (1 + tolerance)):
+            failures.append("{scenario} {stage}: {peak_mb}MB vs baseline "
+                            "{base}MB".format(base=base["peak_mb"], **r))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--windows", type=str, default="30d,180d,2y,10y")
+    parser.add_argument("--fleets", type=str, default="1x1,4x4",
+                        help="Comma separated <stations>x<respondents> sizes")
+    parser.add_argument("--objects-per-day", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(message)s", level=args.log_level)
+
+    results = []
+    for window in args.windows.split(","):
+        for fleet in args.fleets.split(","):
+            stations, respondents = (int(x) for x in fleet.split("x"))
+            results.extend(runScenario(window, stations, respondents,
+                                       args.repeat, not args.no_memory,
+                                       args.objects_per_day))
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        failures = compareToBaseline(results, baseline, args.tolerance,
+                                     args.min_seconds)
+        for failure in failures:
+            logger.error("Regression: %s", failure)
+        if failures:
+            sys.exit(1)
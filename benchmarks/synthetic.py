@@ -0,0 +1,120 @@
+"""Synthetic NOAA/weather.gov and EIA-style inputs for the benchmarks."""
+import io
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+WINDOWS = {"30d": 30, "180d": 180, "2y": 730, "10y": 3650}
+STATION_URL = "https://api.weather.gov/stations/{}"
+EIA_TYPES = ["Demand", "Day-ahead demand forecast", "Net generation",
+             "Total interchange"]
+
+
+def stationIds(n: int) -> List[str]:
+    return ["K{:03d}".format(i) for i in range(n)]
+
+
+def respondentIds(n: int) -> List[str]:
+    return ["R{:02d}".format(i) for i in range(n)]
+
+
+def hourlyIndex(days: int, end: datetime = None) -> pd.DatetimeIndex:
+    """Hourly UTC timestamps covering the last `days` days."""
+    if end is None:
+        end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    start = end - timedelta(days=days)
+    return pd.date_range(start, end, freq=pd.Timedelta(hours=1),
+                         inclusive="left")
+
+
+def weatherFrame(days: int, stations: int = 1, seed: int = 0) -> pd.DataFrame:
+    """Weather observations as json_normalize would flatten them."""
+    rng = np.random.default_rng(seed)
+    hours = hourlyIndex(days) + pd.Timedelta(minutes=52)
+    frames = []
+    for station in stationIds(stations):
+        n = len(hours)
+        frames.append(pd.DataFrame({
+            "id": [STATION_URL.format(station)] * n,
+            "type": "Feature",
+            "properties.station": STATION_URL.format(station),
+            "properties.timestamp": hours.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            "properties.textDescription": "Cloudy",
+            "properties.temperature.value": rng.normal(12, 8, n).round(1),
+            "properties.relativeHumidity.value": rng.uniform(20, 100, n).round(3),
+            "properties.windSpeed.value": rng.uniform(0, 40, n).round(2),
+            "properties.barometricPressure.value": rng.normal(101500, 800, n).round(0),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def weatherPayload(days: int, stations: int = 1, seed: int = 0) -> Dict:
+    """Raw weather.gov observations (GeoJSON) holding weatherFrame's rows."""
+    df = weatherFrame(days, stations, seed)
+    measures = ["temperature", "relativeHumidity", "windSpeed", "barometricPressure"]
+    features = []
+    for row in df.to_dict("records"):
+        props = {"@id": row["id"], "station": row["properties.station"],
+                 "timestamp": row["properties.timestamp"],
+                 "textDescription": row["properties.textDescription"],
+                 "cloudLayers": [{"base": {"unitCode": "wmoUnit:m", "value": 1200}, "amount": "BKN"}]}
+        for m in measures:
+            props[m] = {"unitCode": "wmoUnit:unit", "value": row["properties.{}.value".format(m)],
+                        "qualityControl": "V"}
+        features.append({"id": row["id"], "type": "Feature",
+                         "geometry": {"type": "Point", "coordinates": [-84.67, 39.04]},
+                         "properties": props})
+    return {"@context": ["https://geojson.org/geojson-ld/geojson-context.jsonld"],
+            "type": "FeatureCollection", "features": features}
+
+
+def electricityFrame(days: int, respondents: int = 1, seed: int = 1) -> pd.DataFrame:
+    """Hourly demand rows as preprocessElectricHourlyDemandJSON writes them."""
+    rng = np.random.default_rng(seed)
+    hours = hourlyIndex(days)
+    frames = []
+    for respondent in respondentIds(respondents):
+        n = len(hours)
+        frame = pd.DataFrame({
+            "period": hours.strftime("%Y-%m-%d %H:%M:%S"),
+            "respondent": respondent,
+            "value_units": "megawatthours",
+        })
+        for name in EIA_TYPES:
+            column = "value_" + name.replace("-", "_").lower()
+            frame[column] = rng.normal(15000, 2500, n).round(0)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def eiaPayload(days: int, respondents: int = 1, seed: int = 2) -> Dict:
+    """Raw EIA API v2 response holding long-format hourly values."""
+    rng = np.random.default_rng(seed)
+    periods = hourlyIndex(days).strftime("%Y-%m-%dT%H")
+    rows = []
+    for respondent in respondentIds(respondents):
+        for name in EIA_TYPES:
+            values = rng.normal(15000, 2500, len(periods)).round(0)
+            rows.extend({
+                "period": p, "respondent": respondent,
+                "respondent-name": respondent, "type": name[:2].upper(),
+                "type-name": name, "value": v, "value-units": "megawatthours",
+            } for p, v in zip(periods, values.tolist()))
+    return {"response": {"total": len(rows), "data": rows}}
+
+
+def splitToObjects(df: pd.DataFrame, time_column: str, prefix: str,
+                   per_day: int = 1) -> Dict[str, bytes]:
+    """Splits a frame into CSV objects, `per_day` objects per calendar day."""
+    day = df[time_column].str.slice(0, 10)
+    hour = df[time_column].str.slice(11, 13).astype(int)
+    part = (hour * per_day) // 24
+    objects = {}
+    for (d, p), group in df.groupby([day, part], sort=True):
+        buf = io.StringIO()
+        group.to_csv(buf, index=False)
+        key = "{}/{}/part-{:02d}.csv".format(prefix, d, p)
+        objects[key] = buf.getvalue().encode("utf-8")
+    return objects
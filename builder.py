@@ -1,42 +1,53 @@
 import argparse
+import functools
 import logging
 import os
 import yaml
-import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logger = logging.getLogger(__name__)
 log_format = "%(levelname)s: [%(filename)s:%(lineno)s] %(message)s"
 logging.basicConfig(format=log_format)
 
-# AWS client setup
-sm_client = boto3.client("sagemaker")
+# Prefer libyaml's C loader/dumper when PyYAML was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CDumper", yaml.Dumper)
+
+# AWS client setup; created on first use so --offline never needs credentials.
+# Adaptive retries back off on throttling from the SageMaker list APIs.
+SM_CLIENT_CONFIG = Config(retries={"max_attempts": 10, "mode": "adaptive"})
+sm_client = None
+
+
+def get_sm_client():
+    global sm_client
+    if sm_client is None:
+        import boto3
+
+        sm_client = boto3.client("sagemaker", config=SM_CLIENT_CONFIG)
+    return sm_client
 
 
 # Fetch latest approved model package for a model package group
 def get_approved_package(model_package_group_name):
     try:
-        # Fetch approved packages
-        response = sm_client.list_model_packages(
+        # Page through approved packages until the first non-empty page
+        paginator = get_sm_client().get_paginator("list_model_packages")
+        pages = paginator.paginate(
             ModelPackageGroupName=model_package_group_name,
             ModelApprovalStatus="Approved",
             SortBy="CreationTime",
-            MaxResults=100,
+            PaginationConfig={"PageSize": 100},
         )
-        approved_packages = response["ModelPackageSummaryList"]
-
-        # Fetch more packages if none returned with continuation token
-        while len(approved_packages) == 0 and "NextToken" in response:
-            response = sm_client.list_model_packages(
-                ModelPackageGroupName=model_package_group_name,
-                ModelApprovalStatus="Approved",
-                SortBy="CreationTime",
-                MaxResults=100,
-                NextToken=response["NextToken"],
-            )
-            approved_packages.extend(response["ModelPackageSummaryList"])
+        approved_packages = []
+        for page in pages:
+            approved_packages.extend(page["ModelPackageSummaryList"])
+            if approved_packages:
+                break
 
         # Return error if no packages found
         if len(approved_packages) == 0:
@@ -78,7 +89,7 @@ def extend_config(args, model_package_arn, stage_config):
         "sagemaker:project-name": args.sagemaker_project_name,
     }
     # Add tags from Project
-    get_pipeline_custom_tags(args, sm_client, new_tags)
+    new_tags.update(get_project_tags(args.sagemaker_project_name))
     logger.info(
         f"stage_config parameters: {stage_config}"
     )
@@ -87,20 +98,19 @@ def extend_config(args, model_package_arn, stage_config):
         "Tags": {**stage_config.get("Tags", {}), **new_tags},
     }
 
-def get_pipeline_custom_tags(args, sm_client, new_tags):
+@functools.lru_cache(maxsize=None)
+def get_project_tags(sagemaker_project_name):
+    """Project tags, looked up once per build however many stages render."""
     try:
-        response = sm_client.describe_project(
-            ProjectName=args.sagemaker_project_name
-        )
+        client = get_sm_client()
+        response = client.describe_project(ProjectName=sagemaker_project_name)
         sagemaker_project_arn = response["ProjectArn"]
-        response = sm_client.list_tags(
-                ResourceArn=sagemaker_project_arn)
-        project_tags = response["Tags"]
-        for project_tag in project_tags:
-            new_tags[project_tag["Key"]] = project_tag["Value"]
-    except:
+        response = client.list_tags(ResourceArn=sagemaker_project_arn)
+        return {tag["Key"]: tag["Value"] for tag in response["Tags"]}
+    except Exception:
         logger.error("Error getting project tags")
-    return new_tags
+        return {}
+
 
 # Custom constructor and representer for !Ref and !Sub tags
 def ref_constructor(loader, node):
@@ -122,33 +132,25 @@ def ref_ref_representer(dumper, data):
 
 
 # Add constructors and representers to YAML loader and dumper
-yaml.SafeLoader.add_constructor("!Ref", ref_constructor)
-yaml.SafeLoader.add_constructor("!Sub", sub_constructor)
+for loader in {yaml.SafeLoader, YamlLoader}:
+    loader.add_constructor("!Ref", ref_constructor)
+    loader.add_constructor("!Sub", sub_constructor)
 yaml.SafeDumper.add_representer(dict, sub_ref_representer)
 yaml.SafeDumper.add_representer(dict, ref_ref_representer)
 
 
-def add_model_package_name_to_yaml(template_path, model_package_arn):
-    with open(template_path, "r") as file:
-        template = yaml.safe_load(file)
-
+def add_model_package_name_to_yaml(template, model_package_arn):
     # Add ModelPackageName to the SageMakerModel Properties
     template["Resources"]["SageMakerModel"]["Properties"]["Containers"] = [
         {"ModelPackageName": model_package_arn}
     ]
-
-    with open(template_path, "w") as file:
-        yaml.dump(template, file, default_flow_style=False)
+    return template
 
 
 # Add environment variables to a SAM template
-def add_environment_variables(template_path, function_name, variables):
-    with open(template_path, "r") as file:
-        template = yaml.safe_load(file)
+def add_environment_variables(template, function_name, variables):
     logger.info(f"variables: {variables}")
-    print(template)
-    print("function_name: ", function_name)
-    print(template["Resources"])
+    logger.debug(f"function_name: {function_name}")
     if "Resources" in template and function_name in template["Resources"]:
         function = template["Resources"][function_name]
         if "Properties" in function and "Environment" in function["Properties"]:
@@ -156,9 +158,21 @@ def add_environment_variables(template_path, function_name, variables):
             function_env.setdefault("Variables", {}).update(variables)
         else:
             function["Properties"]["Environment"] = {"Variables": variables}
+    return template
+
+
+def render_template(template_path, model_package_arn, function_name, variables,
+                    output_path=None):
+    """Parses the SAM template once, applies every mutation in memory and
+    writes it once (back to template_path unless output_path is given)."""
+    with open(template_path, "r") as file:
+        template = yaml.load(file, Loader=YamlLoader)
+    add_model_package_name_to_yaml(template, model_package_arn)
+    add_environment_variables(template, function_name, variables)
+    with open(output_path or template_path, "w") as file:
+        yaml.dump(template, file, Dumper=YamlDumper, default_flow_style=False)
+    return template
 
-    with open(template_path, "w") as file:
-        yaml.dump(template, file, default_flow_style=False)
 
 def get_cfn_style_config(stage_config):
     parameters = []
@@ -186,6 +200,55 @@ def create_cfn_params_tags_file(config, export_params_file, export_tags_file):
         json.dump(tags, f, indent=4)
 
 
+def render_stage(args, model_package_arn, stage):
+    """Extends one stage config and writes its exports.
+
+    stage holds the import path and the config/params/tags export paths."""
+    with open(stage["import"], "r") as f:
+        config = extend_config(args, model_package_arn, json.load(f))
+    logger.debug("{} config: {}".format(stage["import"], json.dumps(config, indent=4)))
+    with open(stage["config"], "w") as f:
+        json.dump(config, f, indent=4)
+    if args.export_cfn_params_tags:
+        create_cfn_params_tags_file(config, stage["params"], stage["tags"])
+    return config
+
+
+def stage_exports(import_path):
+    """Export paths for a stage config, named after its StageName
+    (staging-config.json -> staging-config-export.json, ...)."""
+    with open(import_path, "r") as f:
+        stage_name = json.load(f).get("Parameters", {}).get("StageName")
+    if not stage_name:
+        raise Exception("Configuration file must include SageName parameter")
+    return {
+        "import": import_path,
+        "config": f"{stage_name}-config-export.json",
+        "params": f"{stage_name}-params-export.json",
+        "tags": f"{stage_name}-tags-export.json",
+    }
+
+
+def render_stages(args, model_package_arn, stages, max_workers=8):
+    """Renders every stage config concurrently; project tags are looked up
+    once and shared by all stages."""
+    get_project_tags(args.sagemaker_project_name)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stages)))) as pool:
+        return list(pool.map(
+            lambda stage: render_stage(args, model_package_arn, stage), stages))
+
+
+def offline_client(args):
+    """Fake SageMaker client holding one approved package for the group and
+    the project, so the build can be rendered without AWS access."""
+    from utils.local import FakeSageMaker
+
+    client = FakeSageMaker()
+    client.addModelPackage(args.model_package_group_name, 1)
+    client.addProject(args.sagemaker_project_name)
+    return client
+
+
 # Main execution
 if __name__ == "__main__":
     # Argument parser setup
@@ -198,6 +261,8 @@ if __name__ == "__main__":
         default="template.yml",
         help="Path to the SAM template file",
     )
+    parser.add_argument("--output-template-path", type=str, default=None,
+                        help="Write the rendered template here instead of in place")
     parser.add_argument("--function-name", type=str, help="Name of the Lambda function")
     parser.add_argument(
         "--log-level", type=str, default=os.environ.get("LOGLEVEL", "INFO").upper()
@@ -208,6 +273,8 @@ if __name__ == "__main__":
     parser.add_argument("--sagemaker-project-id", type=str, required=True)
     parser.add_argument("--sagemaker-project-name", type=str, required=True)
     parser.add_argument("--s3-bucket", type=str, required=True)
+    parser.add_argument("--stage-configs", type=str, nargs="+", default=None,
+                        help="Stage config files; exports are named after each StageName")
     parser.add_argument("--import-staging-config", type=str, default="staging-config.json")
     parser.add_argument("--import-prod-config", type=str, default="prod-config.json")
     parser.add_argument("--export-staging-config", type=str, default="staging-config-export.json")
@@ -217,18 +284,20 @@ if __name__ == "__main__":
     parser.add_argument("--export-prod-params", type=str, default="prod-params-export.json")
     parser.add_argument("--export-prod-tags", type=str, default="prod-tags-export.json")
     parser.add_argument("--export-cfn-params-tags", type=bool, default=False)
+    parser.add_argument("--offline", action="store_true",
+                        help="Use a fake SageMaker client instead of AWS")
     args = parser.parse_args()
 
     # Set log level
     logging.getLogger().setLevel(args.log_level)
 
+    if args.offline:
+        sm_client = offline_client(args)
+
     # Fetch model package ARN
     logger.info("Getting model package ARN.")
     model_package_arn = get_approved_package(args.model_package_group_name)
 
-    # Add the model package arn to the resource section
-    add_model_package_name_to_yaml(args.template_path, model_package_arn)
-
     # Create dictionary of environment variables
     logger.info("Creating a dictionary of environment variables.")
     env_dict = {
@@ -239,34 +308,26 @@ if __name__ == "__main__":
         "SAGEMAKER_PROJECT_NAME": args.sagemaker_project_name,
     }
 
-    # Add environment variables to file
-    logger.info(f"Adding environment variables to file: {args.template_path}")
-    add_environment_variables(args.template_path, args.function_name, env_dict)
-
-    # Write the staging config
-    with open(args.import_staging_config, "r") as f:
-        staging_config = extend_config(args, model_package_arn, json.load(f))
-    logger.debug("Staging config: {}".format(json.dumps(staging_config, indent=4)))
-    with open(args.export_staging_config, "w") as f:
-        json.dump(staging_config, f, indent=4)
-    if (args.export_cfn_params_tags):
-      create_cfn_params_tags_file(staging_config, args.export_staging_params, args.export_staging_tags)
-
-    # Write the prod config for code pipeline
-    with open(args.import_prod_config, "r") as f:
-        prod_config = extend_config(args, model_package_arn, json.load(f))
-    logger.debug("Prod config: {}".format(json.dumps(prod_config, indent=4)))
-    with open(args.export_prod_config, "w") as f:
-        json.dump(prod_config, f, indent=4)
-    if (args.export_cfn_params_tags):
-      create_cfn_params_tags_file(prod_config, args.export_prod_params, args.export_prod_tags)
-
-    with open(args.template_path, "r") as file:
-        template = yaml.safe_load(file)
+    # Add the model package arn and environment variables in a single pass
+    logger.info(f"Rendering template: {args.template_path}")
+    template = render_template(args.template_path, model_package_arn,
+                               args.function_name, env_dict,
+                               args.output_template_path)
+
+    # Write the stage configs for code pipeline
+    if args.stage_configs:
+        stages = [stage_exports(path) for path in args.stage_configs]
+    else:
+        stages = [
+            {"import": args.import_staging_config, "config": args.export_staging_config,
+             "params": args.export_staging_params, "tags": args.export_staging_tags},
+            {"import": args.import_prod_config, "config": args.export_prod_config,
+             "params": args.export_prod_params, "tags": args.export_prod_tags},
+        ]
+    configs = render_stages(args, model_package_arn, stages)
 
     logger.info("template.yml")
     logger.info(template)
-    logger.info("staging config")
-    logger.info(staging_config)
-    logger.info("prod config")
-    logger.info(prod_config)
+    for stage, config in zip(stages, configs):
+        logger.info(f"{stage['import']} config")
+        logger.info(config)
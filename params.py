@@ -5,3 +5,122 @@ ELECTRICITY_FEATURES = ['value_demand']
 S3_SERVING_PREFIX_URI = "s3://cw-weather-data-deployment/serving/"
 S3_SERVING_INPUT_URI = "s3://cw-weather-data-deployment/serving/serving.json"
 S3_FORECAST_PREFIX_URI = "s3://cw-weather-data-deployment/forecasts/"
+
+# Loaders parse only the features, timestamp and these categorical columns;
+# features are read as FEATURE_DTYPE (float32 keeps about 7 significant digits)
+FEATURE_DTYPE = "float32"
+WEATHER_CATEGORICAL_COLUMNS = ['station']
+ELECTRICITY_CATEGORICAL_COLUMNS = ['respondent', 'value_units']
+
+# Raw data format: "csv" reads RAW_DATA_PREFIX, "parquet" reads the day
+# partitions compact_raw.py writes under COLUMNAR_PREFIX in the same buckets
+RAW_DATA_FORMAT = "csv"
+COLUMNAR_PREFIX = "deep_ar/data/columnar"
+COLUMNAR_ROW_GROUP_HOURS = 6
+
+# Key manifest: select CSVs by the data time recorded in a per-bucket index
+# (maintained by update_manifest.py) instead of listing the prefix
+USE_KEY_MANIFEST = False
+KEY_MANIFEST_KEY = "deep_ar/data/manifest/raw-keys.json"
+
+# S3 ingest concurrency and memory limits
+INGEST_MAX_WORKERS = 16
+INGEST_MAX_IN_FLIGHT_MB = 256
+
+# Parsed-partition cache; /tmp survives warm invocations, the S3 tier is optional
+FRAME_CACHE_DIR = "/tmp/frame_cache"
+FRAME_CACHE_MAX_MB = 256
+FRAME_CACHE_S3_URI = None
+
+# Raw data sources and batch transform settings
+WEATHER_BUCKET = "cw-sagemaker-domain-1"
+ELECTRIC_BUCKET = "cw-electric-demand-hourly-preprocessed"
+# Bucket and raw timestamp column (after columnNameReformat) of each source,
+# used by compact_raw.py and update_manifest.py
+RAW_DATA_SOURCES = {
+    "weather": (WEATHER_BUCKET, "timestamp"),
+    "electricity": (ELECTRIC_BUCKET, "period"),
+}
+RAW_DATA_PREFIX = "deep_ar/data/raw"
+DAY_WINDOW = 180
+TRANSFORM_INSTANCE_TYPE = "ml.m5.xlarge"
+
+# Batch mode: one categorical DeepAR series per station/respondent and feature.
+# Empty station/respondent lists select every group found in the window.
+# Group ids (the first cat value) are kept in GROUP_IDS_URI: configured groups
+# take ids in list order, others in first-seen order, and no id is reassigned.
+BATCH_MODE = False
+WEATHER_GROUP_COLUMN = "station"
+ELECTRICITY_GROUP_COLUMN = "respondent"
+WEATHER_STATIONS = []
+RESPONDENTS = []
+GROUP_IDS_URI = "s3://cw-weather-data-deployment/state/group-ids.json"
+
+# Transform job planner: instances scale with series count up to the cap
+TRANSFORM_MAX_INSTANCES = 4
+TRANSFORM_SERIES_PER_INSTANCE = 500
+TRANSFORM_SHARDS_PER_INSTANCE = 2
+
+# Incremental mode: keep the aligned window in a persisted ring buffer and only
+# load objects modified since the last processed hour (minus an overlap for late data)
+INCREMENTAL_MODE = False
+WINDOW_STATE_URI = "s3://cw-weather-data-deployment/state/rolling-window.npz"
+INCREMENTAL_OVERLAP_HOURS = 6
+
+# Online inference: small runs are forecast through a real-time endpoint in
+# micro-batches instead of a batch transform job. Runs with more series than
+# ONLINE_MAX_SERIES, or without an endpoint, fall back to batch transform.
+INFERENCE_MODE = "batch"
+ONLINE_ENDPOINT_NAME = ""
+ONLINE_MAX_SERIES = 200
+ONLINE_MAX_INSTANCES_PER_REQUEST = 20
+ONLINE_MAX_PAYLOAD_MB = 5
+ONLINE_CONCURRENCY = 4
+
+# Run ledger: skip the upload and forecast when the serving records and model
+# match the latest run recorded in RUN_LEDGER_URI, and point to its forecast
+SKIP_UNCHANGED_INPUT = True
+RUN_LEDGER_URI = "s3://cw-weather-data-deployment/state/run-ledger.json"
+RUN_LEDGER_MAX_ENTRIES = 50
+
+# Streaming uploads: payloads above the threshold go up as parallel multipart
+# uploads. SERVING_COMPRESSION "gzip" compresses the transform input.
+UPLOAD_PART_SIZE_MB = 8
+UPLOAD_MULTIPART_THRESHOLD_MB = 16
+UPLOAD_MAX_WORKERS = 4
+SERVING_COMPRESSION = "none"
+
+# Hourly alignment: sources are placed on one contiguous grid spanning the hours
+# every source covers ("overlap") or any source covers ("union"). Missing hours
+# stay "NaN", or are forward-filled ("ffill") or interpolated ("interpolate")
+# when the gap is at most ALIGN_MAX_GAP_HOURS long.
+ALIGN_GRID_EXTENT = "overlap"
+ALIGN_FILL_METHOD = "nan"
+ALIGN_MAX_GAP_HOURS = 6
+
+# Backtest mode: load enough history for BACKTEST_CUTOFFS cutoffs, BACKTEST_STRIDE_HOURS
+# apart, and write one request per (cutoff, series) under BACKTEST_PREFIX_URI/<run id>/
+# with the actuals needed to score it. Serving data and the run ledger are untouched.
+BACKTEST_MODE = False
+BACKTEST_PREFIX_URI = "s3://cw-weather-data-deployment/backtest/"
+BACKTEST_CUTOFFS = 200
+BACKTEST_STRIDE_HOURS = 24
+BACKTEST_CONTEXT_HOURS = DAY_WINDOW * 24
+BACKTEST_PREDICTION_HOURS = 24
+
+# Out-of-core loading: with a memory budget above 0, the DAY_WINDOW lookback is
+# loaded, cleaned and compacted in time-ordered chunks sized to fit the budget
+# and the serving records are built one at a time (not in batch or incremental mode).
+# The budget must cover an 8MB chunk plus the hourly grid of the window (about 50
+# bytes per hour and float32 feature, 64 bytes per hour for the record being
+# serialized): at least 9MB for 180 days, 12MB for 2 years and 26MB for 10 years
+# with the three default features. loadRunConfig rejects a smaller budget.
+MEMORY_BUDGET_MB = 0
+
+# Canary mode (the CodeDeploy traffic hooks): every stage runs on the
+# newest CANARY_DAY_WINDOW days both sources hold within DAY_WINDOW, writes
+# under CANARY_PREFIX_URI and checks the transform job without submitting it.
+# Serving data, window state and the run ledger are untouched.
+CANARY_MODE = False
+CANARY_PREFIX_URI = "s3://cw-weather-data-deployment/canary/"
+CANARY_DAY_WINDOW = 2
@@ -0,0 +1,80 @@
+"""Waits for a run's transform job and reads its forecasts into arrays.
+
+Latest run in the ledger:   python read_forecasts.py --output forecasts.npz
+A specific run:             python read_forecasts.py --job-name <name> \\
+                                --input-uri <serving input> --forecast-uri <output>
+
+The .npz holds the mean and every quantile as (series, horizon) arrays,
+the epoch hour each series' forecast starts at, and the serving index.
+"""
+import argparse
+import json
+import logging
+
+import numpy as np
+
+import params
+from utils.clients import getClient
+from utils.forecasts import SERIES_INDEX_FILE, readRunForecasts, waitForTransformJob
+from utils.ledger import loadLedger
+
+logger = logging.getLogger(__name__)
+
+
+def readLatestRun(s3, sagemaker, ledger_uri=params.RUN_LEDGER_URI,
+                  index_uri=params.S3_SERVING_PREFIX_URI + SERIES_INDEX_FILE,
+                  wait=True, timeout=3600):
+    """Forecasts of the latest run recorded in the run ledger."""
+    entry = loadLedger(s3, ledger_uri).latest
+    if entry is None:
+        raise ValueError("No runs recorded in " + ledger_uri)
+    return readRun(s3, sagemaker, entry["transformJobName"], entry["inputUri"],
+                   entry["forecastUri"], index_uri, wait, timeout)
+
+
+def readRun(s3, sagemaker, job_name, input_uri, forecast_uri, index_uri,
+            wait=True, timeout=3600):
+    if job_name and wait:
+        logger.info("Waiting for %s", job_name)
+        waitForTransformJob(sagemaker, job_name, timeout=timeout)
+    return readRunForecasts(s3, input_uri, forecast_uri, index_uri)
+
+
+def saveForecasts(path, forecasts):
+    arrays = {"mean": forecasts.mean, "start_hours": forecasts.start_hours,
+              "series_index": np.array(json.dumps(forecasts.series))}
+    for q, values in forecasts.quantiles.items():
+        arrays["quantile_" + q] = values
+    np.savez_compressed(path, **arrays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--job-name", type=str, default=None)
+    parser.add_argument("--input-uri", type=str, default=None)
+    parser.add_argument("--forecast-uri", type=str, default=None)
+    parser.add_argument("--index-uri", type=str,
+                        default=params.S3_SERVING_PREFIX_URI + SERIES_INDEX_FILE)
+    parser.add_argument("--ledger-uri", type=str, default=params.RUN_LEDGER_URI)
+    parser.add_argument("--no-wait", action="store_true")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=args.log_level)
+
+    s3 = getClient("s3")
+    sagemaker = getClient("sagemaker")
+    if args.forecast_uri:
+        forecasts = readRun(s3, sagemaker, args.job_name,
+                            args.input_uri or params.S3_SERVING_INPUT_URI,
+                            args.forecast_uri, args.index_uri,
+                            not args.no_wait, args.timeout)
+    else:
+        forecasts = readLatestRun(s3, sagemaker, args.ledger_uri, args.index_uri,
+                                  not args.no_wait, args.timeout)
+    logger.info("%d series, horizon %d, quantiles %s", len(forecasts.series),
+                forecasts.horizon, ", ".join(forecasts.quantiles))
+    if args.output:
+        saveForecasts(args.output, forecasts)
@@ -0,0 +1,137 @@
+"""Runs weather.lambda.lambda_handler offline against in-process S3 and
+SageMaker stand-ins, reporting per-stage timings.
+
+Synthetic data:   python run_local.py --days 180
+Fixture data:     python run_local.py --weather-dir fixtures/weather \\
+                      --electric-dir fixtures/electric --today 2024-03-01
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import statistics
+from datetime import datetime, timedelta, timezone
+
+import params
+from utils.clients import resetClients, setClient
+from utils.config import parseToday
+from utils.forecasts import SERIES_INDEX_FILE, readRunForecasts, waitForTransformJob
+from utils.local import FakeS3, FakeSageMaker, FakeSageMakerRuntime, runTransformJobs
+
+logger = logging.getLogger(__name__)
+
+
+def loadSynthetic(s3, days, stations, respondents, today):
+    """Fills the fake buckets with synthetic CSVs ending at `today`."""
+    from benchmarks.synthetic import (electricityFrame, splitToObjects,
+                                      weatherFrame)
+
+    sources = [
+        (params.WEATHER_BUCKET, weatherFrame(days, stations), "properties.timestamp"),
+        (params.ELECTRIC_BUCKET, electricityFrame(days, respondents), "period"),
+    ]
+    for bucket, df, column in sources:
+        # Shift the synthetic history so it ends at `today`
+        ts = shiftToToday(df[column], today)
+        df[column] = ts
+        for key, body in splitToObjects(df, column, params.RAW_DATA_PREFIX).items():
+            day = datetime.fromisoformat(key.split("/")[-2]).replace(tzinfo=timezone.utc)
+            s3.put_object(Bucket=bucket, Key=key, Body=body,
+                          LastModified=min(day + timedelta(days=1), today))
+
+
+def shiftToToday(values, today):
+    """Moves formatted timestamps so the last day falls on `today`."""
+    import pandas as pd
+
+    fmt = "%Y-%m-%dT%H:%M:%S+00:00" if "T" in values.iloc[0] else "%Y-%m-%d %H:%M:%S"
+    parsed = pd.to_datetime(values.str.slice(0, 19))
+    offset = pd.Timestamp(today.replace(tzinfo=None)).floor("D") - parsed.max().floor("D")
+    return (parsed + offset).dt.strftime(fmt)
+
+
+def runLocal(s3, sagemaker, event=None, repeat=1, runtime=None):
+    """Invokes the handler `repeat` times with the stand-ins injected."""
+    resetClients()
+    setClient("s3", s3)
+    setClient("sagemaker", sagemaker)
+    setClient("sagemaker-runtime", runtime or FakeSageMakerRuntime())
+    os.environ.setdefault("MODEL_NAME", "local-model")
+    handler = importlib.import_module("weather.lambda").lambda_handler
+    return [handler(event or {}, None) for _ in range(repeat)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weather-dir", type=str, default=None)
+    parser.add_argument("--electric-dir", type=str, default=None)
+    parser.add_argument("--days", type=int, default=params.DAY_WINDOW)
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--respondents", type=int, default=1)
+    parser.add_argument("--today", type=str, default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--export-results", type=str, default=None)
+    parser.add_argument("--read-forecasts", action="store_true",
+                        help="Write naive transform outputs and read the last run's forecasts back")
+    parser.add_argument("--backtest", action="store_true",
+                        help="Run in backtest mode and score the last run against naive forecasts")
+    parser.add_argument("--canary", action="store_true",
+                        help="Send the canary event the CodeDeploy traffic hooks send")
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=args.log_level)
+
+    today = parseToday(args.today) if args.today else datetime.now(timezone.utc)
+    s3 = FakeS3()
+    sagemaker = FakeSageMaker()
+    if args.weather_dir or args.electric_dir:
+        s3.loadDirectory(params.WEATHER_BUCKET, args.weather_dir,
+                         params.RAW_DATA_PREFIX, last_modified=today)
+        s3.loadDirectory(params.ELECTRIC_BUCKET, args.electric_dir,
+                         params.RAW_DATA_PREFIX, last_modified=today)
+    else:
+        loadSynthetic(s3, args.days, args.stations, args.respondents, today)
+
+    event = {"config": {"today": today.isoformat()}}
+    if args.backtest:
+        event["config"]["backtest_mode"] = True
+    if args.canary:
+        event["config"]["canary_mode"] = True
+    responses = runLocal(s3, sagemaker, event, args.repeat)
+
+    stages = {}
+    for response in responses:
+        for stage, ms in response["timings"].items():
+            stages.setdefault(stage, []).append(ms)
+    results = {
+        "runs": len(responses),
+        "stages_ms": {k: {"median": statistics.median(v), "max": max(v)}
+                      for k, v in stages.items()},
+        "transform_requests": [r["TransformJobName"] for r in sagemaker.requests],
+        "s3_calls": len(s3.calls),
+        "sagemaker_calls": sorted(set(sagemaker.calls)),
+    }
+    if args.backtest:
+        # Score the last backtest run's naive forecasts against its actuals
+        from score_backtest import scoreRun
+
+        runTransformJobs(s3, sagemaker)
+        scores, wql = scoreRun(s3, sagemaker, responses[-1]["backtestUri"])
+        results["backtest"] = {"requests": len(scores), "cutoffs": int(scores["cutoff"].nunique()),
+                               "mae": float(scores["mae"].mean()), "wql": wql}
+    elif args.read_forecasts:
+        # Stand in for the transform jobs, then read the last run back as a consumer would
+        runTransformJobs(s3, sagemaker)
+        last = responses[-1]
+        if last["transformJobName"]:
+            waitForTransformJob(sagemaker, last["transformJobName"], initial_delay=0)
+        forecasts = readRunForecasts(s3, last["inputUri"], last["forecastUri"],
+                                     params.S3_SERVING_PREFIX_URI + SERIES_INDEX_FILE)
+        results["forecasts"] = {"series": len(forecasts.series), "horizon": forecasts.horizon,
+                                "quantiles": list(forecasts.quantiles)}
+    logger.info(json.dumps(results, indent=4))
+    if args.export_results:
+        with open(args.export_results, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,62 @@
+"""Scores a backtest run's forecasts against the actuals of each cutoff.
+
+A backtest run:   python score_backtest.py --run-uri s3://<bucket>/backtest/<run id>/ \\
+                      --output scores.csv
+
+Waits for the run's transform job, reads its forecasts and writes one row
+per (cutoff, series) with MAE, RMSE and each quantile's pinball loss. The
+log shows the mean scores per cutoff and the weighted quantile loss.
+"""
+import argparse
+import io
+import json
+import logging
+
+import numpy as np
+
+from utils.backtest import BACKTEST_ACTUALS_FILE, BACKTEST_RUN_FILE, scoreForecasts, weightedQuantileLoss
+from utils.clients import getClient
+from utils.forecasts import SERIES_INDEX_FILE, getJson, readRunForecasts, waitForTransformJob
+from utils.upload import splitS3Uri
+
+logger = logging.getLogger(__name__)
+
+
+def loadActuals(s3, uri):
+    bucket, key = splitS3Uri(uri)
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    with np.load(io.BytesIO(body)) as npz:
+        return npz["actuals"]
+
+
+def scoreRun(s3, sagemaker, run_uri, wait=True, timeout=3600):
+    """(per-request scores, wQL per quantile) of the backtest run at run_uri."""
+    run_uri = run_uri if run_uri.endswith("/") else run_uri + "/"
+    run = getJson(s3, run_uri + BACKTEST_RUN_FILE)
+    if run["transformJobName"] and wait:
+        logger.info("Waiting for %s", run["transformJobName"])
+        waitForTransformJob(sagemaker, run["transformJobName"], timeout=timeout)
+    forecasts = readRunForecasts(s3, run["inputUri"], run["forecastUri"],
+                                 run_uri + SERIES_INDEX_FILE)
+    actuals = loadActuals(s3, run_uri + BACKTEST_ACTUALS_FILE)
+    return scoreForecasts(forecasts, actuals), weightedQuantileLoss(forecasts, actuals)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--run-uri", type=str, required=True)
+    parser.add_argument("--no-wait", action="store_true")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=args.log_level)
+
+    scores, wql = scoreRun(getClient("s3"), getClient("sagemaker"), args.run_uri,
+                           not args.no_wait, args.timeout)
+    metrics = [c for c in scores.columns if c in ("mae", "rmse") or c.startswith("ql_")]
+    logger.info("Mean scores per cutoff:\n%s", scores.groupby("cutoff")[metrics].mean().to_string())
+    logger.info("Weighted quantile loss: %s", json.dumps(wql))
+    if args.output:
+        scores.to_csv(args.output, index=False)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the repository's modules (utils, params) from the root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
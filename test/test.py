@@ -2,29 +2,92 @@ import argparse
 import json
 import logging
 import os
+import sys
 
-import boto3
 from botocore.exceptions import ClientError
 
+# Run as `python test/test.py` from the repository root; make utils importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.loadtest import checkSlo, requestPayloads, runLoadTest, syntheticRecords
+from utils.online import httpInvoker, sagemakerInvoker
+
 logger = logging.getLogger(__name__)
-sm_client = boto3.client("sagemaker")
+sm_client = None
+
+
+def get_sm_client():
+    global sm_client
+    if sm_client is None:
+        import boto3
+
+        sm_client = boto3.client("sagemaker")
+    return sm_client
+
+
+def build_payloads(args):
+    """
+    DeepAR request bodies built from serving records, either an existing
+    serving file or synthetic data run through the preprocessing code.
+    """
+    if args.serving_file:
+        with open(args.serving_file, "r") as f:
+            records = [line for line in f if line.strip()]
+    else:
+        records = syntheticRecords(days=args.context_days)
+    return requestPayloads(
+        records,
+        instances_per_request=args.instances_per_request,
+        context_length=args.context_days * 24,
+        prediction_length=args.prediction_length,
+    )
 
 
-def invoke_endpoint(endpoint_name):
+def slo_thresholds(args):
+    return {
+        "p50_ms": args.slo_p50_ms,
+        "p95_ms": args.slo_p95_ms,
+        "p99_ms": args.slo_p99_ms,
+        "error_rate": args.slo_error_rate,
+        "throughput_rps": args.slo_min_throughput,
+    }
+
+
+def invoke_endpoint(endpoint_name, args, invoke=None):
     """
-    Add custom logic here to invoke the endpoint and validate reponse
+    Drive the endpoint at the configured concurrency and rate, and check the
+    latency, throughput and error rate against the SLO thresholds.
     """
-    return {"endpoint_name": endpoint_name, "success": True}
+    if invoke is None:
+        import boto3
+
+        invoke = sagemakerInvoker(boto3.client("sagemaker-runtime"), endpoint_name)
+    payloads = build_payloads(args)
+    logger.info(f"Sending {args.requests} requests ({len(payloads)} distinct payloads) "
+                f"at concurrency {args.concurrency}, rate {args.rate or 'unbounded'}")
+    summary = runLoadTest(invoke, payloads, args.requests,
+                          concurrency=args.concurrency, rate=args.rate)
+    slo = slo_thresholds(args)
+    violations = checkSlo(summary, slo)
+    for violation in violations:
+        logger.error(f"SLO violation: {violation}")
+    return {
+        "endpoint_name": endpoint_name,
+        "success": not violations,
+        "load_test": summary,
+        "slo": {k: v for k, v in slo.items() if v is not None},
+        "violations": violations,
+    }
 
 
-def test_endpoint(endpoint_name):
+def test_endpoint(endpoint_name, args):
     """
     Describe the endpoint and ensure InSerivce, then invoke endpoint.  Raises exception on error.
     """
     error_message = None
     try:
         # Ensure endpoint is in service
-        response = sm_client.describe_endpoint(EndpointName=endpoint_name)
+        response = get_sm_client().describe_endpoint(EndpointName=endpoint_name)
         status = response["EndpointStatus"]
         if status != "InService":
             error_message = f"SageMaker endpoint: {endpoint_name} status: {status} not InService"
@@ -33,23 +96,59 @@ def test_endpoint(endpoint_name):
 
         # Output if endpoint has data capture enbaled
         endpoint_config_name = response["EndpointConfigName"]
-        response = sm_client.describe_endpoint_config(EndpointConfigName=endpoint_config_name)
+        response = get_sm_client().describe_endpoint_config(EndpointConfigName=endpoint_config_name)
         if "DataCaptureConfig" in response and response["DataCaptureConfig"]["EnableCapture"]:
             logger.info(f"data capture enabled for endpoint config {endpoint_config_name}")
 
         # Call endpoint to handle
-        return invoke_endpoint(endpoint_name)
+        return invoke_endpoint(endpoint_name, args)
     except ClientError as e:
         error_message = e.response["Error"]["Message"]
         logger.error(error_message)
         raise Exception(error_message)
 
 
+def test_local_endpoint(endpoint_name, args):
+    """
+    Run the load test against a local DeepAR stand-in instead of SageMaker.
+    """
+    from utils.local import DeepARStandIn
+
+    stand_in = DeepARStandIn(
+        prediction_length=args.prediction_length,
+        latency_ms=args.local_latency_ms,
+        jitter_ms=args.local_jitter_ms,
+        error_rate=args.local_error_rate,
+    )
+    with stand_in:
+        logger.info(f"Local DeepAR stand-in listening on {stand_in.url}")
+        return invoke_endpoint(endpoint_name, args, invoke=httpInvoker(stand_in.url))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--log-level", type=str, default=os.environ.get("LOGLEVEL", "INFO").upper())
     parser.add_argument("--import-build-config", type=str, required=True)
     parser.add_argument("--export-test-results", type=str, required=True)
+    # Load shape
+    parser.add_argument("--requests", type=int, default=int(os.environ.get("LOAD_TEST_REQUESTS", 200)))
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("LOAD_TEST_CONCURRENCY", 4)))
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second; unbounded when omitted")
+    parser.add_argument("--instances-per-request", type=int, default=1)
+    parser.add_argument("--context-days", type=int, default=14)
+    parser.add_argument("--prediction-length", type=int, default=24)
+    parser.add_argument("--serving-file", type=str, default=None, help="Serving JSON Lines file to build payloads from")
+    # SLO thresholds; unset thresholds are not checked
+    parser.add_argument("--slo-p50-ms", type=float, default=None)
+    parser.add_argument("--slo-p95-ms", type=float, default=None)
+    parser.add_argument("--slo-p99-ms", type=float, default=float(os.environ.get("SLO_P99_MS", 2000)))
+    parser.add_argument("--slo-error-rate", type=float, default=float(os.environ.get("SLO_ERROR_RATE", 0.01)))
+    parser.add_argument("--slo-min-throughput", type=float, default=None)
+    # Offline run against the local stand-in
+    parser.add_argument("--local", action="store_true", help="Test a local DeepAR stand-in instead of the endpoint")
+    parser.add_argument("--local-latency-ms", type=float, default=20.0)
+    parser.add_argument("--local-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--local-error-rate", type=float, default=0.0)
     args, _ = parser.parse_known_args()
 
     # Configure logging to output the line number and message
@@ -64,9 +163,17 @@ if __name__ == "__main__":
     endpoint_name = "{}-{}".format(
         config["Parameters"]["SageMakerProjectName"], config["Parameters"]["StageName"]
     )
-    results = test_endpoint(endpoint_name)
+    if args.local:
+        results = test_local_endpoint(endpoint_name, args)
+    else:
+        results = test_endpoint(endpoint_name, args)
 
     # Print results and write to file
-    logger.debug(json.dumps(results, indent=4))
+    logger.info(json.dumps(results["load_test"], indent=4))
     with open(args.export_test_results, "w") as f:
         json.dump(results, f, indent=4)
+
+    # Fail the build when the endpoint misses its SLOs
+    if not results["success"]:
+        raise SystemExit("Endpoint {} failed {} SLO check(s)".format(
+            endpoint_name, len(results["violations"])))
@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.align import alignSources, fillGaps, gridExtent, sourceArrays
+
+nan = np.nan
+
+
+def column(*values):
+    return np.array(values, dtype=np.float64)[:, None]
+
+
+def source(hours, values, names=("x",)):
+    return (np.array(hours, dtype=np.int64),
+            np.asarray(values, dtype=np.float64).reshape(len(hours), len(names)), list(names))
+
+
+def test_fill_nan_leaves_gaps():
+    values = column(1, nan, 3)
+    np.testing.assert_array_equal(fillGaps(values.copy(), "nan"), values)
+
+
+def test_ffill_repeats_the_last_value_including_trailing_gaps():
+    filled = fillGaps(column(nan, 1, nan, nan, 4, nan), "ffill")
+    np.testing.assert_array_equal(filled[:, 0], [nan, 1, 1, 1, 4, 4])
+
+
+def test_interpolate_draws_a_line_and_keeps_edges():
+    filled = fillGaps(column(nan, 0, nan, nan, 3, nan), "interpolate")
+    np.testing.assert_allclose(filled[:, 0], [nan, 0, 1, 2, 3, nan])
+
+
+def test_max_gap_leaves_long_runs_entirely():
+    values = column(0, nan, 2, nan, nan, nan, 6)
+    filled = fillGaps(values, "interpolate", max_gap=2)
+    np.testing.assert_allclose(filled[:, 0], [0, 1, 2, nan, nan, nan, 6])
+
+
+def test_columns_are_filled_independently_in_place():
+    values = np.array([[1, nan], [nan, 5], [3, nan]], dtype=np.float32)
+    out = fillGaps(values, "ffill")
+    assert out is values
+    np.testing.assert_array_equal(values, [[1, nan], [1, 5], [3, 5]])
+
+
+def test_unknown_fill_method():
+    with pytest.raises(ValueError):
+        fillGaps(column(1.0), "bfill")
+
+
+def test_overlap_and_union_extents():
+    a = source([10, 11, 12, 13], [1, 2, 3, 4], ["a"])
+    b = source([12, 13, 14], [5, 6, 7], ["b"])
+    assert gridExtent([a, b], "overlap") == (12, 13)
+    assert gridExtent([a, b], "union") == (10, 14)
+    assert gridExtent([a, source([], [], ["c"])], "overlap") is None
+    assert gridExtent([a, source([20], [1], ["c"])], "overlap") is None
+
+    aligned = alignSources([a, b], extent="union")
+    assert aligned.start_hour == 10
+    assert aligned.features == ["a", "b"]
+    np.testing.assert_array_equal(aligned.values, [
+        [1, nan], [2, nan], [3, 5], [4, 6], [nan, 7]])
+
+
+def test_missing_hours_stay_on_the_grid():
+    # Hour 12 is missing from b: a join would drop it and shift later values
+    a = source([10, 11, 12, 13], [1, 2, 3, 4], ["a"])
+    b = source([10, 11, 13], [5, 6, 8], ["b"])
+    aligned = alignSources([a, b])
+    np.testing.assert_array_equal(aligned.hours, [10, 11, 12, 13])
+    np.testing.assert_array_equal(aligned.values[:, 1], [5, 6, nan, 8])
+
+    filled = alignSources([a, b], fill="interpolate")
+    np.testing.assert_allclose(filled.values[:, 1], [5, 6, 7, 8])
+
+
+def test_duplicate_hours_keep_the_last_row_and_order_does_not_matter():
+    a = source([12, 10, 11, 10], [3, 1, 2, 9], ["a"])
+    aligned = alignSources([a])
+    assert aligned.start_hour == 10
+    np.testing.assert_array_equal(aligned.values[:, 0], [9, 2, 3])
+
+
+def test_explicit_bounds_drop_rows_outside():
+    a = source([8, 9, 10, 11], [1, 2, 3, 4], ["a"])
+    aligned = alignSources([a], first_hour=9, last_hour=12)
+    np.testing.assert_array_equal(aligned.values[:, 0], [2, 3, 4, nan])
+
+
+def test_empty_overlap_is_an_empty_grid():
+    aligned = alignSources([source([1], [1], ["a"]), source([5], [2], ["b"])])
+    assert aligned.values.shape == (0, 2)
+    assert aligned.records() == []
+    assert aligned.seriesIndex() == []
+    with pytest.raises(ValueError):
+        alignSources([source([1], [1], ["a"])], extent="inner")
+
+
+def test_float32_sources_stay_float32():
+    a = (np.array([0, 1]), np.array([[1], [2]], dtype=np.float32), ["a"])
+    assert alignSources([a]).values.dtype == np.float32
+    b = source([0, 1], [3, 4], ["b"])
+    assert alignSources([a, b]).values.dtype == np.float64
+
+
+def test_frames_align_into_deepar_records():
+    weather = pd.DataFrame({"temperature_value": [1.5, 2.5, 3.5]},
+                           index=pd.Index(["2024-03-01 00:00:00", "2024-03-01 01:00:00",
+                                           "2024-03-01 02:00:00"], name="timestamp"))
+    demand = pd.DataFrame({"value_demand": [10.0, 30.0]},
+                          index=pd.Index(["2024-03-01 00:00:00", "2024-03-01 02:00:00"],
+                                         name="timestamp"))
+    aligned = alignSources([sourceArrays(weather, ["temperature_value"]),
+                            sourceArrays(demand, ["value_demand"])])
+    records = [json.loads(r) for r in aligned.records()]
+    assert [r["start"] for r in records] == ["2024-03-01 00:00:00"] * 2
+    assert records[0]["target"] == [1.5, 2.5, 3.5]
+    assert records[1]["target"] == [10.0, "NaN", 30.0]
+    assert [s["feature"] for s in aligned.seriesIndex()] == ["temperature_value", "value_demand"]
+    assert list(aligned.toFrame().index) == list(weather.index)
@@ -0,0 +1,39 @@
+import pytest
+
+from utils.chunked import MB, MIN_CHUNK_BYTES, chunkBytes, minimumBudgetBytes
+from utils.config import loadRunConfig
+
+WINDOW_HOURS = 180 * 24 + 1
+
+
+def test_chunks_get_what_the_grid_leaves():
+    required = minimumBudgetBytes(WINDOW_HOURS, 3)
+    assert chunkBytes(required, WINDOW_HOURS, 3) == MIN_CHUNK_BYTES
+    assert chunkBytes(required + MB, WINDOW_HOURS, 3) == MIN_CHUNK_BYTES + MB
+    assert minimumBudgetBytes(WINDOW_HOURS, 3, itemsize=8) > required
+
+
+def test_small_budget_names_the_required_figure():
+    with pytest.raises(ValueError, match="at least 9MB"):
+        chunkBytes(4 * MB, WINDOW_HOURS, 3)
+
+
+def config(**overrides):
+    settings = dict({"today": "2024-03-01", "memory_budget_mb": 4, "batch_mode": False,
+                     "incremental_mode": False, "backtest_mode": False, "canary_mode": False,
+                     "day_window": 180}, **overrides)
+    return loadRunConfig({"config": settings})
+
+
+def test_config_rejects_a_budget_too_small_for_the_window():
+    with pytest.raises(ValueError, match="memory_budget_mb must be at least 9 for a 4321 hour window"):
+        config()
+    assert config(memory_budget_mb=9)["memory_budget_mb"] == 9
+    with pytest.raises(ValueError, match="at least 12"):
+        config(memory_budget_mb=9, day_window=730)
+
+
+def test_budget_is_only_checked_when_loading_out_of_core():
+    assert config(memory_budget_mb=0)
+    assert config(batch_mode=True)
+    assert config(incremental_mode=True)
@@ -0,0 +1,158 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from utils.forecasts import (SERIES_INDEX_FILE, iterLines, readRunForecasts,
+                             waitForTransformJob, waitForTransformJobs)
+from utils.local import FakeS3, FakeSageMaker, runTransformJobs
+from utils.transform import createTransformJob, planTransform
+from utils.upload import splitS3Uri
+
+nan = np.nan
+SERVING = "s3://bucket/serving/"
+FORECASTS = "s3://bucket/forecasts/"
+
+
+def put(s3, uri, body):
+    bucket, key = splitS3Uri(uri)
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def putJson(s3, uri, value):
+    put(s3, uri, json.dumps(value).encode("utf-8"))
+
+
+def line(mean, low, high):
+    return json.dumps({"mean": mean, "quantiles": {"0.1": low, "0.9": high}})
+
+
+def series(count, length=3):
+    return [{"start": "2024-03-01 00:00:00", "length": length, "feature": "f{}".format(i)}
+            for i in range(count)]
+
+
+def test_lines_split_across_chunks():
+    body = b'{"a": 1}\n\n{"b": 22}\n{"c": 333}'
+    for size in (1, 2, 5, 64):
+        assert list(iterLines(io.BytesIO(body), size)) == [b'{"a": 1}', b'{"b": 22}', b'{"c": 333}']
+
+
+def test_single_output_file_fixture():
+    s3 = FakeS3()
+    putJson(s3, SERVING + SERIES_INDEX_FILE, series(3))
+    put(s3, FORECASTS + "serving.json.out", "".join(line(*row) + "\n" for row in [
+        ([1, 2], [0, 1], [2, 3]),
+        ([3, 4], [2, 3], [4, 5]),
+        ([5, 6], [4, 5], [6, 7]),
+    ]).encode("utf-8"))
+
+    forecasts = readRunForecasts(s3, SERVING + "serving.json", FORECASTS + "serving.json.out",
+                                 SERVING + SERIES_INDEX_FILE, batch_lines=2)
+    assert forecasts.horizon == 2
+    np.testing.assert_array_equal(forecasts.mean, [[1, 2], [3, 4], [5, 6]])
+    np.testing.assert_array_equal(forecasts.quantiles["0.9"], [[2, 3], [4, 5], [6, 7]])
+    assert forecasts.mean.dtype == np.float32
+
+    frame = forecasts.toFrame()
+    assert len(frame) == 6
+    # The first step is the hour after each series' input ends
+    assert list(frame["timestamp"][:2]) == ["2024-03-01 03:00:00", "2024-03-01 04:00:00"]
+    assert list(frame.columns) == ["series", "step", "timestamp", "mean", "0.1", "0.9"]
+
+
+def test_short_output_file_is_rejected():
+    s3 = FakeS3()
+    putJson(s3, SERVING + SERIES_INDEX_FILE, series(2))
+    put(s3, FORECASTS + "serving.json.out", (line([1], [0], [2]) + "\n").encode("utf-8"))
+    with pytest.raises(ValueError):
+        readRunForecasts(s3, SERVING + "serving.json", FORECASTS + "serving.json.out",
+                         SERVING + SERIES_INDEX_FILE)
+
+
+def test_sharded_output_is_joined_back_in_series_order():
+    s3 = FakeS3()
+    sagemaker = FakeSageMaker()
+    input_uri = SERVING + "shards/run/"
+    index = series(5)
+    # Series 2 has no shard: its rows stay NaN
+    shards = [{"file": "part-00000.json", "series": [1, 4]},
+              {"file": "part-00001.json", "series": [0, 3]}]
+    for shard in shards:
+        put(s3, input_uri + shard["file"], "".join(
+            json.dumps({"start": "2024-03-01 00:00:00", "target": [float(i)] * 3}) + "\n"
+            for i in shard["series"]).encode("utf-8"))
+    putJson(s3, SERVING + "shards/run.manifest.json", {"input_uri": input_uri, "shards": shards})
+    putJson(s3, SERVING + SERIES_INDEX_FILE, index)
+
+    createTransformJob(sagemaker, "job", "model", input_uri, FORECASTS,
+                       plan=planTransform([100] * 4))
+    assert runTransformJobs(s3, sagemaker, prediction_length=2, quantiles=["0.5"]) == 2
+
+    forecasts = readRunForecasts(s3, input_uri, FORECASTS, SERVING + SERIES_INDEX_FILE)
+    np.testing.assert_array_equal(forecasts.mean, [[0, 0], [1, 1], [nan, nan], [3, 3], [4, 4]])
+    np.testing.assert_array_equal(forecasts.quantiles["0.5"][:, 0], [0, 1, nan, 3, 4])
+    assert [s["feature"] for s in forecasts.series] == ["f0", "f1", "f2", "f3", "f4"]
+
+
+class Clock:
+    """Fake monotonic clock advanced by the injected sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+
+def submit(sagemaker, *names):
+    for name in names:
+        createTransformJob(sagemaker, name, "model", SERVING, FORECASTS)
+
+
+def test_wait_backs_off_until_every_job_finishes():
+    sagemaker = FakeSageMaker(polls_until_complete=4)
+    submit(sagemaker, "a", "b")
+    clock = Clock()
+    finished = waitForTransformJobs(sagemaker, ["a", "b", "a"], initial_delay=5, max_delay=20,
+                                    sleep=clock.sleep, clock=clock)
+    assert sorted(finished) == ["a", "b"]
+    assert all(r["TransformJobStatus"] == "Completed" for r in finished.values())
+    assert clock.sleeps == [5, 10, 20, 20]
+
+
+def test_finished_jobs_are_not_described_again():
+    sagemaker = FakeSageMaker(polls_until_complete=2)
+    submit(sagemaker, "slow", "failed")
+    sagemaker.transform_jobs["failed"]["ForcedStatus"] = "Failed"
+    clock = Clock()
+    finished = waitForTransformJobs(sagemaker, ["slow", "failed"], sleep=clock.sleep, clock=clock)
+    assert finished["failed"]["TransformJobStatus"] == "Failed"
+    assert sagemaker._polls == {"slow": 3, "failed": 1}
+
+
+def test_wait_times_out_naming_running_jobs():
+    sagemaker = FakeSageMaker(polls_until_complete=100)
+    submit(sagemaker, "stuck")
+    clock = Clock()
+    with pytest.raises(TimeoutError, match="stuck"):
+        waitForTransformJobs(sagemaker, ["stuck"], timeout=25, initial_delay=10,
+                             sleep=clock.sleep, clock=clock)
+    # The last sleep is cut to the time left before the deadline
+    assert clock.sleeps == [10, 15]
+    assert clock.now == 25
+
+
+def test_wait_for_one_job_raises_when_it_did_not_complete():
+    sagemaker = FakeSageMaker()
+    submit(sagemaker, "ok", "stopped")
+    assert waitForTransformJob(sagemaker, "ok")["TransformJobStatus"] == "Completed"
+    sagemaker.transform_jobs["stopped"]["ForcedStatus"] = "Stopped"
+    with pytest.raises(RuntimeError, match="stopped"):
+        waitForTransformJob(sagemaker, "stopped")
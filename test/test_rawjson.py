@@ -0,0 +1,100 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from utils.rawjson import electricityChunks, iterArray, weatherChunks
+
+CHUNK_SIZES = [1, 3, 7, 64, 65536]
+DATA = ["response", "data"]
+
+
+def items(doc, path, chunk_size, indent=None):
+    return list(iterArray(json.dumps(doc, indent=indent).encode("utf-8"), path, chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("indent", [None, 2])
+def test_records_with_boundary_text_inside_values(chunk_size, indent):
+    # Strings that look like the text between two records, and nested
+    # objects starting with the same key, must not split a record
+    rows = [{"period": 'x}, {"period"' if i % 3 else "a}, {\\\"period\\\"",
+             "nested": {"period": [{"period": i}, {"period": -1.5e3}]},
+             "value": i * 1.25}
+            for i in range(60)]
+    doc = {"meta": {"period": [1, 2]}, "response": {"total": 60, "data": rows}}
+    assert items(doc, DATA, chunk_size, indent) == rows
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_numbers_and_scalars_across_chunk_edges(chunk_size):
+    values = [1, 2.5, -3e5, 1234567890123, 0.000125, "s", None, True, False]
+    assert items({"response": {"data": values}}, DATA, chunk_size) == values
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_nested_arrays_and_unicode(chunk_size):
+    values = [[{"a": 1}, {"a": 2}], [{"a": "é ✓"}], []] * 10
+    text = json.dumps({"response": {"data": values}}, ensure_ascii=False).encode("utf-8")
+    assert list(iterArray(text, DATA, chunk_size)) == values
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64])
+def test_empty_and_missing_arrays(chunk_size):
+    assert items({"response": {"data": []}}, DATA, chunk_size) == []
+    assert items({"response": {}}, DATA, chunk_size) == []
+    assert items({"response": {"total": 0}}, DATA, chunk_size) == []
+    assert items({}, ["features"], chunk_size) == []
+
+
+def test_sources_other_than_bytes():
+    rows = [{"id": str(i)} for i in range(20)]
+    text = json.dumps({"features": rows})
+    assert list(iterArray(text, ["features"], 5)) == rows
+    assert list(iterArray(io.BytesIO(text.encode("utf-8")), ["features"], 5)) == rows
+    chunks = [text[i:i + 4].encode("utf-8") for i in range(0, len(text), 4)]
+    assert list(iterArray(chunks, ["features"])) == rows
+
+
+def test_truncated_document_raises():
+    text = json.dumps({"features": [{"id": "1"}, {"id": "2"}]})[:-10].encode("utf-8")
+    with pytest.raises(ValueError):
+        list(iterArray(text, ["features"], 3))
+
+
+def observation(station, hour, temperature):
+    return {"id": station, "type": "Feature",
+            "properties": {"station": station, "timestamp": "2024-03-01T{:02d}:52:00+00:00".format(hour),
+                           "temperature": {"unitCode": "wmoUnit:degC", "value": temperature}}}
+
+
+def test_weather_chunks_filter_stations_at_any_chunk_size():
+    doc = {"@context": ["x"], "features": [observation("A" if i % 2 else "B", i, i + 0.5)
+                                           for i in range(10)]}
+    text = json.dumps(doc).encode("utf-8")
+    for chunk_size in (1, 7, 65536):
+        frames = list(weatherChunks(text, ["properties_temperature_value"],
+                                    lambda name: name.replace(".", "_"), stations=["A"],
+                                    chunk_rows=3, chunk_size=chunk_size))
+        assert [len(f) for f in frames] == [3, 2]
+        values = np.concatenate([f["properties_temperature_value"] for f in frames])
+        np.testing.assert_array_equal(values, [1.5, 3.5, 5.5, 7.5, 9.5])
+        assert values.dtype == np.float32
+        assert set(frames[0]["station"]) == {"A"}
+
+
+def test_electricity_chunks_name_columns_and_filter():
+    rows = [{"period": "2024-03-01T{:02d}".format(h), "respondent": r, "type-name": t,
+             "value": h * 10, "value-units": "megawatthours"}
+            for h in range(4) for r in ("R1", "R2") for t in ("Demand", "Net generation")]
+    text = json.dumps({"response": {"total": len(rows), "data": rows}}).encode("utf-8")
+    for chunk_size in (3, 65536):
+        frames = list(electricityChunks(text, respondents="R2", columns=["value_demand"],
+                                        chunk_size=chunk_size))
+        assert len(frames) == 1
+        frame = frames[0]
+        assert list(frame["period"]) == ["2024-03-01T{:02d}".format(h) for h in range(4)]
+        assert set(frame["respondent"]) == {"R2"}
+        assert set(frame["column"]) == {"value_demand"}
+        np.testing.assert_array_equal(frame["value"], [0, 10, 20, 30])
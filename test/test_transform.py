@@ -0,0 +1,105 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from utils.local import FakeSageMaker
+from utils.transform import (DEFAULT_PLAN, MAX_PAYLOAD_MB, MB, createTransformJob,
+                             dryRunTransformJob, planTransform, shardRecords,
+                             transformJobRequest, transformRequestProblems)
+
+
+def request(plan=None, **kwargs):
+    return transformJobRequest("job", "model", "s3://bucket/serving/",
+                               "s3://bucket/forecasts/", plan=plan, **kwargs)
+
+
+def test_plan_single_instance_for_few_series():
+    plan = planTransform([1000] * 10, "ml.m5.xlarge", max_instances=4,
+                         series_per_instance=500)
+    assert plan["InstanceCount"] == 1
+    assert plan["ShardCount"] == 1
+    assert plan["MaxConcurrentTransforms"] == 4
+    assert plan["MaxPayloadInMB"] == 1
+    assert plan["RecordCount"] == 10
+    assert plan["TotalBytes"] == 10000
+    assert transformRequestProblems(request(plan)) == []
+
+
+def test_plan_scales_instances_and_shards_with_series():
+    plan = planTransform([1000] * 1200, "ml.m5.xlarge", max_instances=4,
+                         series_per_instance=500, shards_per_instance=2)
+    assert plan["InstanceCount"] == 3
+    assert plan["ShardCount"] == 6
+
+    capped = planTransform([1000] * 10000, max_instances=4, series_per_instance=500)
+    assert capped["InstanceCount"] == 4
+
+
+def test_plan_fits_the_largest_record():
+    plan = planTransform([40 * MB, 1000], "ml.m5.xlarge")
+    assert plan["MaxPayloadInMB"] == 40
+    assert plan["MaxPayloadInMB"] * plan["MaxConcurrentTransforms"] <= MAX_PAYLOAD_MB
+    assert transformRequestProblems(request(plan)) == []
+
+
+def test_plan_rejects_empty_and_oversized_input():
+    with pytest.raises(ValueError):
+        planTransform([])
+    with pytest.raises(ValueError):
+        planTransform([(MAX_PAYLOAD_MB + 1) * MB])
+
+
+def test_shards_are_balanced_and_keep_input_order():
+    sizes = [50, 10, 40, 10, 30, 20, 40]
+    shards = shardRecords(sizes, 3)
+    assert sorted(i for shard in shards for i in shard) == list(range(len(sizes)))
+    assert all(shard == sorted(shard) for shard in shards)
+    loads = [sum(sizes[i] for i in shard) for shard in shards]
+    assert max(loads) - min(loads) <= max(sizes)
+
+
+def test_shard_count_is_capped_by_records():
+    assert shardRecords([5, 5], 4) == [[0], [1]]
+    assert shardRecords([5, 5, 5], 0) == [[0, 1, 2]]
+
+
+def test_request_problems():
+    assert transformRequestProblems(request(DEFAULT_PLAN)) == []
+    bad = dict(DEFAULT_PLAN, MaxPayloadInMB=60, MaxConcurrentTransforms=2,
+               BatchStrategy="MultiRecord", SplitType="None", InstanceCount=0)
+    problems = transformRequestProblems(request(bad))
+    assert len(problems) == 3
+    assert any("MaxConcurrentTransforms" in p for p in problems)
+    assert any("SplitType" in p for p in problems)
+    assert any("InstanceCount" in p for p in problems)
+    assert transformRequestProblems(request(dict(DEFAULT_PLAN, MaxPayloadInMB=101)))
+
+
+def test_planned_job_is_accepted_by_the_stand_in():
+    sagemaker = FakeSageMaker()
+    plan = planTransform([2000] * 1200)
+    createTransformJob(sagemaker, "job", "model", "s3://bucket/shards/",
+                       "s3://bucket/forecasts/", plan=plan, compression="Gzip")
+    submitted = sagemaker.requests[0]
+    assert submitted["TransformResources"]["InstanceCount"] == plan["InstanceCount"]
+    assert submitted["TransformInput"]["CompressionType"] == "Gzip"
+
+    with pytest.raises(ClientError):
+        createTransformJob(sagemaker, "job", "model", "s3://bucket/shards/",
+                           "s3://bucket/forecasts/", plan=plan)
+    with pytest.raises(ClientError):
+        createTransformJob(sagemaker, "other", "model", "s3://bucket/serving/",
+                           "s3://bucket/forecasts/",
+                           plan=dict(plan, MaxPayloadInMB=MAX_PAYLOAD_MB))
+
+
+def test_dry_run_checks_without_submitting():
+    sagemaker = FakeSageMaker()
+    submitted = dryRunTransformJob(sagemaker, "job", "model", "s3://bucket/serving/",
+                                   "s3://bucket/forecasts/", plan=planTransform([1000]))
+    assert submitted["TransformJobName"] == "job"
+    assert sagemaker.requests == []
+    assert sagemaker.calls == ["DescribeModel"]
+    with pytest.raises(ValueError):
+        dryRunTransformJob(sagemaker, "job", "model", "s3://bucket/serving/",
+                           "s3://bucket/forecasts/",
+                           plan=dict(DEFAULT_PLAN, MaxPayloadInMB=MAX_PAYLOAD_MB + 1))
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import io
+
+import pytest
+
+from utils.local import FakeS3
+from utils.upload import CHECKSUM_METADATA, MB, MIN_PART_SIZE, encodeLines, uploadStream
+
+URI = "s3://bucket/serving/serving.json"
+
+
+class PartRecordingS3(FakeS3):
+    """FakeS3 that keeps the size of every uploaded part in order."""
+
+    def __init__(self):
+        super().__init__()
+        self.part_sizes = []
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b"", **kwargs):
+        self.part_sizes.append((PartNumber, len(Body)))
+        return super().upload_part(Bucket, Key, UploadId, PartNumber, Body, **kwargs)
+
+
+def payload(size: int) -> bytes:
+    return (bytes(range(251)) * (size // 251 + 1))[:size]
+
+
+def stored(s3, uri=URI) -> dict:
+    bucket, key = uri[len("s3://"):].split("/", 1)
+    return s3.buckets[bucket][key]
+
+
+def upload(s3, data, **kwargs):
+    options = {"part_size": MIN_PART_SIZE, "multipart_threshold": MIN_PART_SIZE}
+    options.update(kwargs)
+    return uploadStream(s3, URI, data, **options)
+
+
+def test_small_payload_is_one_put_with_its_checksum():
+    s3 = FakeS3()
+    data = b'{"start": "2024-03-01 00:00:00", "target": [1.0]}\n'
+    result = upload(s3, data)
+    assert result == {"uri": URI, "skipped": False, "bytes": len(data), "parts": 1}
+    assert stored(s3)["Body"] == data
+    assert stored(s3)["Metadata"][CHECKSUM_METADATA] == hashlib.sha256(data).hexdigest()
+    assert "CreateMultipartUpload" not in s3.calls
+
+
+def test_payload_at_the_threshold_is_one_put():
+    s3 = FakeS3()
+    data = payload(MIN_PART_SIZE)
+    assert upload(s3, data)["parts"] == 1
+    assert "CreateMultipartUpload" not in s3.calls
+    assert stored(s3)["Body"] == data
+
+
+@pytest.mark.parametrize("size, parts", [
+    (MIN_PART_SIZE + 1, [MIN_PART_SIZE, 1]),
+    (3 * MIN_PART_SIZE - 1, [MIN_PART_SIZE, MIN_PART_SIZE, MIN_PART_SIZE - 1]),
+    # Ends exactly on a part boundary: no empty trailing part
+    (3 * MIN_PART_SIZE, [MIN_PART_SIZE] * 3),
+    (3 * MIN_PART_SIZE + 1, [MIN_PART_SIZE] * 3 + [1]),
+])
+def test_multipart_boundaries(size, parts):
+    s3 = PartRecordingS3()
+    data = payload(size)
+    result = upload(s3, data, max_workers=2)
+    assert [size for _, size in sorted(s3.part_sizes)] == parts
+    assert result["parts"] == len(parts)
+    assert result["bytes"] == size
+    assert stored(s3)["Body"] == data
+    assert s3.multipart_uploads == {}
+
+
+def test_streamed_chunks_and_file_objects():
+    lines = ['{{"target": [{}]}}'.format(", ".join(["1.5"] * 4000))] * 400
+    expected = "".join(line + "\n" for line in lines).encode("utf-8")
+    assert len(expected) > MIN_PART_SIZE
+
+    s3 = FakeS3()
+    upload(s3, encodeLines(lines))
+    assert stored(s3)["Body"] == expected
+
+    s3 = FakeS3()
+    upload(s3, io.BytesIO(expected))
+    assert stored(s3)["Body"] == expected
+
+
+def test_gzip_multipart_decompresses_to_the_payload():
+    s3 = FakeS3()
+    data = payload(3 * MIN_PART_SIZE)
+    upload(s3, data, compress=True, part_size=MIN_PART_SIZE, multipart_threshold=MB)
+    entry = stored(s3)
+    assert entry["ContentEncoding"] == "gzip"
+    assert gzip.decompress(entry["Body"]) == data
+
+
+def test_unchanged_payload_is_skipped():
+    s3 = FakeS3()
+    data = payload(1000)
+    upload(s3, data)
+    puts = s3.calls.count("PutObject")
+    assert upload(s3, data)["skipped"]
+    assert upload(s3, data, checksum=hashlib.sha256(data).hexdigest())["skipped"]
+    assert s3.calls.count("PutObject") == puts
+    assert not upload(s3, data, compress=True)["skipped"]
+    assert upload(s3, b"other", override=False)["skipped"]
+
+
+def test_failed_part_aborts_the_upload():
+    class FailingS3(FakeS3):
+        def upload_part(self, PartNumber, **kwargs):
+            if PartNumber == 2:
+                raise IOError("connection reset")
+            return super().upload_part(PartNumber=PartNumber, **kwargs)
+
+    s3 = FailingS3()
+    with pytest.raises(IOError):
+        upload(s3, payload(3 * MIN_PART_SIZE), max_workers=1)
+    assert "AbortMultipartUpload" in s3.calls
+    assert s3.multipart_uploads == {}
+    assert "serving/serving.json" not in s3.buckets.get("bucket", {})
@@ -0,0 +1,57 @@
+"""Maintains the per-bucket key manifest the loaders use with
+USE_KEY_MANIFEST=1 to select raw CSVs by data time.
+
+Update from a listing:   python update_manifest.py
+Rebuild from scratch:    python update_manifest.py --rebuild
+
+Only new or changed objects (by ETag) are downloaded, and only their
+timestamp column is parsed.
+"""
+import argparse
+import json
+import logging
+
+import params
+from utils.clients import getClient
+from utils.ingest import s3ClientConfig
+from utils.manifest import KeyManifest, loadManifest, saveManifest, updateManifest
+
+logger = logging.getLogger(__name__)
+
+
+def updateSources(s3, sources, prefix=params.RAW_DATA_PREFIX,
+                  manifest_key=params.KEY_MANIFEST_KEY, rebuild=False):
+    """Updates and saves the manifest of each named source; returns the
+    added/changed/removed counts per source."""
+    counts = {}
+    for name in sources:
+        bucket, timestamp_column = params.RAW_DATA_SOURCES[name]
+        if rebuild:
+            manifest = KeyManifest(timestamp_column)
+        else:
+            manifest = loadManifest(s3, bucket, manifest_key, timestamp_column)
+        counts[name] = updateManifest(s3, bucket, prefix, manifest,
+                                      max_workers=params.INGEST_MAX_WORKERS)
+        counts[name]["objects"] = len(manifest)
+        saveManifest(s3, bucket, manifest_key, manifest)
+        logger.info("%s: %s", name, counts[name])
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sources", type=str, default="weather,electricity")
+    parser.add_argument("--prefix", type=str, default=params.RAW_DATA_PREFIX)
+    parser.add_argument("--manifest-key", type=str, default=params.KEY_MANIFEST_KEY)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=args.log_level)
+
+    s3 = getClient("s3", config=s3ClientConfig(params.INGEST_MAX_WORKERS))
+    counts = updateSources(
+        s3, [s.strip() for s in args.sources.split(",") if s.strip()],
+        prefix=args.prefix, manifest_key=args.manifest_key,
+        rebuild=args.rebuild)
+    logger.info(json.dumps(counts, indent=4))
@@ -0,0 +1,159 @@
+"""Hourly alignment of any number of sources on integer epoch hours.
+
+Each source is a pair of arrays: epoch hours and a (rows, features) block
+of values. Sources are deduplicated (last write wins) and scattered onto
+one explicit, contiguous hourly grid, so an hour missing from one source
+stays on the grid as a gap instead of being dropped by a join and
+shifting every later value on DeepAR's implicit time axis. Gaps are then
+left as NaN, forward-filled or linearly interpolated, up to a maximum gap
+length.
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.serialization import deepARRecord, floatDtype
+from utils.timestamps import epochHours, formatTimestamps, hoursToTimestamps
+
+FILL_METHODS = ("nan", "ffill", "interpolate")
+GRID_EXTENTS = ("overlap", "union")
+
+
+class AlignedHours(NamedTuple):
+    """Feature values on the hourly grid start_hour .. start_hour + len - 1."""
+    start_hour: int
+    features: List[str]
+    values: np.ndarray
+
+    @property
+    def hours(self) -> np.ndarray:
+        return self.start_hour + np.arange(len(self.values), dtype=np.int64)
+
+    def toFrame(self) -> pd.DataFrame:
+        """The grid as a frame indexed by '%Y-%m-%d %H:%M:%S' strings."""
+        index = pd.Index(formatTimestamps(hoursToTimestamps(self.hours)),
+                         name="timestamp")
+        return pd.DataFrame(self.values, index=index, columns=self.features)
+
+    def seriesIndex(self) -> List[Dict]:
+        return seriesIndex(self.features, self.start_hour, len(self.values))
+
+    def records(self) -> List[str]:
+        """One DeepAR record per feature; remaining gaps are written as "NaN"."""
+        if not len(self.values):
+            return []
+        start = formatTimestamps(hoursToTimestamps([self.start_hour]))[0]
+        return [deepARRecord(start, self.values[:, i])
+                for i in range(len(self.features))]
+
+
+def seriesIndex(features: Sequence[str], start_hour: Optional[int],
+                length: int) -> List[Dict]:
+    """Describes the one-series-per-feature records of a grid, in order."""
+    if start_hour is None or not length:
+        return []
+    start = formatTimestamps(hoursToTimestamps([start_hour]))[0]
+    return [{"series": i, "feature": feature, "start": start, "length": int(length)}
+            for i, feature in enumerate(features)]
+
+
+def sourceArrays(df: pd.DataFrame, features: Sequence[str]
+                 ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """(epoch hours, values, features) of a timestamp-indexed frame."""
+    features = list(features)
+    values = df[features].to_numpy(dtype=floatDtype(df[features].dtypes))
+    return epochHours(df.index), values, features
+
+
+def lastWrites(hours: np.ndarray) -> np.ndarray:
+    """Row positions sorted by hour, keeping the last row of each hour."""
+    order = np.argsort(hours, kind="stable")
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = hours[order][1:] != hours[order][:-1]
+    return order[keep]
+
+
+def gridExtent(sources: Sequence[Tuple[np.ndarray, np.ndarray, List[str]]],
+               extent: str = "overlap") -> Optional[Tuple[int, int]]:
+    """First and last hour of the grid: the hours every source spans
+    ("overlap") or any source spans ("union"). None when empty."""
+    spans = [(int(h.min()), int(h.max())) for h, _, _ in sources if len(h)]
+    if not spans or (extent == "overlap" and len(spans) < len(sources)):
+        return None
+    if extent == "overlap":
+        first, last = max(s[0] for s in spans), min(s[1] for s in spans)
+    else:
+        first, last = min(s[0] for s in spans), max(s[1] for s in spans)
+    return (first, last) if first <= last else None
+
+
+def fillGaps(values: np.ndarray, method: str = "nan",
+             max_gap: Optional[int] = None) -> np.ndarray:
+    """Fills NaN runs along axis 0, each column independently.
+
+    "ffill" repeats the last value before a gap (trailing gaps included);
+    "interpolate" draws a line between the values around it (leading and
+    trailing gaps stay NaN). Runs longer than max_gap hours are left as
+    NaN entirely. Returns values, filled in place."""
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown gap fill method: {method}")
+    if method == "nan" or not len(values):
+        return values
+    n = len(values)
+    rows = np.arange(n)[:, None]
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    # Last valid row at or before, and first valid row at or after, each row
+    before = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    after = np.minimum.accumulate(np.where(missing, n, rows)[::-1], axis=0)[::-1]
+    fill = missing & (before >= 0)
+    if method == "interpolate":
+        fill &= after < n
+    if max_gap is not None:
+        fill &= (after - before - 1) <= max_gap
+    cols = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    b, c = before[fill], cols[fill]
+    if method == "ffill":
+        values[fill] = values[b, c]
+    else:
+        a = after[fill]
+        weight = (rows.repeat(values.shape[1], axis=1)[fill] - b) / (a - b)
+        values[fill] = values[b, c] + (values[a, c] - values[b, c]) * weight
+    return values
+
+
+def alignSources(sources: Sequence[Tuple[np.ndarray, np.ndarray, Sequence[str]]],
+                 extent: str = "overlap", fill: str = "nan",
+                 max_gap: Optional[int] = None,
+                 first_hour: Optional[int] = None,
+                 last_hour: Optional[int] = None) -> AlignedHours:
+    """Aligns every source onto one contiguous hourly grid.
+
+    The grid spans [first_hour, last_hour] when given, else the extent of
+    the sources. Within each source, duplicate hours keep the last row;
+    rows outside the grid are dropped. Features keep the source order.
+    Values are float32 when every source is float32."""
+    if extent not in GRID_EXTENTS:
+        raise ValueError(f"Unknown grid extent: {extent}")
+    features = [f for _, _, names in sources for f in names]
+    dtype = floatDtype([v.dtype for _, v, _ in sources])
+    span = gridExtent(sources, extent)
+    if first_hour is None or last_hour is None:
+        if span is None:
+            return AlignedHours(0, features, np.empty((0, len(features)), dtype=dtype))
+        first_hour = span[0] if first_hour is None else first_hour
+        last_hour = span[1] if last_hour is None else last_hour
+    length = max(0, int(last_hour) - int(first_hour) + 1)
+
+    values = np.full((length, len(features)), np.nan, dtype=dtype)
+    column = 0
+    for hours, block, names in sources:
+        hours = np.asarray(hours, dtype=np.int64)
+        rows = lastWrites(hours)
+        pos = hours[rows] - first_hour
+        inside = (pos >= 0) & (pos < length)
+        values[pos[inside], column:column + len(names)] = block[rows[inside]]
+        column += len(names)
+    return AlignedHours(int(first_hour), features, fillGaps(values, fill, max_gap))
@@ -0,0 +1,201 @@
+"""Backtest requests for many rolling cutoffs from one load of history.
+
+A cutoff is the first forecast hour of a request: DeepAR gets the
+context_length hours before it and its forecast is scored against the
+prediction_length hours from it. Cutoffs are evenly spaced and shared by
+every series, the latest leaving prediction_length hours of actuals before
+the end of the data. Each grid's context windows and actuals are taken as
+strided views (sliding_window_view sliced by the cutoff step), so nothing
+is copied per cutoff; values are only read when a record is serialized.
+"""
+import io
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.align import AlignedHours
+from utils.batch import AlignedGroups, GroupIds, featureIds
+from utils.serialization import deepARRecord
+from utils.timestamps import formatTimestamps, hoursToTimestamps
+
+# Files written next to a backtest run's serving input
+BACKTEST_ACTUALS_FILE = "actuals.npz"
+BACKTEST_RUN_FILE = "backtest.json"
+
+
+class BacktestPanel(NamedTuple):
+    """Cutoffs over one (hours, series) grid starting at start_hour.
+
+    Cutoff k is grid row rows[k]. series describes each column (feature,
+    and group and cat in batch mode)."""
+    start_hour: int
+    series: List[Dict]
+    values: np.ndarray
+    rows: range
+    context_length: int
+    prediction_length: int
+
+    def cutoffHours(self) -> np.ndarray:
+        return self.start_hour + np.asarray(self.rows, dtype=np.int64)
+
+    def _windows(self, length: int, offset: int) -> np.ndarray:
+        """(cutoffs, series, length) view of the rows from each cutoff row plus offset."""
+        if not len(self.rows):
+            return np.empty((0, len(self.series), length), dtype=self.values.dtype)
+        windows = sliding_window_view(self.values, length, axis=0)
+        first = self.rows.start + offset
+        return windows[first:first + len(self.rows) * self.rows.step:self.rows.step]
+
+    def contexts(self) -> np.ndarray:
+        """(cutoffs, series, context_length) view of each request's input."""
+        return self._windows(self.context_length, -self.context_length)
+
+    def actuals(self) -> np.ndarray:
+        """(cutoffs, series, prediction_length) view of each request's actuals."""
+        return self._windows(self.prediction_length, 0)
+
+    def records(self) -> Iterator[str]:
+        """One DeepAR record per (cutoff, series), cutoff-major."""
+        if not len(self.rows):
+            return
+        contexts = self.contexts()
+        starts = formatTimestamps(hoursToTimestamps(self.cutoffHours() - self.context_length))
+        for k, start in enumerate(starts):
+            for s, spec in enumerate(self.series):
+                yield deepARRecord(start, contexts[k, s], cat=spec.get("cat"))
+
+    def index(self) -> Iterator[Dict]:
+        if not len(self.rows):
+            return
+        hours = self.cutoffHours()
+        cutoffs = formatTimestamps(hoursToTimestamps(hours))
+        starts = formatTimestamps(hoursToTimestamps(hours - self.context_length))
+        for cutoff, start in zip(cutoffs, starts):
+            for spec in self.series:
+                yield dict(spec, cutoff=cutoff, start=start, length=self.context_length)
+
+
+class Backtest(NamedTuple):
+    """Every panel's requests, written and read back in panel order."""
+    panels: List[BacktestPanel]
+
+    def records(self) -> List[str]:
+        return [r for panel in self.panels for r in panel.records()]
+
+    def index(self) -> List[Dict]:
+        """Series index of the requests, each with its cutoff timestamp."""
+        entries = (e for panel in self.panels for e in panel.index())
+        return [dict(series=i, **e) for i, e in enumerate(entries)]
+
+    def actuals(self) -> np.ndarray:
+        """(requests, prediction_length) actuals in request order."""
+        blocks = [p.actuals().reshape(-1, p.prediction_length) for p in self.panels]
+        if not blocks:
+            return np.empty((0, 0))
+        return np.concatenate(blocks)
+
+    def cutoffHours(self) -> np.ndarray:
+        """Cutoff hour of each request."""
+        hours = [np.repeat(p.cutoffHours(), len(p.series)) for p in self.panels]
+        return np.concatenate(hours) if hours else np.empty(0, dtype=np.int64)
+
+    def actualsNpz(self) -> bytes:
+        buf = io.BytesIO()
+        np.savez_compressed(buf, actuals=self.actuals(), cutoff_hours=self.cutoffHours())
+        return buf.getvalue()
+
+
+def backtestCutoffs(end_hour: int, count: int, stride: int,
+                    prediction_length: int) -> np.ndarray:
+    """count cutoff hours, stride hours apart, the latest leaving
+    prediction_length hours up to end_hour."""
+    last = int(end_hour) - prediction_length + 1
+    return last - stride * np.arange(count - 1, -1, -1, dtype=np.int64)
+
+
+def panelRows(start_hour: int, length: int, cutoffs: np.ndarray,
+              context_length: int, prediction_length: int) -> range:
+    """Grid rows of the cutoffs with a full context and full actuals."""
+    pos = cutoffs - start_hour
+    pos = pos[(pos >= context_length) & (pos + prediction_length <= length)]
+    if not len(pos):
+        return range(0)
+    step = int(cutoffs[1] - cutoffs[0]) if len(cutoffs) > 1 else 1
+    return range(int(pos[0]), int(pos[-1]) + 1, step)
+
+
+def _panel(start_hour, series, values, cutoffs, context_length, prediction_length):
+    rows = panelRows(start_hour, len(values), cutoffs, context_length, prediction_length)
+    return BacktestPanel(int(start_hour), series, values, rows,
+                         context_length, prediction_length)
+
+
+def gridBacktest(aligned: AlignedHours, cutoffs: int, stride: int,
+                 context_length: int, prediction_length: int) -> Backtest:
+    """Backtest over the grid of every feature (one series per feature)."""
+    if not len(aligned.values):
+        return Backtest([])
+    hours = backtestCutoffs(aligned.start_hour + len(aligned.values) - 1, cutoffs,
+                            stride, prediction_length)
+    series = [{"feature": f} for f in aligned.features]
+    return Backtest([_panel(aligned.start_hour, series, aligned.values, hours,
+                            context_length, prediction_length)])
+
+
+def groupBacktest(sources: Sequence[Tuple[str, AlignedGroups]], cutoffs: int,
+                  stride: int, context_length: int, prediction_length: int,
+                  group_ids: Optional[GroupIds] = None) -> Backtest:
+    """Backtest over every group's grid, with cat numbered as batchRecords
+    numbers it from group_ids. Cutoffs are counted back from the latest hour
+    of any group."""
+    ends = [int((a.start + a.lengths).max()) - 1 for _, a in sources if len(a.names)]
+    if not ends:
+        return Backtest([])
+    hours = backtestCutoffs(max(ends), cutoffs, stride, prediction_length)
+    group_ids = GroupIds() if group_ids is None else group_ids
+    feature_ids = featureIds(sources)
+    panels = []
+    for source, aligned in sources:
+        for g, name in enumerate(aligned.names):
+            group_id = group_ids.id(source, name)
+            series = [{"source": source, "group": name, "feature": feature,
+                       "cat": [group_id, feature_ids[feature]]}
+                      for feature in aligned.features]
+            panels.append(_panel(aligned.start[g], series, aligned.group(g), hours,
+                                 context_length, prediction_length))
+    return Backtest(panels)
+
+
+def pinballLoss(actuals: np.ndarray, forecast: np.ndarray, q: float) -> np.ndarray:
+    diff = actuals - forecast
+    return np.maximum(q * diff, (q - 1) * diff)
+
+
+def scoreForecasts(forecasts, actuals: np.ndarray) -> pd.DataFrame:
+    """Scores a Forecasts (see utils/forecasts.py) against actuals, both in
+    request order. One row per request with its series index entry, the
+    mean's MAE and RMSE and each quantile's mean pinball loss. Steps beyond
+    either horizon and NaN actuals are ignored."""
+    horizon = min(forecasts.horizon, actuals.shape[1])
+    y = actuals[:, :horizon].astype(np.float64)
+    observed = (~np.isnan(y)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        error = forecasts.mean[:, :horizon] - y
+        scores = pd.DataFrame(forecasts.series)
+        scores["mae"] = np.nansum(np.abs(error), axis=1) / observed
+        scores["rmse"] = np.sqrt(np.nansum(error ** 2, axis=1) / observed)
+        for q, values in forecasts.quantiles.items():
+            loss = pinballLoss(y, values[:, :horizon], float(q))
+            scores["ql_" + q] = np.nansum(loss, axis=1) / observed
+    return scores
+
+
+def weightedQuantileLoss(forecasts, actuals: np.ndarray) -> Dict[str, float]:
+    """wQL of each quantile over every request: 2 * sum(pinball) / sum(|y|)."""
+    horizon = min(forecasts.horizon, actuals.shape[1])
+    y = actuals[:, :horizon].astype(np.float64)
+    scale = np.nansum(np.abs(y))
+    return {q: float(2 * np.nansum(pinballLoss(y, values[:, :horizon], float(q))) / scale)
+            for q, values in forecasts.quantiles.items()}
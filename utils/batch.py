@@ -0,0 +1,164 @@
+import json
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from utils.align import fillGaps, lastWrites
+from utils.serialization import deepARRecord, floatDtype
+from utils.timestamps import epochHours, formatTimestamps, hoursToTimestamps
+from utils.upload import splitS3Uri
+
+GROUP_IDS_VERSION = 1
+
+
+class AlignedGroups(NamedTuple):
+    """Every group of a long frame laid out on its own hourly grid.
+
+    Group g covers epoch hours start[g] .. start[g] + lengths[g] - 1 and its
+    rows are values[offsets[g]:offsets[g] + lengths[g]]; missing hours are
+    NaN."""
+    names: List[str]
+    features: List[str]
+    start: np.ndarray
+    lengths: np.ndarray
+    offsets: np.ndarray
+    values: np.ndarray
+
+    def group(self, g: int) -> np.ndarray:
+        return self.values[self.offsets[g]:self.offsets[g] + self.lengths[g]]
+
+
+def alignGroups(df: pd.DataFrame, group_column: str, features: Sequence[str],
+                groups: Optional[Sequence[str]] = None, fill: str = "nan",
+                max_gap: Optional[int] = None) -> AlignedGroups:
+    """Aligns every group (station, respondent, ...) of a timestamp-indexed
+    frame to a contiguous hourly grid in a single vectorized pass.
+
+    Duplicate hours within a group keep the last row. groups, when given,
+    restricts the output to those group names. Gaps inside each group are
+    filled as fillGaps does, never across groups."""
+    if groups:
+        df = df[df[group_column].isin(groups)]
+    features = list(features)
+    hours = epochHours(df.index)
+    codes, names = pd.factorize(df[group_column], sort=True)
+    n_groups = len(names)
+
+    start = np.full(n_groups, np.iinfo(np.int64).max, dtype=np.int64)
+    end = np.full(n_groups, np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(start, codes, hours)
+    np.maximum.at(end, codes, hours)
+    lengths = end - start + 1 if n_groups else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+    # Flat position of every row; keep the last row written to each position
+    pos = offsets[codes] + hours - start[codes]
+    rows = lastWrites(pos)
+
+    data = df[features].to_numpy(dtype=floatDtype(df[features].dtypes))
+    values = np.full((int(lengths.sum()), len(features)), np.nan, dtype=data.dtype)
+    values[pos[rows]] = data[rows]
+    if fill != "nan":
+        for g in range(n_groups):
+            fillGaps(values[offsets[g]:offsets[g] + lengths[g]], fill, max_gap)
+    return AlignedGroups(list(map(str, names)), features, start, lengths,
+                         offsets, values)
+
+
+class GroupIds:
+    """Categorical ids of (source, group) pairs.
+
+    An id is handed out the first time a group is seen and is never reused
+    or renumbered, so a station or respondent keeps its id (and the
+    embedding learned for it) in runs where other groups have no rows."""
+
+    def __init__(self, groups: Optional[Iterable[Sequence[str]]] = None):
+        self.groups: List[Tuple[str, str]] = []
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self.changed = False
+        for source, name in groups or []:
+            self.id(source, name)
+        self.changed = False
+
+    def id(self, source: str, name: str) -> int:
+        key = (source, str(name))
+        if key not in self._ids:
+            self._ids[key] = len(self.groups)
+            self.groups.append(key)
+            self.changed = True
+        return self._ids[key]
+
+    def extend(self, source: str, names: Iterable[str]):
+        """Reserves ids for names in order, e.g. the configured stations."""
+        for name in names:
+            self.id(source, name)
+
+    def dumps(self) -> bytes:
+        return json.dumps({"version": GROUP_IDS_VERSION,
+                           "groups": [list(g) for g in self.groups]}).encode("utf-8")
+
+    @classmethod
+    def loads(cls, payload: bytes) -> "GroupIds":
+        data = json.loads(payload)
+        if data.get("version") != GROUP_IDS_VERSION:
+            raise ValueError("Unsupported group ids version")
+        return cls(data["groups"])
+
+
+def loadGroupIds(s3, uri: str) -> GroupIds:
+    """Loads the group ids, or returns an empty map when none exist."""
+    bucket, key = splitS3Uri(uri)
+    try:
+        payload = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return GroupIds()
+    return GroupIds.loads(payload)
+
+
+def saveGroupIds(s3, uri: str, group_ids: GroupIds):
+    bucket, key = splitS3Uri(uri)
+    s3.put_object(Bucket=bucket, Key=key, Body=group_ids.dumps())
+    group_ids.changed = False
+
+
+def featureIds(sources: Sequence[Tuple[str, AlignedGroups]]) -> Dict[str, int]:
+    """Feature ids in configured feature order, whether or not a source has
+    any groups in the run."""
+    ids: Dict[str, int] = {}
+    for _, aligned in sources:
+        for feature in aligned.features:
+            ids.setdefault(feature, len(ids))
+    return ids
+
+
+def batchRecords(sources: Sequence[Tuple[str, AlignedGroups]],
+                 group_ids: Optional[GroupIds] = None
+                 ) -> Tuple[List[str], List[Dict]]:
+    """Builds one DeepAR record per (group, feature) across all sources.
+
+    Each record carries cat = [group id, feature id], so one model can
+    serve every station and respondent. Group ids come from group_ids
+    (extended with groups seen for the first time; a fresh map when None).
+    Returns the records and an index describing each series in order."""
+    group_ids = GroupIds() if group_ids is None else group_ids
+    feature_ids = featureIds(sources)
+    records, index = [], []
+    for source, aligned in sources:
+        starts = formatTimestamps(hoursToTimestamps(aligned.start))
+        for g, name in enumerate(aligned.names):
+            group_id = group_ids.id(source, name)
+            block = aligned.group(g)
+            for f, feature in enumerate(aligned.features):
+                cat = [group_id, feature_ids[feature]]
+                records.append(deepARRecord(starts[g], block[:, f], cat=cat))
+                index.append({
+                    "series": len(index), "source": source, "group": name,
+                    "feature": feature, "cat": cat, "start": starts[g],
+                    "length": int(aligned.lengths[g]),
+                })
+    return records, index
+
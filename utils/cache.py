@@ -0,0 +1,207 @@
+import hashlib
+import io
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+# Bump when the parsed frame layout changes so stale entries are ignored.
+CACHE_VERSION = "2"
+DEFAULT_CACHE_DIR = "/tmp/frame_cache"
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cacheKey(bucket: str, key: str, etag: str, variant: str = "") -> str:
+    """Hashes the source object identity into a cache file name."""
+    ident = "\0".join([CACHE_VERSION, pd.__version__, bucket, key, etag.strip('"'), variant])
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+def dumpFrame(df: pd.DataFrame) -> bytes:
+    """Serializes a parsed frame for the local tier (fast, but only loaded
+    from files this container wrote)."""
+    return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loadFrame(payload: bytes) -> pd.DataFrame:
+    """Restores a frame written by dumpFrame."""
+    return pickle.loads(payload)
+
+
+def dumpSharedFrame(df: pd.DataFrame) -> bytes:
+    """Serializes a parsed frame as Parquet for the shared S3 tier; reading
+    it back runs no code, whoever wrote it."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine="pyarrow")
+    return buf.getvalue()
+
+
+def loadSharedFrame(payload: bytes) -> pd.DataFrame:
+    """Restores a frame written by dumpSharedFrame."""
+    return pd.read_parquet(io.BytesIO(payload), engine="pyarrow")
+
+
+class FrameCache:
+    """ETag-keyed cache of parsed CSV partitions.
+
+    Frames live as files in a local directory (kept across warm Lambda
+    invocations) bounded by max_bytes with least-recently-used eviction.
+    When s3 and s3_uri are given, entries are also written to and read from
+    an S3 prefix (as Parquet) so cold containers can skip re-parsing. An
+    entry that cannot be read or deserialized is dropped and counts as a
+    miss; the cache never fails a load.
+    """
+
+    def __init__(self, local_dir: str = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 s3=None, s3_uri: Optional[str] = None):
+        self.local_dir = local_dir
+        self.max_bytes = max_bytes
+        self.s3 = s3
+        self.s3_bucket, self.s3_prefix = None, None
+        if s3_uri:
+            assert s3_uri.startswith("s3://")
+            split = s3_uri.split("/")
+            self.s3_bucket = split[2]
+            self.s3_prefix = "/".join(split[3:])
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._size = 0
+        os.makedirs(local_dir, exist_ok=True)
+        self._loadIndex()
+
+    def _loadIndex(self):
+        entries = []
+        for name in os.listdir(self.local_dir):
+            path = os.path.join(self.local_dir, name)
+            if os.path.isfile(path) and not name.endswith(".tmp"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.local_dir, name)
+
+    def _s3Key(self, name: str) -> str:
+        return self.s3_prefix + name + ".parquet"
+
+    def _touch(self, name: str):
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+
+    def _store(self, name: str, payload: bytes):
+        # One temp file per writer, so threads storing the same entry never share it
+        tmp = "{}.{}.{}.tmp".format(self._path(name), os.getpid(), threading.get_ident())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, self._path(name))
+        except OSError as e:
+            # A full or read-only disk only costs the cached copy
+            print(f"could not store cache entry {name}: {e!r}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._size -= self._index.pop(name, 0)
+            self._index[name] = len(payload)
+            self._size += len(payload)
+            self._evict()
+
+    def _drop(self, name: str):
+        with self._lock:
+            self._size -= self._index.pop(name, 0)
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    def get(self, bucket: str, key: str, etag: str,
+            variant: str = "") -> Optional[pd.DataFrame]:
+        """Returns the cached frame for an object version, or None."""
+        name = cacheKey(bucket, key, etag, variant)
+        df = self._getLocal(name)
+        if df is None:
+            df = self._getRemote(name)
+            if df is not None:
+                self._store(name, dumpFrame(df))
+        with self._lock:
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return df
+
+    def _getLocal(self, name: str) -> Optional[pd.DataFrame]:
+        try:
+            with open(self._path(name), "rb") as f:
+                payload = f.read()
+        except OSError:
+            return None
+        try:
+            df = loadFrame(payload)
+        except Exception as e:
+            print(f"dropping unreadable cache entry {name}: {e!r}")
+            self._drop(name)
+            return None
+        self._touch(name)
+        return df
+
+    def put(self, bucket: str, key: str, etag: str, df: pd.DataFrame,
+            variant: str = ""):
+        """Stores the parsed frame for an object version."""
+        name = cacheKey(bucket, key, etag, variant)
+        self._store(name, dumpFrame(df))
+        self._putRemote(name, df)
+
+    def _getRemote(self, name: str) -> Optional[pd.DataFrame]:
+        if self.s3 is None or self.s3_bucket is None:
+            return None
+        try:
+            obj = self.s3.get_object(Bucket=self.s3_bucket, Key=self._s3Key(name))
+            payload = obj["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                print(f"could not get cache entry from s3 {str(e)}")
+            return None
+        except Exception as e:
+            print(f"could not get cache entry from s3 {e!r}")
+            return None
+        try:
+            return loadSharedFrame(payload)
+        except Exception as e:
+            print(f"dropping unreadable s3 cache entry {name}: {e!r}")
+            try:
+                self.s3.delete_object(Bucket=self.s3_bucket, Key=self._s3Key(name))
+            except Exception:
+                pass
+            return None
+
+    def _putRemote(self, name: str, df: pd.DataFrame):
+        if self.s3 is None or self.s3_bucket is None:
+            return
+        try:
+            self.s3.put_object(Bucket=self.s3_bucket, Key=self._s3Key(name),
+                               Body=io.BytesIO(dumpSharedFrame(df)))
+        except Exception as e:
+            print(f"could not put cache entry to s3 {str(e)}")
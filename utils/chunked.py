@@ -0,0 +1,118 @@
+"""Out-of-core loading for long lookback windows.
+
+Raw objects are read in time-ordered chunks (consecutive keys of the
+date-partitioned prefixes) sized so one chunk's downloads and parsed frames
+fit a memory budget. Each chunk is cleaned and reduced to epoch hours and
+float feature values, deduplicated within the chunk, and released before
+the next one is read. What stays in memory grows with the hourly grid (a
+few bytes per hour and feature), not with the raw data; the serving records
+are then built from the grid one at a time.
+"""
+import math
+from collections.abc import Sequence as SequenceABC
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.align import AlignedHours, lastWrites, sourceArrays
+from utils.serialization import deepARRecord
+from utils.timestamps import formatTimestamps, hoursToTimestamps
+
+MB = 1024 * 1024
+# Peak bytes held while a raw byte is downloaded, parsed and cleaned
+# (Parquet partitions are compressed, so they expand more)
+PARSE_EXPANSION = {"csv": 3, "parquet": 8}
+# Transient bytes per hour of a record being serialized (float reprs)
+RECORD_BYTES_PER_HOUR = 64
+MIN_CHUNK_BYTES = 8 * MB
+
+
+def minimumBudgetBytes(window_hours: int, features: int, itemsize: int = 4) -> int:
+    """Smallest memory budget that loads a window: the bytes reserved for
+    the grid and a record being serialized, plus one MIN_CHUNK_BYTES chunk."""
+    # Compacted rows, the grid and the gap-fill temporaries
+    reserved = 4 * window_hours * features * (itemsize + 8) + window_hours * RECORD_BYTES_PER_HOUR
+    return reserved + MIN_CHUNK_BYTES
+
+
+def chunkBytes(budget_bytes: int, window_hours: int, features: int,
+               itemsize: int = 4) -> int:
+    """Raw-data bytes one chunk may use once the grid and a record being
+    serialized are reserved. Raises ValueError when the budget is below
+    minimumBudgetBytes for the window."""
+    required = minimumBudgetBytes(window_hours, features, itemsize)
+    if budget_bytes < required:
+        raise ValueError("A {:.0f}MB memory budget is too small for a {} hour window; it needs at least {}MB".format(
+            budget_bytes / MB, window_hours, math.ceil(required / MB)))
+    return int(budget_bytes - required + MIN_CHUNK_BYTES)
+
+
+def groupObjects(objects: Iterable[Dict], chunk_bytes: int,
+                 expansion: float = PARSE_EXPANSION["csv"]) -> List[List[Dict]]:
+    """Splits objects, in order, into runs whose expanded Size fits
+    chunk_bytes. An object larger than chunk_bytes gets a run of its own."""
+    groups, group, size = [], [], 0
+    for o in objects:
+        cost = o.get("Size", 0) * expansion
+        if group and size + cost > chunk_bytes:
+            groups.append(group)
+            group, size = [], 0
+        group.append(o)
+        size += cost
+    if group:
+        groups.append(group)
+    return groups
+
+
+class CompactSource:
+    """Rows of one source reduced to (epoch hours, values), a chunk at a time.
+
+    Each chunk keeps the last row of every hour it holds; chunks are kept in
+    load order, so aligning the concatenation keeps the same last writes as
+    aligning all rows at once."""
+
+    def __init__(self, features: Sequence[str], dtype=np.float32):
+        self.features = list(features)
+        self.dtype = dtype
+        self._hours: List[np.ndarray] = []
+        self._values: List[np.ndarray] = []
+        self.rows = 0
+
+    def add(self, df: pd.DataFrame):
+        if not len(df):
+            return
+        hours, values, _ = sourceArrays(df.reindex(columns=self.features), self.features)
+        keep = lastWrites(hours)
+        self._hours.append(hours[keep])
+        self._values.append(values[keep])
+        self.rows += len(keep)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """(hours, values, features) as alignSources takes them."""
+        if not self._hours:
+            return (np.empty(0, dtype=np.int64),
+                    np.empty((0, len(self.features)), dtype=self.dtype), self.features)
+        return np.concatenate(self._hours), np.concatenate(self._values), self.features
+
+
+class StreamedRecords(SequenceABC):
+    """The DeepAR records of an AlignedHours, each built when accessed.
+
+    Reads like the list AlignedHours.records() returns, without holding
+    more than one serialized record at a time."""
+
+    def __init__(self, aligned: AlignedHours):
+        self.aligned = aligned
+        self.start = (formatTimestamps(hoursToTimestamps([aligned.start_hour]))[0]
+                      if len(aligned.values) else None)
+
+    def __len__(self) -> int:
+        return len(self.aligned.features) if len(self.aligned.values) else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if not -len(self) <= i < len(self):
+            raise IndexError("record index out of range")
+        return deepARRecord(self.start, self.aligned.values[:, i])
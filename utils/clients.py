@@ -0,0 +1,27 @@
+from typing import Dict
+
+# Clients cached per service so warm invocations reuse their connection pools.
+# Tests and the offline harness inject stand-ins with setClient.
+_clients: Dict[str, object] = {}
+
+
+def getClient(service: str, **kwargs):
+    """Returns the cached client for a service, creating a boto3 client on
+    first use. kwargs only apply when the client is created."""
+    client = _clients.get(service)
+    if client is None:
+        import boto3
+
+        client = boto3.client(service, **kwargs)
+        _clients[service] = client
+    return client
+
+
+def setClient(service: str, client):
+    """Replaces the client used for a service."""
+    _clients[service] = client
+
+
+def resetClients():
+    """Drops every cached or injected client."""
+    _clients.clear()
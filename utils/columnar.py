@@ -0,0 +1,209 @@
+"""Day-partitioned Parquet copies of the raw CSV prefixes.
+
+Each day of data lives in <prefix>/date=YYYY-MM-DD/part-00000.parquet with
+the cleaned column names and an integer `hour` column (epoch hours of the
+row's timestamp). Rows are sorted by hour and written in row groups of
+row_group_hours hours, so the row-group statistics let readers skip the
+hours outside their window. pyarrow ships with the AWSSDKPandas layer and
+is imported on first use.
+"""
+import io
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from utils.ingest import (DEFAULT_MAX_IN_FLIGHT_BYTES, DEFAULT_MAX_WORKERS,
+                          readCsvFrames, readObjects)
+from utils.timestamps import epochHours, parseWallClock
+
+HOUR_COLUMN = "hour"
+PARTITION_FILE = "part-00000.parquet"
+DEFAULT_ROW_GROUP_HOURS = 6
+_PARTITION_DATE = re.compile(r"/date=(\d{4}-\d{2}-\d{2})/")
+
+
+def partitionKey(prefix: str, day: str) -> str:
+    """Key of the Parquet file holding one day (YYYY-MM-DD)."""
+    return "{}/date={}/{}".format(prefix.rstrip("/"), day, PARTITION_FILE)
+
+
+def partitionDay(key: str) -> Optional[str]:
+    """Day encoded in a partition key, or None for other keys."""
+    match = _PARTITION_DATE.search(key)
+    return match.group(1) if match else None
+
+
+def windowHours(today: datetime, lag_days: datetime):
+    """Epoch hours [first, last] covered by the today/lag_days window."""
+    def toHour(dt):
+        ts = pd.Timestamp(dt)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return int(np.datetime64(ts.to_datetime64(), "h").astype(np.int64))
+    return toHour(lag_days), toHour(today)
+
+
+def hourDay(hour: int) -> str:
+    """Day (YYYY-MM-DD) of an epoch hour."""
+    return str(np.datetime64(int(hour), "h").astype("datetime64[D]"))
+
+
+def frameToParquet(df: pd.DataFrame,
+                   row_group_hours: int = DEFAULT_ROW_GROUP_HOURS) -> bytes:
+    """Writes an hour-sorted frame as Parquet, one row group per
+    row_group_hours hours."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    buf = io.BytesIO()
+    hours = df[HOUR_COLUMN].to_numpy()
+    bounds = np.flatnonzero(np.diff(hours // row_group_hours)) + 1
+    with pq.ParquetWriter(buf, table.schema, compression="snappy") as writer:
+        for first, last in zip(np.concatenate([[0], bounds]),
+                               np.concatenate([bounds, [len(df)]])):
+            writer.write_table(table.slice(int(first), int(last - first)))
+    return buf.getvalue()
+
+
+def parquetToFrame(data: bytes, columns: Optional[Sequence[str]] = None,
+                   first_hour: Optional[int] = None,
+                   last_hour: Optional[int] = None) -> pd.DataFrame:
+    """Reads a partition, keeping only `columns` (those present in the file,
+    in file order) and, when bounds are given, the rows whose hour falls inside them.
+    The bounds are pushed down to the row-group statistics."""
+    import pyarrow.parquet as pq
+
+    buf = io.BytesIO(data)
+    if columns is not None:
+        wanted = set(columns)
+        columns = [c for c in pq.read_schema(buf).names if c in wanted]
+        buf.seek(0)
+    filters = []
+    if first_hour is not None:
+        filters.append((HOUR_COLUMN, ">=", int(first_hour)))
+    if last_hour is not None:
+        filters.append((HOUR_COLUMN, "<=", int(last_hour)))
+    table = pq.read_table(buf, columns=columns, filters=filters or None)
+    return table.to_pandas()
+
+
+def _readPartition(s3, bucket: str, key: str) -> Optional[pd.DataFrame]:
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return None
+    return parquetToFrame(body)
+
+
+def compactFrame(s3, bucket: str, df: pd.DataFrame, dest_prefix: str,
+                 timestamp_column: str,
+                 row_group_hours: int = DEFAULT_ROW_GROUP_HOURS) -> List[Dict]:
+    """Writes a cleaned raw frame into day partitions under dest_prefix.
+
+    Rows are merged into any existing partition for their day; duplicate
+    rows are dropped. Returns the key, rows and bytes of each partition
+    written."""
+    df = df.reset_index(drop=True)
+    df[HOUR_COLUMN] = epochHours(parseWallClock(df[timestamp_column]))
+    days = df[HOUR_COLUMN].to_numpy().astype("datetime64[h]").astype(
+        "datetime64[D]").astype(str)
+    written = []
+    for day, rows in df.groupby(days, sort=True):
+        key = partitionKey(dest_prefix, day)
+        existing = _readPartition(s3, bucket, key)
+        if existing is not None:
+            rows = pd.concat([existing, rows], ignore_index=True)
+        rows = rows.drop_duplicates(ignore_index=True)
+        rows = rows.sort_values(HOUR_COLUMN, kind="stable", ignore_index=True)
+        body = frameToParquet(rows, row_group_hours)
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        written.append({"key": key, "rows": len(rows), "bytes": len(body)})
+    return written
+
+
+def listPartitions(s3, bucket: str, prefix: str, first_hour: int,
+                   last_hour: int) -> List[Dict]:
+    """Lists the partitions overlapping [first_hour, last_hour].
+
+    Listing starts at the first day's key and stops after the last day, so
+    partitions outside the window are never paged through."""
+    first_day, last_day = hourDay(first_hour), hourDay(last_hour)
+    root = prefix.rstrip("/") + "/"
+    start_after = "{}date={}".format(root, first_day)
+    paginator = s3.get_paginator("list_objects_v2")
+    partitions = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=root,
+                                   StartAfter=start_after):
+        for o in page.get("Contents", []):
+            day = partitionDay(o["Key"])
+            if day is None:
+                continue
+            if day > last_day:
+                return partitions
+            partitions.append(dict(o, Day=day))
+    return partitions
+
+
+def readParquetFrames(s3, bucket: str, prefix: str, first_hour: int,
+                      last_hour: int, columns: Optional[Sequence[str]] = None,
+                      dtypes: Optional[Dict[str, str]] = None,
+                      max_workers: int = DEFAULT_MAX_WORKERS,
+                      max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+                      cache=None, cache_variant: str = "",
+                      stats=None) -> List[pd.DataFrame]:
+    """Reads the rows of [first_hour, last_hour] from the day partitions.
+
+    Days fully inside the window are read whole (and cached by ETag); the
+    two edge days are read with the hour bounds pushed down. Frames are
+    returned in day order without the hour column."""
+    partitions = listPartitions(s3, bucket, prefix, first_hour, last_hour)
+    first_day, last_day = hourDay(first_hour), hourDay(last_hour)
+
+    def parser(bounded):
+        def parse(body):
+            df = parquetToFrame(
+                body.read(), columns,
+                first_hour if bounded else None,
+                last_hour if bounded else None)
+            df.drop(columns=[HOUR_COLUMN], errors="ignore", inplace=True)
+            if dtypes:
+                df = df.astype({c: t for c, t in dtypes.items() if c in df.columns})
+            return df
+        return parse
+
+    edges = [p for p in partitions if p["Day"] in (first_day, last_day)]
+    inner = [p for p in partitions if p["Day"] not in (first_day, last_day)]
+    limits = {"max_workers": max_workers,
+              "max_in_flight_bytes": max_in_flight_bytes, "stats": stats}
+    frames = dict(zip(
+        [p["Key"] for p in inner],
+        readObjects(s3, bucket, inner, parse=parser(False), cache=cache,
+                    cache_variant="parquet;" + cache_variant, **limits)))
+    frames.update(zip(
+        [p["Key"] for p in edges],
+        readObjects(s3, bucket, edges, parse=parser(True), **limits)))
+    return [frames[p["Key"]] for p in partitions]
+
+
+def compactPrefix(s3, bucket: str, source_prefix: str, dest_prefix: str,
+                  timestamp_column: str, today=None, lag_days=None,
+                  row_group_hours: int = DEFAULT_ROW_GROUP_HOURS,
+                  max_workers: int = DEFAULT_MAX_WORKERS) -> List[Dict]:
+    """Compacts the CSVs under source_prefix (optionally only those last
+    modified inside [lag_days, today]) into day partitions."""
+    from utils.preprocessing import reformatFrameColumns
+
+    frames = readCsvFrames(s3, bucket, source_prefix, today, lag_days,
+                           max_workers=max_workers,
+                           transform=reformatFrameColumns)
+    if not frames:
+        return []
+    return compactFrame(s3, bucket, pd.concat(frames, ignore_index=True),
+                        dest_prefix, timestamp_column, row_group_hours)
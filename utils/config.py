@@ -0,0 +1,140 @@
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+import numpy as np
+
+import params
+from utils.align import FILL_METHODS, GRID_EXTENTS
+from utils.chunked import MB, minimumBudgetBytes
+
+# Run settings and the name of the params.py constant backing each, which is
+# also the environment variable that overrides it.
+_SETTINGS = {
+    "bucket_weather_data": "WEATHER_BUCKET",
+    "bucket_electric_data": "ELECTRIC_BUCKET",
+    "prefix": "RAW_DATA_PREFIX",
+    "day_window": "DAY_WINDOW",
+    "serving_prefix_uri": "S3_SERVING_PREFIX_URI",
+    "serving_input_uri": "S3_SERVING_INPUT_URI",
+    "forecast_prefix_uri": "S3_FORECAST_PREFIX_URI",
+    "transform_instance_type": "TRANSFORM_INSTANCE_TYPE",
+    "batch_mode": "BATCH_MODE",
+    "weather_stations": "WEATHER_STATIONS",
+    "respondents": "RESPONDENTS",
+    "group_ids_uri": "GROUP_IDS_URI",
+    "transform_max_instances": "TRANSFORM_MAX_INSTANCES",
+    "transform_series_per_instance": "TRANSFORM_SERIES_PER_INSTANCE",
+    "transform_shards_per_instance": "TRANSFORM_SHARDS_PER_INSTANCE",
+    "incremental_mode": "INCREMENTAL_MODE",
+    "window_state_uri": "WINDOW_STATE_URI",
+    "incremental_overlap_hours": "INCREMENTAL_OVERLAP_HOURS",
+    "feature_dtype": "FEATURE_DTYPE",
+    "raw_data_format": "RAW_DATA_FORMAT",
+    "columnar_prefix": "COLUMNAR_PREFIX",
+    "use_key_manifest": "USE_KEY_MANIFEST",
+    "key_manifest_key": "KEY_MANIFEST_KEY",
+    "inference_mode": "INFERENCE_MODE",
+    "online_endpoint_name": "ONLINE_ENDPOINT_NAME",
+    "online_max_series": "ONLINE_MAX_SERIES",
+    "online_max_instances_per_request": "ONLINE_MAX_INSTANCES_PER_REQUEST",
+    "online_max_payload_mb": "ONLINE_MAX_PAYLOAD_MB",
+    "online_concurrency": "ONLINE_CONCURRENCY",
+    "skip_unchanged_input": "SKIP_UNCHANGED_INPUT",
+    "run_ledger_uri": "RUN_LEDGER_URI",
+    "run_ledger_max_entries": "RUN_LEDGER_MAX_ENTRIES",
+    "serving_compression": "SERVING_COMPRESSION",
+    "align_grid_extent": "ALIGN_GRID_EXTENT",
+    "align_fill_method": "ALIGN_FILL_METHOD",
+    "align_max_gap_hours": "ALIGN_MAX_GAP_HOURS",
+    "memory_budget_mb": "MEMORY_BUDGET_MB",
+    "backtest_mode": "BACKTEST_MODE",
+    "backtest_prefix_uri": "BACKTEST_PREFIX_URI",
+    "backtest_cutoffs": "BACKTEST_CUTOFFS",
+    "backtest_stride_hours": "BACKTEST_STRIDE_HOURS",
+    "backtest_context_hours": "BACKTEST_CONTEXT_HOURS",
+    "backtest_prediction_hours": "BACKTEST_PREDICTION_HOURS",
+    "canary_mode": "CANARY_MODE",
+    "canary_prefix_uri": "CANARY_PREFIX_URI",
+    "canary_day_window": "CANARY_DAY_WINDOW",
+}
+
+
+def _coerce(value, default):
+    if isinstance(default, list):
+        return [x.strip() for x in value.split(",") if x.strip()]
+    if isinstance(default, bool):
+        return str(value).lower() in ("1", "true", "yes")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def parseToday(value) -> datetime:
+    """Parses an ISO date/timestamp into an aware UTC datetime."""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def loadRunConfig(event: Dict = None) -> Dict:
+    """Resolves run settings from params.py, environment variables and an
+    optional "config" mapping in the invocation event, in that order."""
+    config = {}
+    for name, param in _SETTINGS.items():
+        default = getattr(params, param)
+        value = os.environ.get(param)
+        config[name] = default if value is None else _coerce(value, default)
+    config["model_name"] = os.environ.get("MODEL_NAME")
+
+    overrides = {}
+    if isinstance(event, dict) and isinstance(event.get("config"), dict):
+        overrides = event["config"]
+    for name, value in overrides.items():
+        if name not in config and name != "today":
+            raise ValueError(f"Unknown run setting: {name}")
+        # Event values may arrive as strings ("false", "A,B") like environment variables
+        default = config.get(name)
+        if default is not None and value is not None and not isinstance(value, type(default)):
+            value = _coerce(value, default)
+        config[name] = value
+    if config["raw_data_format"] not in ("csv", "parquet"):
+        raise ValueError("raw_data_format must be csv or parquet")
+    if config["inference_mode"] not in ("batch", "online"):
+        raise ValueError("inference_mode must be batch or online")
+    if config["serving_compression"] not in ("none", "gzip"):
+        raise ValueError("serving_compression must be none or gzip")
+    if config["align_grid_extent"] not in GRID_EXTENTS:
+        raise ValueError("align_grid_extent must be one of " + ", ".join(GRID_EXTENTS))
+    if config["align_fill_method"] not in FILL_METHODS:
+        raise ValueError("align_fill_method must be one of " + ", ".join(FILL_METHODS))
+    for name in ("backtest_cutoffs", "backtest_stride_hours", "backtest_context_hours", "backtest_prediction_hours", "canary_day_window"):
+        if int(config[name]) < 1:
+            raise ValueError(f"{name} must be at least 1")
+
+    config["today"] = parseToday(config.get("today") or datetime.now(timezone.utc))
+    if config["canary_mode"]:
+        # The sample window is chosen from the newest data by the pipeline
+        config["backtest_mode"] = False
+    config["lag_days"] = config["today"] + timedelta(days=-int(config["day_window"]))
+    if config["backtest_mode"]:
+        # Every cutoff needs its context before it and its actuals after it
+        history = timedelta(hours=int(config["backtest_context_hours"]) + int(config["backtest_prediction_hours"])
+                            + (int(config["backtest_cutoffs"]) - 1) * int(config["backtest_stride_hours"]))
+        config["lag_days"] = min(config["lag_days"], config["today"] - history)
+    if config["memory_budget_mb"] > 0 and not config["batch_mode"] and not config["incremental_mode"]:
+        # Fail here rather than partway through an out-of-core load
+        window_hours = int((config["today"] - config["lag_days"]).total_seconds() // 3600) + 1
+        required = minimumBudgetBytes(window_hours, len(params.WEATHER_FEATURES + params.ELECTRICITY_FEATURES),
+                                      np.dtype(config["feature_dtype"]).itemsize)
+        if config["memory_budget_mb"] * MB < required:
+            raise ValueError("memory_budget_mb must be at least {} for a {} hour window".format(
+                math.ceil(required / MB), window_hours))
+    return config
@@ -0,0 +1,209 @@
+"""Reads DeepAR batch transform output and tracks transform jobs.
+
+Batch transform writes one JSON line per input record to
+<S3OutputPath>/<input file>.out, in input order: serving.json.out for a
+single serving file, part-NNNNN.json.out for each shard. The reader streams
+those files in chunks, parses them a batch of lines at a time and fills
+(series, horizon) float32 arrays of the mean and each quantile, in the
+order of the serving index so every row is joined back to its series.
+"""
+import json
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.timestamps import epochHours, formatTimestamps, hoursToTimestamps
+from utils.upload import splitS3Uri
+
+# Sidecar describing each series in serving order, next to serving.json;
+# named so the serving.json S3Prefix input does not pick it up
+SERIES_INDEX_FILE = "serving-index.json"
+TERMINAL_JOB_STATUSES = ("Completed", "Failed", "Stopped")
+READ_CHUNK_BYTES = 1024 * 1024
+PARSE_BATCH_LINES = 1000
+
+
+class Forecasts(NamedTuple):
+    """Forecasts of every series, row i belonging to series[i].
+
+    mean and each quantiles array are (series, horizon); rows of series
+    without output are NaN. start_hours holds the epoch hour of each
+    series' first forecast step (the hour after its input ends)."""
+    series: List[Dict]
+    mean: np.ndarray
+    quantiles: Dict[str, np.ndarray]
+    start_hours: np.ndarray
+
+    @property
+    def horizon(self) -> int:
+        return self.mean.shape[1]
+
+    def toFrame(self) -> pd.DataFrame:
+        """One row per (series, step) with its timestamp, mean and quantiles."""
+        n, horizon = self.mean.shape
+        steps = np.tile(np.arange(horizon), n)
+        hours = np.repeat(self.start_hours, horizon) + steps
+        frame = pd.DataFrame({
+            "series": np.repeat(np.arange(n), horizon),
+            "step": steps,
+            "timestamp": formatTimestamps(hoursToTimestamps(hours)),
+            "mean": self.mean.ravel(),
+        })
+        for q, values in self.quantiles.items():
+            frame[q] = values.ravel()
+        return frame
+
+
+def iterLines(body, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[bytes]:
+    """Non-empty lines of a streaming body, read chunk_size bytes at a time."""
+    rest = b""
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if rest.strip():
+        yield rest
+
+
+def parseForecastLines(lines: Sequence[bytes]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Mean and quantile arrays of a batch of DeepAR output lines, parsed
+    in one json.loads call."""
+    rows = json.loads(b"[" + b",".join(lines) + b"]")
+    mean = np.array([r["mean"] for r in rows], dtype=np.float32)
+    names = rows[0].get("quantiles", {}) if rows else {}
+    quantiles = {q: np.array([r["quantiles"][q] for r in rows], dtype=np.float32)
+                 for q in names}
+    return mean, quantiles
+
+
+def _batches(lines: Iterable[bytes], size: int) -> Iterator[List[bytes]]:
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def readForecastFile(s3, uri: str, batch_lines: int = PARSE_BATCH_LINES
+                     ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Streams one .out file into (records, horizon) mean and quantile arrays."""
+    bucket, key = splitS3Uri(uri)
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    means, quantiles = [], {}
+    for batch in _batches(iterLines(body), batch_lines):
+        mean, qs = parseForecastLines(batch)
+        means.append(mean)
+        for q, values in qs.items():
+            quantiles.setdefault(q, []).append(values)
+    if not means:
+        return np.empty((0, 0), dtype=np.float32), {}
+    return (np.concatenate(means),
+            {q: np.concatenate(v) for q, v in quantiles.items()})
+
+
+def getJson(s3, uri: str):
+    bucket, key = splitS3Uri(uri)
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def forecastFiles(s3, input_uri: str, forecast_uri: str,
+                  series_count: int) -> List[Tuple[str, List[int]]]:
+    """The .out files of one run and the series positions each holds.
+
+    A shard prefix input (ending in "/") is resolved through the shard
+    manifest next to it; forecast_uri is then the output prefix. Otherwise
+    forecast_uri is the single .out file holding every series."""
+    if not input_uri.endswith("/"):
+        return [(forecast_uri, list(range(series_count)))]
+    manifest = getJson(s3, input_uri.rstrip("/") + ".manifest.json")
+    prefix = forecast_uri if forecast_uri.endswith("/") else forecast_uri + "/"
+    return [(prefix + shard["file"] + ".out", list(shard["series"]))
+            for shard in manifest["shards"]]
+
+
+def readForecasts(s3, files: Sequence[Tuple[str, Sequence[int]]],
+                  series_index: Sequence[Dict],
+                  batch_lines: int = PARSE_BATCH_LINES) -> Forecasts:
+    """Reads every .out file and places its rows at their series positions."""
+    n = len(series_index)
+    mean, quantiles = None, {}
+    for uri, positions in files:
+        block_mean, block_quantiles = readForecastFile(s3, uri, batch_lines)
+        if len(block_mean) != len(positions):
+            raise ValueError("{} holds {} forecasts for {} series".format(
+                uri, len(block_mean), len(positions)))
+        if not len(positions):
+            continue
+        if mean is None:
+            horizon = block_mean.shape[1]
+            mean = np.full((n, horizon), np.nan, dtype=np.float32)
+            quantiles = {q: np.full((n, horizon), np.nan, dtype=np.float32)
+                         for q in block_quantiles}
+        rows = np.asarray(positions, dtype=np.int64)
+        mean[rows] = block_mean
+        for q, values in block_quantiles.items():
+            quantiles[q][rows] = values
+    if mean is None:
+        mean = np.empty((n, 0), dtype=np.float32)
+    starts = epochHours([s["start"] for s in series_index]) if n else np.empty(0, dtype=np.int64)
+    lengths = np.array([s["length"] for s in series_index], dtype=np.int64)
+    return Forecasts(list(series_index), mean, quantiles, starts + lengths)
+
+
+def readRunForecasts(s3, input_uri: str, forecast_uri: str, index_uri: str,
+                     batch_lines: int = PARSE_BATCH_LINES) -> Forecasts:
+    """Forecasts of one run, located by its serving input and forecast URIs
+    (as returned by the handler and recorded in the run ledger)."""
+    series_index = getJson(s3, index_uri)
+    files = forecastFiles(s3, input_uri, forecast_uri, len(series_index))
+    return readForecasts(s3, files, series_index, batch_lines)
+
+
+def waitForTransformJobs(client, job_names: Iterable[str], timeout: float = 3600,
+                         initial_delay: float = 5.0, max_delay: float = 60.0,
+                         backoff: float = 2.0,
+                         sleep: Callable[[float], None] = time.sleep,
+                         clock: Callable[[], float] = time.monotonic) -> Dict[str, Dict]:
+    """Polls transform jobs until each is Completed, Failed or Stopped.
+
+    Every round describes only the jobs still running, then waits
+    initial_delay seconds, growing by backoff up to max_delay. Returns the
+    final describe_transform_job response of each job; raises TimeoutError
+    naming the jobs still running after timeout seconds."""
+    pending = list(dict.fromkeys(job_names))
+    finished: Dict[str, Dict] = {}
+    deadline = clock() + timeout
+    delay = initial_delay
+    while True:
+        for name in list(pending):
+            response = client.describe_transform_job(TransformJobName=name)
+            if response["TransformJobStatus"] in TERMINAL_JOB_STATUSES:
+                finished[name] = response
+                pending.remove(name)
+        if not pending:
+            return finished
+        remaining = deadline - clock()
+        if remaining <= 0:
+            raise TimeoutError("Transform jobs still running: " + ", ".join(pending))
+        sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+
+def waitForTransformJob(client, job_name: str, **kwargs) -> Dict:
+    """Waits for one job; raises RuntimeError when it did not complete."""
+    response = waitForTransformJobs(client, [job_name], **kwargs)[job_name]
+    if response["TransformJobStatus"] != "Completed":
+        raise RuntimeError("Transform job {} {}: {}".format(
+            job_name, response["TransformJobStatus"].lower(),
+            response.get("FailureReason", "no reason given")))
+    return response
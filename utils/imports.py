@@ -0,0 +1,33 @@
+import importlib
+import sys
+import time
+from typing import Dict
+
+# Heavy third-party modules, imported in dependency order so each cost
+# excludes the modules before it
+HEAVY_MODULES = ["numpy", "pandas", "botocore", "boto3"]
+
+_import_ms: Dict[str, float] = {}
+
+
+def timedImport(name: str):
+    """Imports a module, recording its import cost the first time it is
+    loaded in this process."""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_ms[name] = round((time.perf_counter() - start) * 1000, 3)
+    return module
+
+
+def importModules(names) -> Dict[str, float]:
+    """Imports modules in order and returns each one's incremental cost."""
+    for name in names:
+        timedImport(name)
+    return importCosts()
+
+
+def importCosts() -> Dict[str, float]:
+    """Import costs in milliseconds recorded so far, in import order."""
+    return dict(_import_ms)
@@ -0,0 +1,158 @@
+import csv
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024
+DEFAULT_PAGE_SIZE = 1000
+
+
+def s3ClientConfig(max_workers: int = DEFAULT_MAX_WORKERS):
+    """Builds a botocore config whose connection pool matches the worker count,
+    so every download thread reuses a pooled connection."""
+    from botocore.config import Config
+
+    return Config(max_pool_connections=max(10, max_workers),
+                  retries={"max_attempts": 5, "mode": "standard"})
+
+
+def listObjects(s3, bucket: str, prefix: str, today=None, lag_days=None,
+                page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict]:
+    """Lists every object under a prefix, following continuation tokens,
+    keeping those last modified inside [lag_days, today]."""
+    paginator = s3.get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix,
+                               PaginationConfig={"PageSize": page_size})
+    for page in pages:
+        for o in page.get("Contents", []):
+            if today is not None and o["LastModified"] > today:
+                continue
+            if lag_days is not None and o["LastModified"] < lag_days:
+                continue
+            yield o
+
+
+class _ByteBudget:
+    """Blocks new downloads while the bytes in flight exceed a limit.
+
+    A single object larger than the limit is still admitted once nothing
+    else is in flight, so oversized objects cannot deadlock the pool."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int):
+        with self._cond:
+            while self.in_flight > 0 and self.in_flight + size > self.limit:
+                self._cond.wait()
+            self.in_flight += size
+
+    def release(self, size: int):
+        with self._cond:
+            self.in_flight -= size
+            self._cond.notify_all()
+
+
+def readObjects(s3, bucket: str, objects: List[Dict],
+                parse: Callable = pd.read_csv,
+                max_workers: int = DEFAULT_MAX_WORKERS,
+                max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+                cache=None, cache_variant: str = "", stats=None) -> List:
+    """Downloads and parses objects on a bounded thread pool.
+
+    Each worker parses its body as soon as it arrives, while other downloads
+    are still running. With a FrameCache, objects whose ETag is already
+    cached are not downloaded at all. Results are returned in listing order.
+    stats, an IOStats, accumulates objects listed/fetched, cache hits and
+    bytes read."""
+    objects = list(objects)
+    if stats is not None:
+        stats.add("objects_listed", len(objects))
+    if not objects:
+        return []
+    budget = _ByteBudget(max_in_flight_bytes)
+
+    def fetch(o):
+        size = o.get("Size", 0)
+        try:
+            if cache is not None and "ETag" in o:
+                cached = cache.get(bucket, o["Key"], o["ETag"], cache_variant)
+                if cached is not None:
+                    if stats is not None:
+                        stats.add("cache_hits")
+                    return cached
+            obj = s3.get_object(Bucket=bucket, Key=o["Key"])
+            if stats is not None:
+                stats.add("objects_fetched")
+                stats.add("bytes_read", obj.get("ContentLength", size))
+            result = parse(obj["Body"])
+            etag = obj.get("ETag", o.get("ETag"))
+            if cache is not None and etag is not None:
+                cache.put(bucket, o["Key"], etag, result, cache_variant)
+            return result
+        finally:
+            budget.release(size)
+
+    workers = max(1, min(max_workers, len(objects)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for o in objects:
+            budget.acquire(o.get("Size", 0))
+            futures.append(pool.submit(fetch, o))
+        return [f.result() for f in futures]
+
+
+def csvHeader(data: bytes) -> List[str]:
+    """Column names from the first line of a CSV payload."""
+    end = data.find(b"\n")
+    line = (data if end < 0 else data[:end]).decode("utf-8").rstrip("\r")
+    return next(csv.reader([line]), [])
+
+
+def readCsvFrames(s3, bucket: str, prefix: str, today, lag_days,
+                  max_workers: int = DEFAULT_MAX_WORKERS,
+                  max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+                  transform: Callable = None, cache=None,
+                  cache_variant: str = "", stats=None,
+                  columns: Optional[Sequence[str]] = None,
+                  dtypes: Optional[Dict[str, str]] = None,
+                  normalize: Callable = None,
+                  objects: Optional[Iterable[Dict]] = None,
+                  **read_csv_kwargs) -> List[pd.DataFrame]:
+    """Reads every CSV under a prefix inside the date window into DataFrames.
+
+    columns and dtypes are keyed by normalized column names (normalize maps
+    a raw header name to its normalized form). When given, only those
+    columns are parsed, straight into the requested dtypes, so unused
+    columns are never materialized. transform is applied to each parsed
+    frame before it is cached. objects, when given (e.g. selected from a
+    key manifest), replaces the LastModified-filtered listing."""
+    if objects is None:
+        objects = listObjects(s3, bucket, prefix, today, lag_days)
+    normalize = normalize or (lambda name: name)
+
+    def parse(body):
+        if columns is None and dtypes is None:
+            df = pd.read_csv(body, **read_csv_kwargs)
+        else:
+            data = body.read()
+            header = csvHeader(data)
+            usecols = [c for c in header
+                       if columns is None or normalize(c) in columns]
+            dtype = {c: (dtypes or {})[normalize(c)] for c in usecols
+                     if normalize(c) in (dtypes or {})}
+            df = pd.read_csv(io.BytesIO(data), usecols=usecols, dtype=dtype,
+                             **read_csv_kwargs)
+        return transform(df) if transform is not None else df
+
+    return readObjects(s3, bucket, objects, parse=parse,
+                       max_workers=max_workers,
+                       max_in_flight_bytes=max_in_flight_bytes,
+                       cache=cache, cache_variant=cache_variant,
+                       stats=stats)
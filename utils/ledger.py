@@ -0,0 +1,119 @@
+"""Run ledger keyed by the content hash of the serving dataset.
+
+Each run that submits a forecast records the hash of its serving records,
+the model, the transform job and where the forecast is written. A run whose
+records and model match the latest entry can reuse that forecast instead
+of uploading the same input and starting another job.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from botocore.exceptions import ClientError
+
+from utils.upload import splitS3Uri
+
+LEDGER_VERSION = 1
+# Jobs in these states never produced a forecast to point to
+UNUSABLE_JOB_STATUSES = ("Failed", "Stopped")
+
+
+def contentHash(lines: Iterable[str], encoding: str = "utf-8",
+                sizes: Optional[List[int]] = None) -> str:
+    """SHA-256 of the records as writeLines serializes them.
+
+    sizes, when given, is filled with the length of each line plus its
+    newline, so records built on access are measured in the same pass."""
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode(encoding))
+        digest.update(b"\n")
+        if sizes is not None:
+            sizes.append(len(line) + 1)
+    return digest.hexdigest()
+
+
+class RunLedger:
+    """Most recent runs first, at most max_entries of them."""
+
+    def __init__(self, entries: Optional[List[Dict]] = None,
+                 max_entries: int = 50):
+        self.entries = list(entries or [])
+        self.max_entries = max_entries
+
+    @property
+    def latest(self) -> Optional[Dict]:
+        return self.entries[0] if self.entries else None
+
+    def record(self, content_hash: str, model_name: str, inference_mode: str,
+               input_uri: str, forecast_uri: str,
+               transform_job_name: Optional[str] = None,
+               run_id: Optional[str] = None) -> Dict:
+        entry = {
+            "hash": content_hash,
+            "model": model_name,
+            "mode": inference_mode,
+            "inputUri": input_uri,
+            "forecastUri": forecast_uri,
+            "transformJobName": transform_job_name,
+            "runId": run_id,
+            "created": datetime.now(timezone.utc).isoformat(),
+        }
+        self.entries.insert(0, entry)
+        del self.entries[self.max_entries:]
+        return entry
+
+    def dumps(self) -> bytes:
+        return json.dumps({"version": LEDGER_VERSION,
+                           "entries": self.entries}).encode("utf-8")
+
+    @classmethod
+    def loads(cls, payload: bytes, max_entries: int = 50) -> "RunLedger":
+        data = json.loads(payload)
+        if data.get("version") != LEDGER_VERSION:
+            raise ValueError("Unsupported run ledger version")
+        return cls(data["entries"], max_entries)
+
+
+def loadLedger(s3, uri: str, max_entries: int = 50) -> RunLedger:
+    """Loads the ledger, or returns an empty one when none exists."""
+    bucket, key = splitS3Uri(uri)
+    try:
+        payload = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return RunLedger(max_entries=max_entries)
+    return RunLedger.loads(payload, max_entries)
+
+
+def saveLedger(s3, uri: str, ledger: RunLedger):
+    bucket, key = splitS3Uri(uri)
+    s3.put_object(Bucket=bucket, Key=key, Body=ledger.dumps())
+
+
+def reusableRun(ledger: RunLedger, content_hash: str, model_name: str,
+                inference_mode: str, sagemaker=None) -> Optional[Dict]:
+    """The latest entry when it forecast the same records with the same
+    model and mode, else None.
+
+    Only the latest entry is considered: every run writes its forecast to
+    the same location, so older forecasts have been overwritten. When a
+    sagemaker client is given, an entry whose transform job failed or was
+    stopped is not reused."""
+    entry = ledger.latest
+    if entry is None or (entry["hash"], entry["model"], entry["mode"]) != (
+            content_hash, model_name, inference_mode):
+        return None
+    if sagemaker is not None and entry.get("transformJobName"):
+        try:
+            status = sagemaker.describe_transform_job(
+                TransformJobName=entry["transformJobName"])["TransformJobStatus"]
+        except ClientError as e:
+            print("Could not describe {} ({}), rerunning".format(entry["transformJobName"], e))
+            return None
+        if status in UNUSABLE_JOB_STATUSES:
+            print("Previous transform job {} is {}, rerunning".format(entry["transformJobName"], status))
+            return None
+    return entry
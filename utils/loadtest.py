@@ -0,0 +1,167 @@
+"""Concurrent load test for a DeepAR real-time endpoint.
+
+Requests are built from serving records produced by the pipeline's own
+serializer, sent from a thread pool at a target rate, and summarized as
+latency percentiles, throughput and error rate, which are then checked
+against SLO thresholds.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_QUANTILES = ["0.1", "0.5", "0.9"]
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+def requestPayloads(records: Sequence[str], instances_per_request: int = 1,
+                    context_length: Optional[int] = None,
+                    prediction_length: Optional[int] = None,
+                    quantiles: Sequence[str] = DEFAULT_QUANTILES) -> List[bytes]:
+    """Groups DeepAR JSON Lines records into invocation bodies.
+
+    Each body holds instances_per_request instances; targets (and dynamic
+    features) are cut to their last context_length values."""
+    instances = []
+    for line in records:
+        record = json.loads(line)
+        if context_length:
+            record["target"] = record["target"][-context_length:]
+            if "dynamic_feat" in record:
+                record["dynamic_feat"] = [f[-context_length:] for f in record["dynamic_feat"]]
+        instances.append(record)
+    configuration = {"num_samples": 100, "output_types": ["mean", "quantiles"],
+                     "quantiles": list(quantiles)}
+    if prediction_length:
+        configuration["prediction_length"] = prediction_length
+    step = max(1, instances_per_request)
+    return [json.dumps({"instances": instances[i:i + step],
+                        "configuration": configuration}).encode("utf-8")
+            for i in range(0, len(instances), step)]
+
+
+def syntheticRecords(days: int = 30, stations: int = 1,
+                     respondents: int = 1) -> List[str]:
+    """Serving records built by running synthetic raw data through the
+    pipeline's loaders, merge and serializer."""
+    from datetime import datetime, timedelta, timezone
+
+    from benchmarks.synthetic import electricityFrame, splitToObjects, weatherFrame
+    from params import (ELECTRICITY_FEATURES, FEATURE_DTYPE, WEATHER_FEATURES)
+    from utils.local import FakeS3
+    from utils.preprocessing import (getPreprocessedElectricityData,
+                                     getPreprocessedWeatherData)
+    from utils.serialization import frameRecords
+
+    s3 = FakeS3()
+    for bucket, df, column in [
+            ("weather", weatherFrame(days, stations), "properties.timestamp"),
+            ("electricity", electricityFrame(days, respondents), "period")]:
+        for key, body in splitToObjects(df, column, "raw").items():
+            s3.put_object(Bucket=bucket, Key=key, Body=body)
+    today = datetime.now(timezone.utc) + timedelta(days=1)
+    options = {"feature_dtype": FEATURE_DTYPE, "max_workers": 4}
+    weather = getPreprocessedWeatherData(s3, "weather", "raw", today, None,
+                                         features=WEATHER_FEATURES, **options)
+    electricity = getPreprocessedElectricityData(s3, "electricity", "raw", today, None,
+                                                 features=ELECTRICITY_FEATURES, **options)
+    X = weather[WEATHER_FEATURES].merge(electricity[ELECTRICITY_FEATURES], how="inner",
+                                        left_index=True, right_index=True)
+    return list(frameRecords(X, fill_nan=None))
+
+
+def validatePrediction(body: bytes, instances: int):
+    """Raises ValueError unless the response holds one forecast per instance."""
+    predictions = json.loads(body).get("predictions")
+    if not isinstance(predictions, list) or len(predictions) != instances:
+        raise ValueError("Expected {} predictions".format(instances))
+    for p in predictions:
+        if "mean" not in p:
+            raise ValueError("Prediction without a mean forecast")
+
+
+def runLoadTest(invoke: Callable[[bytes], bytes], payloads: Sequence[bytes],
+                requests: int, concurrency: int = 4,
+                rate: Optional[float] = None,
+                validate: bool = True) -> Dict:
+    """Sends `requests` invocations (cycling through payloads) from
+    `concurrency` threads, at most `rate` requests per second when given.
+
+    Each request is scheduled at start + i / rate, so the offered load
+    stays fixed even while responses are slow."""
+    if not payloads:
+        raise ValueError("No payloads to send")
+    counts = [len(json.loads(p)["instances"]) for p in payloads]
+    latencies = np.full(requests, np.nan)
+    errors: List[str] = []
+    lock = threading.Lock()
+    next_request = iter(range(requests))
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(next_request, None)
+            if i is None:
+                return
+            if rate:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            payload = payloads[i % len(payloads)]
+            sent = time.perf_counter()
+            try:
+                body = invoke(payload)
+                if validate:
+                    validatePrediction(body, counts[i % len(payloads)])
+                latencies[i] = (time.perf_counter() - sent) * 1000
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__ + ": " + str(e))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for _ in range(max(1, concurrency)):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+    return summarizeLatencies(latencies, len(errors), elapsed, errors[:5])
+
+
+def summarizeLatencies(latencies_ms: np.ndarray, error_count: int,
+                       elapsed: float, sample_errors: Sequence[str] = ()) -> Dict:
+    """Latency percentiles (successful requests), throughput and error rate."""
+    ok = latencies_ms[~np.isnan(latencies_ms)]
+    total = len(latencies_ms)
+    summary = {
+        "requests": total,
+        "succeeded": int(len(ok)),
+        "errors": int(error_count),
+        "error_rate": round(error_count / total, 6) if total else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+        "sample_errors": list(sample_errors),
+    }
+    for p in LATENCY_PERCENTILES:
+        summary[f"p{p}_ms"] = round(float(np.percentile(ok, p)), 3) if len(ok) else None
+    summary["max_ms"] = round(float(ok.max()), 3) if len(ok) else None
+    return summary
+
+
+def checkSlo(summary: Dict, slo: Dict) -> List[str]:
+    """Returns a message per violated threshold. slo may hold p50_ms,
+    p95_ms, p99_ms and max error_rate, and min throughput_rps."""
+    violations = []
+    for name in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+        limit = slo.get(name)
+        if limit is None:
+            continue
+        value = summary.get(name)
+        if value is None or value > limit:
+            violations.append(f"{name} {value} exceeds {limit}")
+    floor = slo.get("throughput_rps")
+    if floor is not None and (summary.get("throughput_rps") or 0) < floor:
+        violations.append("throughput_rps {} below {}".format(
+            summary.get("throughput_rps"), floor))
+    return violations
@@ -0,0 +1,509 @@
+"""In-process stand-ins for the S3 and SageMaker clients, and a local
+HTTP stand-in for a DeepAR endpoint.
+
+They implement the subset of the boto3 client API the pipeline calls, so
+lambda_handler and the loaders can run fully offline against fixture data.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from utils.transform import transformRequestProblems
+
+
+def clientError(code: str, message: str, operation: str) -> ClientError:
+    """Builds the ClientError boto3 would raise for a failed call."""
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class FakeS3:
+    """Dict-backed object store mimicking the boto3 S3 client."""
+
+    def __init__(self, page_size: int = 1000):
+        self.page_size = page_size
+        self.buckets: Dict[str, Dict[str, Dict]] = {}
+        self.calls: List[str] = []
+        self.multipart_uploads: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket: str) -> Dict[str, Dict]:
+        return self.buckets.setdefault(bucket, {})
+
+    def _log(self, operation: str):
+        with self._lock:
+            self.calls.append(operation)
+
+    def put_object(self, Bucket: str, Key: str, Body=b"",
+                   LastModified: Optional[datetime] = None, **kwargs) -> Dict:
+        self._log("PutObject")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        return {"ETag": self._store(Bucket, Key, Body, LastModified, **kwargs)}
+
+    def _store(self, Bucket: str, Key: str, Body: bytes,
+               LastModified: Optional[datetime] = None, **kwargs) -> str:
+        etag = '"{}"'.format(hashlib.md5(Body).hexdigest())
+        with self._lock:
+            self._bucket(Bucket)[Key] = {
+                "Body": bytes(Body),
+                "ETag": etag,
+                "LastModified": LastModified or datetime.now(timezone.utc),
+                "Metadata": kwargs.get("Metadata", {}),
+                "ContentEncoding": kwargs.get("ContentEncoding"),
+            }
+        return etag
+
+    def _entry(self, Bucket: str, Key: str, operation: str) -> Dict:
+        entry = self.buckets.get(Bucket, {}).get(Key)
+        if entry is None:
+            code = "NoSuchKey" if operation == "GetObject" else "404"
+            raise clientError(code, "The specified key does not exist.", operation)
+        return entry
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._log("GetObject")
+        entry = self._entry(Bucket, Key, "GetObject")
+        body = entry["Body"]
+        if "Range" in kwargs:
+            first, last = kwargs["Range"].split("=")[1].split("-")
+            body = body[int(first):int(last) + 1]
+        return {"Body": io.BytesIO(body), "ETag": entry["ETag"],
+                "ContentLength": len(body),
+                "LastModified": entry["LastModified"],
+                "Metadata": dict(entry["Metadata"])}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._log("HeadObject")
+        entry = self._entry(Bucket, Key, "HeadObject")
+        response = {"ETag": entry["ETag"], "ContentLength": len(entry["Body"]),
+                    "LastModified": entry["LastModified"],
+                    "Metadata": dict(entry["Metadata"])}
+        if entry.get("ContentEncoding"):
+            response["ContentEncoding"] = entry["ContentEncoding"]
+        return response
+
+    def delete_object(self, Bucket: str, Key: str) -> Dict:
+        self._log("DeleteObject")
+        with self._lock:
+            self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._log("CreateMultipartUpload")
+        with self._lock:
+            upload_id = str(len(self.multipart_uploads) + 1)
+            self.multipart_uploads[upload_id] = {"Bucket": Bucket, "Key": Key,
+                                                 "Parts": {}, "Options": kwargs}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str,
+                    PartNumber: int, Body=b"", **kwargs) -> Dict:
+        self._log("UploadPart")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        etag = '"{}"'.format(hashlib.md5(Body).hexdigest())
+        with self._lock:
+            self.multipart_uploads[UploadId]["Parts"][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str,
+                                  MultipartUpload: Dict, **kwargs) -> Dict:
+        self._log("CompleteMultipartUpload")
+        with self._lock:
+            upload = self.multipart_uploads.pop(UploadId)
+        parts = MultipartUpload["Parts"]
+        numbers = [p["PartNumber"] for p in parts]
+        if numbers != sorted(numbers) or any(
+                upload["Parts"][p["PartNumber"]][0] != p["ETag"] for p in parts):
+            raise clientError("InvalidPart", "One or more parts are invalid.",
+                              "CompleteMultipartUpload")
+        for p in parts[:-1]:
+            if len(upload["Parts"][p["PartNumber"]][1]) < 5 * 1024 * 1024:
+                raise clientError("EntityTooSmall", "Part is smaller than 5MB.",
+                                  "CompleteMultipartUpload")
+        body = b"".join(upload["Parts"][n][1] for n in numbers)
+        etag = self._store(Bucket, Key, body, **upload["Options"])
+        return {"Bucket": Bucket, "Key": Key, "ETag": etag}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str) -> Dict:
+        self._log("AbortMultipartUpload")
+        with self._lock:
+            self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", MaxKeys: int = None,
+                        ContinuationToken: str = None, StartAfter: str = None,
+                        **kwargs) -> Dict:
+        self._log("ListObjectsV2")
+        max_keys = MaxKeys or self.page_size
+        with self._lock:
+            keys = sorted(k for k in self._bucket(Bucket) if k.startswith(Prefix))
+            marker = ContinuationToken or StartAfter
+            if marker:
+                keys = [k for k in keys if k > marker]
+            page = keys[:max_keys]
+            contents = [{"Key": k, "Size": len(self.buckets[Bucket][k]["Body"]),
+                         "ETag": self.buckets[Bucket][k]["ETag"],
+                         "LastModified": self.buckets[Bucket][k]["LastModified"]}
+                        for k in page]
+        response = {"KeyCount": len(contents), "IsTruncated": len(keys) > max_keys}
+        if contents:
+            response["Contents"] = contents
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation: str):
+        assert operation == "list_objects_v2", operation
+        return _ListObjectsV2Paginator(self)
+
+    def loadDirectory(self, bucket: str, directory: str, prefix: str = "",
+                      last_modified: Optional[datetime] = None) -> int:
+        """Uploads every file under a local directory; returns the count."""
+        count = 0
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    self.put_object(Bucket=bucket, Key=prefix.rstrip("/") + "/" + rel,
+                                    Body=f.read(), LastModified=last_modified)
+                count += 1
+        return count
+
+
+class _ListObjectsV2Paginator:
+    def __init__(self, s3: FakeS3):
+        self.s3 = s3
+
+    def paginate(self, PaginationConfig: Dict = None, **kwargs):
+        page_size = (PaginationConfig or {}).get("PageSize")
+        token = None
+        while True:
+            response = self.s3.list_objects_v2(MaxKeys=page_size,
+                                               ContinuationToken=token, **kwargs)
+            yield response
+            if not response["IsTruncated"]:
+                return
+            token = response["NextContinuationToken"]
+
+
+class _TokenPaginator:
+    """Follows NextToken across pages, like a boto3 paginator."""
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, PaginationConfig: Dict = None, **kwargs):
+        page_size = (PaginationConfig or {}).get("PageSize")
+        if page_size:
+            kwargs["MaxResults"] = page_size
+        token = None
+        while True:
+            response = self.method(NextToken=token, **kwargs)
+            yield response
+            token = response.get("NextToken")
+            if not token:
+                return
+
+
+def validateTransformRequest(request: Dict):
+    """Applies the CreateTransformJob limits SageMaker enforces server-side."""
+    problems = transformRequestProblems(request)
+    if problems:
+        raise clientError("ValidationException", "; ".join(problems),
+                          "CreateTransformJob")
+
+
+class FakeSageMaker:
+    """Records SageMaker requests instead of sending them.
+
+    Transform jobs report InProgress for `polls_until_complete` describe
+    calls, then Completed. Model packages and projects registered with
+    addModelPackage/addProject back the lookups builder.py makes."""
+
+    def __init__(self, polls_until_complete: int = 0, page_size: int = 100):
+        self.polls_until_complete = polls_until_complete
+        self.page_size = page_size
+        self.transform_jobs: Dict[str, Dict] = {}
+        self.requests: List[Dict] = []
+        self.model_packages: Dict[str, List[Dict]] = {}
+        self.projects: Dict[str, Dict] = {}
+        self.calls: List[str] = []
+        self._polls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _log(self, operation: str):
+        with self._lock:
+            self.calls.append(operation)
+
+    def addModelPackage(self, group: str, version: int,
+                        status: str = "Approved") -> str:
+        """Registers a model package version; returns its ARN."""
+        arn = ("arn:aws:sagemaker:local:000000000000:model-package/"
+               f"{group.lower()}/{version}")
+        self.model_packages.setdefault(group, []).append({
+            "ModelPackageGroupName": group,
+            "ModelPackageVersion": version,
+            "ModelPackageArn": arn,
+            "ModelApprovalStatus": status,
+            "CreationTime": datetime.now(timezone.utc),
+        })
+        return arn
+
+    def addProject(self, name: str, tags: Optional[Dict[str, str]] = None) -> str:
+        """Registers a SageMaker project and its tags; returns its ARN."""
+        arn = f"arn:aws:sagemaker:local:000000000000:project/{name.lower()}"
+        self.projects[name] = {
+            "ProjectArn": arn,
+            "Tags": [{"Key": k, "Value": v} for k, v in (tags or {}).items()],
+        }
+        return arn
+
+    def list_model_packages(self, ModelPackageGroupName: str,
+                            ModelApprovalStatus: str = None,
+                            SortBy: str = "CreationTime",
+                            SortOrder: str = "Ascending",
+                            MaxResults: int = None, NextToken: str = None,
+                            **kwargs) -> Dict:
+        self._log("ListModelPackages")
+        packages = [p for p in self.model_packages.get(ModelPackageGroupName, [])
+                    if ModelApprovalStatus in (None, p["ModelApprovalStatus"])]
+        packages.sort(key=lambda p: p[SortBy if SortBy != "Name" else "ModelPackageArn"],
+                      reverse=SortOrder == "Descending")
+        first = int(NextToken or 0)
+        last = first + (MaxResults or self.page_size)
+        response = {"ModelPackageSummaryList": [dict(p) for p in packages[first:last]]}
+        if last < len(packages):
+            response["NextToken"] = str(last)
+        return response
+
+    def describe_project(self, ProjectName: str) -> Dict:
+        self._log("DescribeProject")
+        project = self.projects.get(ProjectName)
+        if project is None:
+            raise clientError("ValidationException",
+                              f"Project {ProjectName} does not exist",
+                              "DescribeProject")
+        return {"ProjectName": ProjectName, "ProjectArn": project["ProjectArn"]}
+
+    def list_tags(self, ResourceArn: str, **kwargs) -> Dict:
+        self._log("ListTags")
+        for project in self.projects.values():
+            if project["ProjectArn"] == ResourceArn:
+                return {"Tags": [dict(t) for t in project["Tags"]]}
+        return {"Tags": []}
+
+    def get_paginator(self, operation: str):
+        assert operation == "list_model_packages", operation
+        return _TokenPaginator(self.list_model_packages)
+
+    def create_transform_job(self, **request) -> Dict:
+        validateTransformRequest(request)
+        name = request["TransformJobName"]
+        with self._lock:
+            if name in self.transform_jobs:
+                raise clientError("ResourceInUse",
+                                  f"Job {name} already exists", "CreateTransformJob")
+            self.requests.append(request)
+            self.transform_jobs[name] = dict(request,
+                                             CreationTime=datetime.now(timezone.utc))
+            self._polls[name] = 0
+        arn = f"arn:aws:sagemaker:local:000000000000:transform-job/{name.lower()}"
+        return {"TransformJobArn": arn}
+
+    def describe_model(self, ModelName: str) -> Dict:
+        """Describes any named model; the fake holds no model registry."""
+        self._log("DescribeModel")
+        if not ModelName:
+            raise clientError("ValidationException", "Could not find model",
+                              "DescribeModel")
+        arn = f"arn:aws:sagemaker:local:000000000000:model/{ModelName.lower()}"
+        return {"ModelName": ModelName, "ModelArn": arn,
+                "CreationTime": datetime.now(timezone.utc)}
+
+    def describe_transform_job(self, TransformJobName: str) -> Dict:
+        with self._lock:
+            job = self.transform_jobs.get(TransformJobName)
+            if job is None:
+                raise clientError("ValidationException",
+                                  f"Could not find job {TransformJobName}",
+                                  "DescribeTransformJob")
+            self._polls[TransformJobName] += 1
+            done = self._polls[TransformJobName] > self.polls_until_complete
+            response = dict(job)
+        response["TransformJobStatus"] = job.get(
+            "ForcedStatus", "Completed" if done else "InProgress")
+        return response
+
+
+def naiveForecast(instance: Dict, prediction_length: int,
+                  quantiles: List[str]) -> Dict:
+    """Forecast in DeepAR's response shape: the last observed value as the
+    mean, spread by the target's standard deviation for the quantiles."""
+    values = [float(v) for v in instance.get("target", [])
+              if v != "NaN" and v is not None]
+    last = values[-1] if values else 0.0
+    mean = sum(values) / len(values) if values else 0.0
+    spread = (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5 if values else 0.0
+    return {
+        "mean": [last] * prediction_length,
+        "quantiles": {q: [last + (float(q) - 0.5) * 2.56 * spread] * prediction_length
+                      for q in quantiles},
+    }
+
+
+def runTransformJobs(s3: "FakeS3", sagemaker: "FakeSageMaker",
+                     prediction_length: int = 24,
+                     quantiles: Optional[List[str]] = None) -> int:
+    """Writes naive forecasts for every transform job submitted to the fake
+    SageMaker, laid out as batch transform does: one line per input line
+    in <S3OutputPath>/<input file>.out. Returns the files written."""
+    import gzip
+
+    quantiles = quantiles or ["0.1", "0.5", "0.9"]
+    written = 0
+    for request in list(sagemaker.requests):
+        source = request["TransformInput"]["DataSource"]["S3DataSource"]["S3Uri"]
+        bucket, prefix = source.split("/", 3)[2], source.split("/", 3)[3]
+        output = request["TransformOutput"]["S3OutputPath"]
+        output = output if output.endswith("/") else output + "/"
+        out_bucket, out_prefix = output.split("/", 3)[2], output.split("/", 3)[3]
+        for key in sorted(k for k in s3.buckets.get(bucket, {}) if k.startswith(prefix)):
+            body = s3.buckets[bucket][key]["Body"]
+            if request["TransformInput"].get("CompressionType") == "Gzip":
+                body = gzip.decompress(body)
+            lines = [json.dumps(naiveForecast(json.loads(line), prediction_length, quantiles))
+                     for line in body.decode("utf-8").splitlines() if line.strip()]
+            name = key[len(prefix):] if prefix.endswith("/") else key.rsplit("/", 1)[-1]
+            s3.put_object(Bucket=out_bucket, Key=out_prefix + name + ".out",
+                          Body="".join(line + "\n" for line in lines))
+            written += 1
+    return written
+
+
+class FakeSageMakerRuntime:
+    """In-process sagemaker-runtime client answering invoke_endpoint with
+    DeepAR-shaped naive forecasts."""
+
+    def __init__(self, prediction_length: int = 24):
+        self.prediction_length = prediction_length
+        self.requests: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def invoke_endpoint(self, EndpointName: str, Body, ContentType: str = None,
+                        Accept: str = None, **kwargs) -> Dict:
+        request = json.loads(Body)
+        with self._lock:
+            self.requests.append({"EndpointName": EndpointName,
+                                  "Instances": len(request["instances"])})
+        configuration = request.get("configuration", {})
+        length = int(configuration.get("prediction_length", self.prediction_length))
+        quantiles = configuration.get("quantiles", ["0.1", "0.5", "0.9"])
+        body = json.dumps({"predictions": [naiveForecast(i, length, quantiles)
+                                           for i in request["instances"]]})
+        return {"Body": io.BytesIO(body.encode("utf-8")),
+                "ContentType": "application/json"}
+
+
+class DeepARStandIn:
+    """Local HTTP server mimicking the DeepAR inference container API
+    (GET /ping, POST /invocations).
+
+    Each invocation waits latency_ms (plus up to jitter_ms) and fails with
+    a 500 at error_rate, so load tests can run without an endpoint."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 prediction_length: int = 24, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0):
+        self.host, self.port = host, port
+        self.prediction_length = prediction_length
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate = error_rate
+        self.invocations = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}/invocations".format(self.host, self.port)
+
+    def _respond(self, body: bytes):
+        with self._lock:
+            self.invocations += 1
+            delay = self.latency_ms + self._random.random() * self.jitter_ms
+            failed = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if failed:
+            return 500, {"message": "Injected model error"}
+        try:
+            request = json.loads(body)
+            configuration = request.get("configuration", {})
+            length = int(configuration.get("prediction_length", self.prediction_length))
+            quantiles = configuration.get("quantiles", ["0.1", "0.5", "0.9"])
+            return 200, {"predictions": [naiveForecast(i, length, quantiles)
+                                         for i in request["instances"]]}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"message": "Unable to parse request: {}".format(e)}
+
+    def start(self) -> "DeepARStandIn":
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/ping":
+                    self._send(200, {})
+                else:
+                    self._send(404, {"message": "Not found"})
+
+            def do_POST(self):
+                if self.path != "/invocations":
+                    self._send(404, {"message": "Not found"})
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._send(*stand_in._respond(body))
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "DeepARStandIn":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,175 @@
+"""Data-time index of the raw CSV objects.
+
+The manifest maps each object key to its ETag, size and the epoch hours
+[first, last] its rows cover, and keeps a day -> keys index, so the
+objects of any window are found without listing the prefix and by the
+time of the data rather than its upload time.
+"""
+import io
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from utils.ingest import (DEFAULT_MAX_IN_FLIGHT_BYTES, DEFAULT_MAX_WORKERS,
+                          csvHeader, listObjects, readObjects)
+from utils.timestamps import epochHours, parseWallClock
+
+MANIFEST_VERSION = 1
+HOURS_PER_DAY = 24
+
+
+class KeyManifest:
+    """Object key -> (ETag, size, first hour, last hour), indexed by day."""
+
+    def __init__(self, timestamp_column: str, prefix: str = ""):
+        self.timestamp_column = timestamp_column
+        self.prefix = prefix
+        self.objects: Dict[str, Dict] = {}
+        self.days: Dict[int, set] = {}
+        self.updated: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def add(self, key: str, etag: str, size: int, first_hour: int,
+            last_hour: int):
+        """Adds or replaces the entry for a key."""
+        self.remove(key)
+        self.objects[key] = {"ETag": etag, "Size": int(size),
+                             "FirstHour": int(first_hour),
+                             "LastHour": int(last_hour)}
+        for day in range(first_hour // HOURS_PER_DAY,
+                         last_hour // HOURS_PER_DAY + 1):
+            self.days.setdefault(day, set()).add(key)
+
+    def remove(self, key: str):
+        entry = self.objects.pop(key, None)
+        if entry is None:
+            return
+        for day in range(entry["FirstHour"] // HOURS_PER_DAY,
+                         entry["LastHour"] // HOURS_PER_DAY + 1):
+            keys = self.days.get(day)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.days[day]
+
+    def select(self, first_hour: int, last_hour: int) -> List[Dict]:
+        """Objects with rows inside [first_hour, last_hour], in key order.
+
+        Only the window's days are visited; each entry carries Key, ETag,
+        Size and its hour range."""
+        keys = set()
+        for day in range(first_hour // HOURS_PER_DAY,
+                         last_hour // HOURS_PER_DAY + 1):
+            keys.update(self.days.get(day, ()))
+        selected = []
+        for key in sorted(keys):
+            entry = self.objects[key]
+            if entry["LastHour"] >= first_hour and entry["FirstHour"] <= last_hour:
+                selected.append(dict(entry, Key=key))
+        return selected
+
+    def dumps(self) -> bytes:
+        return json.dumps({
+            "version": MANIFEST_VERSION,
+            "timestamp_column": self.timestamp_column,
+            "prefix": self.prefix,
+            "updated": self.updated,
+            "objects": {k: [e["ETag"], e["Size"], e["FirstHour"], e["LastHour"]]
+                        for k, e in sorted(self.objects.items())},
+        }).encode("utf-8")
+
+    @classmethod
+    def loads(cls, payload: bytes) -> "KeyManifest":
+        data = json.loads(payload)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError("Unsupported key manifest version")
+        manifest = cls(data["timestamp_column"], data.get("prefix", ""))
+        manifest.updated = data.get("updated")
+        for key, (etag, size, first, last) in data["objects"].items():
+            manifest.add(key, etag, size, first, last)
+        return manifest
+
+
+def loadManifest(s3, bucket: str, key: str,
+                 timestamp_column: str) -> KeyManifest:
+    """Loads a manifest, or returns an empty one when none exists."""
+    try:
+        payload = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return KeyManifest(timestamp_column)
+    return KeyManifest.loads(payload)
+
+
+def saveManifest(s3, bucket: str, key: str, manifest: KeyManifest):
+    manifest.updated = datetime.now(timezone.utc).isoformat()
+    s3.put_object(Bucket=bucket, Key=key, Body=manifest.dumps())
+
+
+def timestampHourRange(body, timestamp_column: str, normalize=None):
+    """(first, last) epoch hour of a CSV's timestamp column, parsing only
+    that column. Returns None when the object has no rows."""
+    normalize = normalize or (lambda name: name)
+    data = body.read()
+    usecols = [c for c in csvHeader(data) if normalize(c) == timestamp_column]
+    if not usecols:
+        return None
+    values = pd.read_csv(io.BytesIO(data), usecols=usecols).iloc[:, 0].dropna()
+    if values.empty:
+        return None
+    hours = epochHours(parseWallClock(values))
+    return int(hours.min()), int(hours.max())
+
+
+def updateManifest(s3, bucket: str, prefix: str, manifest: KeyManifest,
+                   objects: Optional[Iterable[Dict]] = None,
+                   max_workers: int = DEFAULT_MAX_WORKERS,
+                   max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+                   prune: bool = True) -> Dict[str, int]:
+    """Brings the manifest up to date with the objects under prefix.
+
+    Only new objects and objects whose ETag changed are downloaded, and
+    only their timestamp column is parsed. objects, when given (e.g. from
+    S3 event notifications), replaces the listing and nothing is pruned;
+    otherwise keys no longer listed are removed when prune is set."""
+    from utils.preprocessing import columnNameReformat
+
+    listed = objects is None
+    objects = list(listObjects(s3, bucket, prefix) if listed else objects)
+    stale = [o for o in objects
+             if manifest.objects.get(o["Key"], {}).get("ETag") != o.get("ETag")]
+    ranges = readObjects(
+        s3, bucket, stale,
+        parse=lambda body: timestampHourRange(
+            body, manifest.timestamp_column, columnNameReformat),
+        max_workers=max_workers, max_in_flight_bytes=max_in_flight_bytes)
+
+    counts = {"added": 0, "changed": 0, "removed": 0, "empty": 0}
+    for o, hours in zip(stale, ranges):
+        counts["changed" if o["Key"] in manifest.objects else "added"] += 1
+        if hours is None:
+            manifest.remove(o["Key"])
+            counts["empty"] += 1
+            continue
+        manifest.add(o["Key"], o.get("ETag"), o.get("Size", 0), *hours)
+    if listed and prune:
+        present = {o["Key"] for o in objects}
+        for key in [k for k in manifest.objects if k not in present]:
+            manifest.remove(key)
+            counts["removed"] += 1
+    manifest.prefix = prefix
+    return counts
+
+
+def trimToHours(df: pd.DataFrame, timestamp_column: str, first_hour: int,
+                last_hour: int) -> pd.DataFrame:
+    """Keeps the rows of a cleaned raw frame inside [first_hour, last_hour]."""
+    hours = epochHours(parseWallClock(df[timestamp_column]))
+    inside = (hours >= first_hour) & (hours <= last_hour)
+    return df if inside.all() else df[inside]
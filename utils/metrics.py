@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+EMF_NAMESPACE = "WeatherForecast/Pipeline"
+
+# Units for the per-stage counters emitted in Embedded Metric Format
+METRIC_UNITS = {
+    "duration_ms": "Milliseconds",
+    "bytes_read": "Bytes",
+    "bytes_written": "Bytes",
+    "objects_listed": "Count",
+    "objects_fetched": "Count",
+    "cache_hits": "Count",
+    "rows_in": "Count",
+    "rows_out": "Count",
+    "requests": "Count",
+    "peak_rss_mb": "Megabytes",
+}
+
+
+def peakRssMB() -> float:
+    """High-water mark of the process resident set size in megabytes."""
+    if resource is None:
+        return 0.0
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class IOStats(dict):
+    """Thread-safe counters shared by the ingest workers of one stage."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value=1):
+        with self._lock:
+            self[name] = self.get(name, 0) + value
+
+
+class StageTimer:
+    """Accumulates wall-clock durations and counters for named pipeline
+    stages."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self.stages: Dict[str, Dict] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a stage; the yielded dict collects its counters."""
+        counters = self.stages.setdefault(name, IOStats())
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            elapsed = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+            counters["duration_ms"] = round(self.durations[name] * 1000, 3)
+            counters["peak_rss_mb"] = round(peakRssMB(), 1)
+
+    def summary(self) -> Dict[str, float]:
+        """Durations in milliseconds, rounded for logging and responses."""
+        return {k: round(v * 1000, 3) for k, v in self.durations.items()}
+
+
+def emfRecord(timer: StageTimer, dimensions: Dict[str, str],
+              properties: Dict = None, namespace: str = EMF_NAMESPACE) -> Dict:
+    """Builds one CloudWatch Embedded Metric Format record holding every
+    stage's counters as <stage>.<counter> metrics."""
+    record = dict(properties or {})
+    record.update(dimensions)
+    metrics: List[Dict] = []
+    for stage, counters in timer.stages.items():
+        for counter, value in counters.items():
+            if counter not in METRIC_UNITS:
+                continue
+            name = f"{stage}.{counter}"
+            record[name] = value
+            metrics.append({"Name": name, "Unit": METRIC_UNITS[counter]})
+    record["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace,
+            "Dimensions": [list(dimensions)],
+            "Metrics": metrics,
+        }],
+    }
+    return record
+
+
+def emitMetrics(timer: StageTimer, dimensions: Dict[str, str],
+                properties: Dict = None, namespace: str = EMF_NAMESPACE) -> Dict:
+    """Prints the run's EMF record to stdout, where Lambda ships it to
+    CloudWatch Logs and CloudWatch extracts the metrics."""
+    record = emfRecord(timer, dimensions, properties, namespace)
+    print(json.dumps(record, default=str))
+    return record
@@ -0,0 +1,99 @@
+"""Online inference against a DeepAR real-time endpoint.
+
+Serving records are packed into micro-batches bounded by instance count
+and payload size, sent concurrently, and the forecasts are returned one
+JSON line per record in input order: the layout batch transform writes
+to <forecast prefix>/<input file>.out.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+MB = 1024 * 1024
+# Real-time endpoints reject request bodies above 6MB
+MAX_REQUEST_BYTES = 6 * MB
+DEFAULT_CONFIGURATION = {"num_samples": 100,
+                         "output_types": ["mean", "quantiles"],
+                         "quantiles": ["0.1", "0.5", "0.9"]}
+
+
+def sagemakerInvoker(runtime_client, endpoint_name: str) -> Callable[[bytes], bytes]:
+    """Invokes a SageMaker endpoint through the sagemaker-runtime client."""
+    def invoke(body: bytes) -> bytes:
+        response = runtime_client.invoke_endpoint(
+            EndpointName=endpoint_name, ContentType="application/json",
+            Accept="application/json", Body=body)
+        return response["Body"].read()
+    return invoke
+
+
+def httpInvoker(url: str, timeout: float = 60) -> Callable[[bytes], bytes]:
+    """POSTs to a container-style /invocations URL."""
+    from urllib.request import Request, urlopen
+
+    def invoke(body: bytes) -> bytes:
+        request = Request(url, data=body, method="POST",
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=timeout) as response:
+            return response.read()
+    return invoke
+
+
+def microBatches(record_sizes: Sequence[int], max_instances: int,
+                 max_bytes: int = MAX_REQUEST_BYTES) -> List[List[int]]:
+    """Splits records, in order, into batches of at most max_instances
+    records and max_bytes of instance payload."""
+    batches, batch, size = [], [], 0
+    for i, record_size in enumerate(record_sizes):
+        if record_size > max_bytes:
+            raise ValueError(
+                f"Serving record {i} of {record_size} bytes exceeds the {max_bytes} byte request limit")
+        if batch and (len(batch) >= max_instances or size + record_size > max_bytes):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(i)
+        size += record_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _invokeWithRetry(invoke, body: bytes, attempts: int, backoff: float) -> bytes:
+    for attempt in range(attempts):
+        try:
+            return invoke(body)
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            print("Endpoint request failed ({}), retrying".format(e))
+            time.sleep(backoff * 2 ** attempt)
+
+
+def forecastOnline(invoke: Callable[[bytes], bytes], records: Sequence[str],
+                   max_instances: int = 20, max_bytes: int = MAX_REQUEST_BYTES,
+                   concurrency: int = 4, configuration: Optional[Dict] = None,
+                   attempts: int = 3, backoff: float = 0.5,
+                   stats=None) -> List[str]:
+    """Forecasts every serving record through the endpoint.
+
+    Returns one JSON prediction line per record, in record order. stats,
+    an IOStats, accumulates requests and bytes sent."""
+    configuration = json.dumps(configuration or DEFAULT_CONFIGURATION)
+    batches = microBatches([len(r) + 2 for r in records], max_instances, max_bytes)
+
+    def send(batch):
+        body = ('{"instances": [' + ", ".join(records[i] for i in batch)
+                + '], "configuration": ' + configuration + "}").encode("utf-8")
+        predictions = json.loads(_invokeWithRetry(invoke, body, attempts, backoff))["predictions"]
+        if len(predictions) != len(batch):
+            raise ValueError("Endpoint returned {} predictions for {} instances".format(
+                len(predictions), len(batch)))
+        if stats is not None:
+            stats.add("requests")
+            stats.add("bytes_written", len(body))
+        return [json.dumps(p) for p in predictions]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+        results = list(pool.map(send, batches))
+    return [line for lines in results for line in lines]
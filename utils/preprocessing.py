@@ -1,9 +1,18 @@
 import pandas as pd
 import numpy as np
-import json
-import boto3
 from typing import Dict, List
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from utils.clients import getClient
+from utils.chunked import PARSE_EXPANSION, groupObjects
+from utils.columnar import listPartitions, readParquetFrames, windowHours
+from utils.manifest import loadManifest, trimToHours
+from utils.rawjson import electricityChunks, weatherChunks
+from utils.ingest import (DEFAULT_MAX_IN_FLIGHT_BYTES, DEFAULT_MAX_WORKERS,
+                          listObjects, readCsvFrames)
+from utils.serialization import deepARRecord, encodeRecord, writeLines
+from utils.upload import uploadStream
+from utils.timestamps import (epochHours, formatTimestamps, hourlyRange, parseIsoOffset,
+                              parseUtc, parseWallClock, roundUpHours)
 
 
 def columnNameReformat(column_name: str, target_name: str = None) -> str:
@@ -55,8 +64,7 @@ def preprocessElectricHourlyDemandJSON(data):
 
     # transform the timestamp from UTC (e.g. '2024-03-01T00') formatting to
     #  "%Y-%m-%d %H:%M:%S"
-    pivot_df.period = pivot_df.period.apply(
-        lambda x: pd.to_datetime(x, utc=True).strftime("%Y-%m-%d %H:%M:%S"))
+    pivot_df.period = formatTimestamps(parseUtc(pivot_df.period))
 
     # apply some final cleaning/preparation
     pivot_df = pivot_df.sort_values(by='period')
@@ -67,13 +75,19 @@ def preprocessElectricHourlyDemandJSON(data):
     return pivot_df
 
 
-def cleanRawWeatherJSON(raw_json, weather_station_url: str = "https://api.weather.gov/stations/KCVG"):
+def cleanRawWeatherJSON(raw_json, weather_station_url="https://api.weather.gov/stations/KCVG"):
     """
     Cleans the raw JSON object into a DataFrame.
+
+    weather_station_url may be a single station URL, a list of them, or
+    None to keep every station.
     """
-    # Normalize the JSON and filter by the specified weather station URL
+    # Normalize the JSON and filter by the specified weather station URL(s)
     df = pd.json_normalize(raw_json, record_path="features")
-    df = df[df["properties.station"] == weather_station_url]
+    if isinstance(weather_station_url, str):
+        df = df[df["properties.station"] == weather_station_url]
+    elif weather_station_url is not None:
+        df = df[df["properties.station"].isin(weather_station_url)]
 
     # Set the index to the timestamp and sort the DataFrame
     df.index = df["properties.timestamp"]
@@ -87,6 +101,55 @@ def cleanRawWeatherJSON(raw_json, weather_station_url: str = "https://api.weathe
     return df
 
 
+def weatherFrameFromJSON(source, features, stations=None, feature_dtype="float32",
+                         chunk_rows=None) -> pd.DataFrame:
+    """Streams a raw weather.gov observations payload (bytes, a file object
+    or an S3 body) into the frame getPreprocessedWeatherData returns.
+
+    Observations of other stations and other fields are dropped while the
+    payload is parsed; stations may be a station URL or a list of them."""
+    options = {"chunk_rows": chunk_rows} if chunk_rows else {}
+    df_list = list(weatherChunks(source, features, columnNameReformat, stations,
+                                 dtype=feature_dtype, **options))
+    if not df_list:
+        return emptyTimestampFrame()
+    df = combineFrames(df_list, ["station"])
+    df['timestamp'] = formatTimestamps(roundUpHours(parseWallClock(df['timestamp'])))
+    df.set_index('timestamp', inplace=True)
+    return df
+
+
+def electricityFrameFromJSON(source, respondents=None, features=None,
+                             feature_dtype="float32", chunk_rows=None) -> pd.DataFrame:
+    """Streams a raw EIA hourly demand payload into the columns
+    preprocessElectricHourlyDemandJSON returns, indexed by timestamp as
+    getPreprocessedElectricityData is, keeping only the given respondents
+    and value columns (every one when None).
+
+    Rows are parsed into compact long-format chunks and pivoted once at the
+    end; a repeated (period, respondent, type) keeps its last value."""
+    options = {"chunk_rows": chunk_rows} if chunk_rows else {}
+    df_list = list(electricityChunks(source, respondents, features,
+                                     dtype=feature_dtype, **options))
+    if not df_list:
+        return emptyTimestampFrame()
+    long_df = pd.concat(df_list, ignore_index=True)
+    keys = ['period', 'respondent', 'value_units']
+    long_df.drop_duplicates(subset=keys + ['column'], keep='last', inplace=True)
+    pivot_df = long_df.pivot(index=keys, columns='column', values='value')
+    pivot_df.columns = list(pivot_df.columns)
+    pivot_df = pivot_df.reset_index()
+    for column in ['respondent', 'value_units']:
+        pivot_df[column] = pivot_df[column].astype("category")
+
+    # UTC periods (e.g. '2024-03-01T00') to "%Y-%m-%d %H:%M:%S"
+    pivot_df.period = formatTimestamps(parseUtc(pivot_df.period))
+    pivot_df = pivot_df.sort_values(by='period', kind='stable')
+    pivot_df.index = pivot_df.period
+    pivot_df.index.name = 'timestamp'
+    return pivot_df.drop('period', axis=1)
+
+
 def preprocessQuant(feature) -> np.array:
     """Processes a quantiative feature for input to an ML algorithm"""
     x = np.array(feature)
@@ -117,20 +180,14 @@ def getStartString(
 
 def preprocessWeatherDataFrame(df: pd.DataFrame) -> pd.DataFrame:
     """Processes the dataframe."""
-    stp = df["properties.timestamp"].apply(
-        lambda x: datetime.strptime(x, "%Y-%m-%dT%H:%M:%S%z")
-    )
-    df.index = stp
+    df.index = parseIsoOffset(df["properties.timestamp"])
     df.sort_index(inplace=True)
     df.index.name = "timestamp"
     return df
 
 
 def writeDictsToFile(path, data):
-    with open(path, "wb") as fp:
-        for d in data:
-            fp.write(json.dumps(d).encode("utf-8"))
-            fp.write("\n".encode("utf-8"))
+    writeLines(path, (encodeRecord(d) for d in data))
 
 
 def seriesToObj(ts, feature_name=None, cat=None):
@@ -141,69 +198,226 @@ def seriesToObj(ts, feature_name=None, cat=None):
 
 
 def seriesToJSONline(ts, feature_name=None, cat=None):
-    return json.dumps(seriesToObj(ts, feature_name, cat))
+    return deepARRecord(str(ts.index[0]), ts.to_numpy(), cat=cat,
+                        target_key=feature_name)
 
 
 def dictToSeries(time_dict: dict) -> pd.Series:
     "Translates a dictionary to a time series using a pandas series data type."
-    time_index = pd.date_range(
-        start=time_dict["start"], periods=len(list(time_dict.values())[1]),
-        freq="H"
-    )
-    time_index = [x.strftime("%Y-%m-%d %H:%M:%S") for x in time_index]
+    time_index = formatTimestamps(hourlyRange(
+        time_dict["start"], len(list(time_dict.values())[1])))
     return pd.Series(data=list(time_dict.values())[1], index=time_index)
 
 
-def getPreprocessedWeatherData(s3, bucket, prefix, today, lag_days):
-    objects = s3.list_objects(Bucket=bucket, Prefix=prefix)
-    df_list = []
-    for o in objects["Contents"]:
-        if o["LastModified"] <= today and o["LastModified"] >= lag_days:
-            obj = s3.get_object(Bucket=bucket, Key=o["Key"])
-            df_list.append(pd.read_csv(obj["Body"]))
-    df = pd.concat(df_list).drop_duplicates().reset_index()
+def reformatFrameColumns(df: pd.DataFrame) -> pd.DataFrame:
+    """Applies columnNameReformat to every column of a parsed frame."""
     df.columns = [columnNameReformat(x) for x in df.columns]
-    df.timestamp = df.timestamp.apply(lambda x: roundUpHour(x))
-    df.index = df.timestamp
-    df.drop(['index', 'timestamp'], axis=1, inplace=True)
     return df
-    
-def getPreprocessedElectricityData(s3, bucket, prefix, today, lag_days):
-    objects = s3.list_objects(Bucket=bucket, Prefix=prefix)
-    df_list = []
-    for o in objects["Contents"]:
-        if o["LastModified"] <= today and o["LastModified"] >= lag_days:
-            obj = s3.get_object(Bucket=bucket, Key=o["Key"])
-            df_list.append(pd.read_csv(obj["Body"]))
-
-    df = pd.concat(df_list).drop_duplicates().reset_index()
-    df.columns = [columnNameReformat(
-        x) for x in df.columns]
+
+
+def emptyTimestampFrame() -> pd.DataFrame:
+    """Frame returned by the loaders when no object falls in the window."""
+    return pd.DataFrame(index=pd.Index([], name="timestamp", dtype=object))
+
+
+def projectionOptions(timestamp_column: str, features=None, categories=None,
+                      feature_dtype=None) -> Dict:
+    """readCsvFrames options parsing only the timestamp, features and
+    categorical columns, with features read as feature_dtype.
+
+    The projection is part of the cache variant, so partitions cached with
+    other columns or dtypes are not reused."""
+    if features is None:
+        return {}
+    columns = [timestamp_column] + list(features) + list(categories or [])
+    dtypes = {f: feature_dtype for f in features} if feature_dtype else None
+    return {
+        "columns": columns,
+        "dtypes": dtypes,
+        "normalize": columnNameReformat,
+        "cache_variant": "cols={};dtype={}".format(",".join(columns), feature_dtype),
+    }
+
+
+def combineFrames(df_list: List[pd.DataFrame], categories=None) -> pd.DataFrame:
+    """Concatenates parsed partitions and drops duplicate rows in place,
+    without building an intermediate index. categories are converted to
+    categoricals once the partitions are combined."""
+    df = pd.concat(df_list, ignore_index=True)
+    df.drop_duplicates(inplace=True, ignore_index=True)
+    for column in categories or []:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def loadRawFrames(s3, bucket, prefix, today, lag_days, timestamp_column,
+                  max_workers=DEFAULT_MAX_WORKERS,
+                  max_in_flight_bytes=DEFAULT_MAX_IN_FLIGHT_BYTES,
+                  cache=None, stats=None, features=None, categories=None,
+                  feature_dtype=None, columnar_prefix=None, manifest_key=None):
+    """Reads the raw partitions of the window with cleaned column names.
+
+    With columnar_prefix, rows are read from the compacted Parquet
+    partitions by data time. With manifest_key, the CSVs covering the
+    window are looked up in the bucket's key manifest by data time and the
+    rows outside it are dropped. Otherwise the CSVs are selected by
+    LastModified."""
+    return next(loadRawFrameChunks(
+        s3, bucket, prefix, today, lag_days, timestamp_column, None,
+        max_workers=max_workers, max_in_flight_bytes=max_in_flight_bytes,
+        cache=cache, stats=stats, features=features, categories=categories,
+        feature_dtype=feature_dtype, columnar_prefix=columnar_prefix,
+        manifest_key=manifest_key), [])
+
+
+def loadRawFrameChunks(s3, bucket, prefix, today, lag_days, timestamp_column,
+                       chunk_bytes, max_workers=DEFAULT_MAX_WORKERS,
+                       max_in_flight_bytes=DEFAULT_MAX_IN_FLIGHT_BYTES,
+                       cache=None, stats=None, features=None, categories=None,
+                       feature_dtype=None, columnar_prefix=None, manifest_key=None):
+    """Yields the frames of the window as loadRawFrames reads them, one
+    time-ordered chunk of objects at a time (see utils/chunked.py).
+
+    Each chunk's objects take at most chunk_bytes once expanded; None reads
+    the whole window as a single chunk."""
+    options = projectionOptions(timestamp_column, features, categories,
+                                feature_dtype)
+    if chunk_bytes is not None:
+        max_in_flight_bytes = min(max_in_flight_bytes, chunk_bytes)
+    limits = {"max_workers": max_workers,
+              "max_in_flight_bytes": max_in_flight_bytes,
+              "cache": cache, "stats": stats}
+    if columnar_prefix:
+        first_hour, last_hour = windowHours(today, lag_days)
+        parquet = {"columns": options.get("columns"), "dtypes": options.get("dtypes"),
+                   "cache_variant": options.get("cache_variant", "")}
+        if chunk_bytes is None:
+            yield readParquetFrames(s3, bucket, columnar_prefix, first_hour,
+                                    last_hour, **parquet, **limits)
+            return
+        partitions = listPartitions(s3, bucket, columnar_prefix, first_hour, last_hour)
+        for group in groupObjects(partitions, chunk_bytes, PARSE_EXPANSION["parquet"]):
+            # Each run of days is read with its own hour bounds
+            group_first = max(first_hour, epochHours([group[0]["Day"] + " 00:00:00"])[0])
+            group_last = min(last_hour, epochHours([group[-1]["Day"] + " 23:00:00"])[0])
+            yield readParquetFrames(s3, bucket, columnar_prefix, group_first,
+                                    group_last, **parquet, **limits)
+        return
+    if manifest_key:
+        manifest = loadManifest(s3, bucket, manifest_key, timestamp_column)
+        if len(manifest):
+            first_hour, last_hour = windowHours(today, lag_days)
+            selected = manifest.select(first_hour, last_hour)
+            groups = [selected] if chunk_bytes is None else groupObjects(selected, chunk_bytes)
+            for objects in groups:
+                df_list = readCsvFrames(s3, bucket, prefix, today, lag_days,
+                                        transform=reformatFrameColumns,
+                                        objects=objects, **limits, **options)
+                yield [df if o["FirstHour"] >= first_hour and o["LastHour"] <= last_hour
+                       else trimToHours(df, timestamp_column, first_hour, last_hour)
+                       for o, df in zip(objects, df_list)]
+            return
+        print("Key manifest s3://{}/{} is empty, listing the prefix".format(
+            bucket, manifest_key))
+    if chunk_bytes is None:
+        yield readCsvFrames(s3, bucket, prefix, today, lag_days,
+                            transform=reformatFrameColumns, **limits, **options)
+        return
+    # Keys are date partitioned, so key order is time order
+    listed = sorted(listObjects(s3, bucket, prefix, today, lag_days), key=lambda o: o["Key"])
+    for objects in groupObjects(listed, chunk_bytes):
+        yield readCsvFrames(s3, bucket, prefix, today, lag_days,
+                            transform=reformatFrameColumns, objects=objects,
+                            **limits, **options)
+
+
+def latestDataTime(s3, bucket, today, lag_days, timestamp_column,
+                   columnar_prefix=None, manifest_key=None, prefix=None):
+    """Start of the newest hour of data in [lag_days, today] by data time:
+    the end of the newest Parquet partition's day with columnar_prefix, or
+    the newest last hour in the key manifest with manifest_key (both read
+    from the index, no data is downloaded). With prefix, and no index (or an
+    empty key manifest), the newest LastModified of the CSVs under it, the time the CSV loader
+    selects by. None when no index or prefix is given or no data falls in
+    the window."""
+    first_hour, last_hour = windowHours(today, lag_days)
+    latest = None
+    if columnar_prefix:
+        partitions = listPartitions(s3, bucket, columnar_prefix, first_hour, last_hour)
+        if partitions:
+            latest = epochHours([partitions[-1]["Day"] + " 23:00:00"])[0]
+    elif manifest_key:
+        manifest = loadManifest(s3, bucket, manifest_key, timestamp_column)
+        if len(manifest):
+            selected = manifest.select(first_hour, last_hour)
+            if selected:
+                latest = max(o["LastHour"] for o in selected)
+        elif prefix is not None:
+            # The loader lists the prefix when the manifest is empty
+            manifest_key = None
+    if prefix is not None and not columnar_prefix and not manifest_key:
+        return max((o["LastModified"] for o in listObjects(s3, bucket, prefix, today, lag_days)),
+                   default=None)
+    if latest is None:
+        return None
+    return datetime.fromtimestamp(int(latest) * 3600, timezone.utc)
+
+
+def _preprocessWeather(df_list, categories=None):
+    if not df_list:
+        return emptyTimestampFrame()
+    df = combineFrames(df_list, categories)
+    df['timestamp'] = formatTimestamps(roundUpHours(parseWallClock(df['timestamp'])))
+    df.set_index('timestamp', inplace=True)
+    return df
+
+
+def _preprocessElectricity(df_list, categories=None):
+    if not df_list:
+        return emptyTimestampFrame()
+    df = combineFrames(df_list, categories)
     df.rename(columns={'period': 'timestamp'}, inplace=True)
-    df.index = df.timestamp
-    df.drop(['index', 'timestamp'], axis=1, inplace=True)
+    df.set_index('timestamp', inplace=True)
     return df
 
+
+def getPreprocessedWeatherData(s3, bucket, prefix, today, lag_days,
+                               categories=None, **kwargs):
+    df_list = loadRawFrames(s3, bucket, prefix, today, lag_days, 'timestamp',
+                            categories=categories, **kwargs)
+    return _preprocessWeather(df_list, categories)
+
+
+def getPreprocessedElectricityData(s3, bucket, prefix, today, lag_days,
+                                   categories=None, **kwargs):
+    df_list = loadRawFrames(s3, bucket, prefix, today, lag_days, 'period',
+                            categories=categories, **kwargs)
+    return _preprocessElectricity(df_list, categories)
+
+
+def iterPreprocessedWeatherData(s3, bucket, prefix, today, lag_days, chunk_bytes,
+                                categories=None, **kwargs):
+    """getPreprocessedWeatherData's frame in time-ordered chunks of at most
+    chunk_bytes of expanded raw data."""
+    for df_list in loadRawFrameChunks(s3, bucket, prefix, today, lag_days, 'timestamp',
+                                      chunk_bytes, categories=categories, **kwargs):
+        yield _preprocessWeather(df_list, categories)
+
+
+def iterPreprocessedElectricityData(s3, bucket, prefix, today, lag_days, chunk_bytes,
+                                    categories=None, **kwargs):
+    """getPreprocessedElectricityData's frame in time-ordered chunks."""
+    for df_list in loadRawFrameChunks(s3, bucket, prefix, today, lag_days, 'period',
+                                      chunk_bytes, categories=categories, **kwargs):
+        yield _preprocessElectricity(df_list, categories)
+
+
 def copyToS3(local_file, s3_path, override=False):
-    s3 = boto3.resource("s3")
-    assert s3_path.startswith("s3://")
-    split = s3_path.split("/")
-    bucket = split[2]
-    path = "/".join(split[3:])
-    buk = s3.Bucket(bucket)
-    if len(list(buk.objects.filter(Prefix=path))) > 0:
-        if not override:
-            print(
-                "File s3://{}/{} already exists.\nSet override to upload anyway.\n".format(
-                    bucket, s3_path
-                )
-            )
-            return
-        else:
-            print("Overwriting existing file")
-    with open(local_file, "rb") as data:
-        print("Uploading file to {}".format(s3_path))
-        try:
-            buk.put_object(Key=path, Body=data)
-        except Exception as e:
-            print(f"could not put object to s3 {str(e)}")
+    """Uploads a local file, skipping it when the object exists (unless
+    override is set) or already holds the same content."""
+    try:
+        with open(local_file, "rb") as data:
+            uploadStream(getClient("s3"), s3_path, data, override=override)
+    except Exception as e:
+        print(f"could not put object to s3 {str(e)}")
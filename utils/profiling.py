@@ -0,0 +1,92 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Environment flags enabling the opt-in profilers
+CPU_PROFILE_ENV = "PROFILE_CPU"
+MEMORY_PROFILE_ENV = "PROFILE_MEMORY"
+PROFILE_DIR_ENV = "PROFILE_DIR"
+PROFILE_S3_URI_ENV = "PROFILE_S3_URI"
+DEFAULT_PROFILE_DIR = "/tmp/profiles"
+TOP_ALLOCATIONS = 50
+
+
+def _enabled(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _writeCpuProfile(profiler: cProfile.Profile, path: str) -> List[str]:
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+    with open(path + ".txt", "w") as f:
+        f.write(text.getvalue())
+    return [path, path + ".txt"]
+
+
+def _writeMemoryProfile(snapshot: tracemalloc.Snapshot, peak: int,
+                        path: str) -> List[str]:
+    with open(path, "w") as f:
+        f.write(f"peak traced memory: {peak / (1024 * 1024):.1f} MB\n")
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            f.write(f"{stat}\n")
+    return [path]
+
+
+def _upload(s3, paths: List[str], s3_uri: str):
+    assert s3_uri.startswith("s3://")
+    split = s3_uri.rstrip("/").split("/")
+    bucket = split[2]
+    prefix = "/".join(split[3:])
+    for path in paths:
+        key = "/".join(filter(None, [prefix, os.path.basename(path)]))
+        try:
+            with open(path, "rb") as data:
+                s3.put_object(Bucket=bucket, Key=key, Body=data)
+        except Exception as e:
+            print(f"could not put profile to s3 {str(e)}")
+
+
+@contextmanager
+def profiled(run_id: str, s3=None):
+    """Captures cProfile and/or tracemalloc output for the enclosed block
+    when PROFILE_CPU / PROFILE_MEMORY are set.
+
+    Profiles are written to PROFILE_DIR (default /tmp/profiles) and, when
+    PROFILE_S3_URI is set, uploaded there. The yielded dict receives the
+    written paths."""
+    cpu = _enabled(CPU_PROFILE_ENV)
+    memory = _enabled(MEMORY_PROFILE_ENV)
+    outputs: Dict[str, List[str]] = {}
+    if not cpu and not memory:
+        yield outputs
+        return
+
+    directory = os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield outputs
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            outputs["cpu"] = _writeCpuProfile(
+                profiler, os.path.join(directory, f"{run_id}.prof"))
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            outputs["memory"] = _writeMemoryProfile(
+                snapshot, peak, os.path.join(directory, f"{run_id}.mem.txt"))
+        s3_uri = os.environ.get(PROFILE_S3_URI_ENV)
+        if s3_uri and s3 is not None:
+            _upload(s3, [p for paths in outputs.values() for p in paths], s3_uri)
+        print("Profiles written: {}".format(outputs))
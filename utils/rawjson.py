@@ -0,0 +1,295 @@
+"""Incremental parsing of raw weather.gov and EIA API payloads.
+
+The payload is read a chunk at a time and only the array of records
+(weather.gov "features", EIA "response.data") is walked: each record is
+decoded with the C JSON scanner, a buffer's worth of complete records
+at a time, filtered on station or
+respondent and projected to the needed fields straight away, and the rows
+kept are emitted as compact columnar chunks (categorical labels, float32
+values). Memory holds one read chunk, one record and the output, never the
+whole document or a flattened copy of it.
+"""
+import codecs
+import json
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+READ_CHUNK_BYTES = 64 * 1024
+CHUNK_ROWS = 50000
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER = re.compile(r"[-+0-9.eE]*")
+_FIRST_KEY = re.compile(r'[ \t\n\r]*"(?:[^"\\]|\\.)*"')
+_DECODER = json.JSONDecoder()
+
+
+def _textChunks(source, chunk_size: int) -> Iterator[str]:
+    """Decoded text of bytes, str, a file object (such as an S3 body) or an
+    iterable of byte/str chunks."""
+    if isinstance(source, (bytes, bytearray, str)):
+        chunks = (source[i:i + chunk_size] for i in range(0, len(source), chunk_size))
+    elif hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), source.read(0))
+    else:
+        chunks = source
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        yield chunk if isinstance(chunk, str) else decoder.decode(bytes(chunk))
+    yield decoder.decode(b"", final=True)
+
+
+class JsonStream:
+    """Pull reader over JSON text arriving in chunks.
+
+    The buffer holds the unread text; values are decoded with raw_decode,
+    reading more (doubling the unread text) while a value is incomplete."""
+
+    def __init__(self, source, chunk_size: int = READ_CHUNK_BYTES):
+        self._chunks = _textChunks(source, chunk_size)
+        self.buf = ""
+        self.pos = 0
+        self._failed = None
+
+    def _more(self, want: int = 1) -> bool:
+        """Appends at least want characters; False once the text is exhausted."""
+        added = []
+        size = 0
+        while size < want:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            added.append(chunk)
+            size += len(chunk)
+        if not added:
+            return False
+        self.buf = self.buf[self.pos:] + "".join(added)
+        self.pos = 0
+        self._failed = None
+        return True
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or "" at the end."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected {!r} but found {!r}".format(char, found or "end of input"))
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next value."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more(max(1, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number running to the end of the buffer may continue in the next chunk
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and _NUMBER.match(self.buf, self.pos).end() == len(self.buf) and self._more()):
+                continue
+            self.pos = end
+            return value
+
+    def separator(self, close: str) -> bool:
+        """Consumes "," (True) or the closing bracket (False)."""
+        found = self.peek()
+        self.pos += 1
+        if found == close:
+            return False
+        if found != ",":
+            raise ValueError("Expected ',' or {!r} but found {!r}".format(close, found or "end of input"))
+        return True
+
+    def seek(self, path: Sequence[str]) -> bool:
+        """Moves to the value at the key path, walking nested objects.
+        False when a key is missing."""
+        for key in path:
+            self.expect("{")
+            if self.peek() == "}":
+                return False
+            while True:
+                name = self.value()
+                self.expect(":")
+                if name == key:
+                    break
+                # Values before the array (metadata, @context) are small and decoded whole
+                self.value()
+                if not self.separator("}"):
+                    return False
+        return True
+
+    def _boundary(self, end: int) -> Optional[str]:
+        """The text between the item ending at end and the first key of the
+        next one (such as '}, {"period"'), once both are in the buffer."""
+        if self.buf[end - 1] != "}":
+            return None
+        start = _WHITESPACE.match(self.buf, end).end()
+        if self.buf[start:start + 1] != ",":
+            return None
+        start = _WHITESPACE.match(self.buf, start + 1).end()
+        if self.buf[start:start + 1] != "{":
+            return None
+        key = _FIRST_KEY.match(self.buf, start + 1)
+        if key is None or key.end() == len(self.buf):
+            return None
+        return self.buf[end - 1:key.end()]
+
+    def _batch(self, boundary: str) -> Optional[list]:
+        """Decodes the complete items buffered before the last boundary with
+        one json.loads, or None when there are none or the boundary fell
+        inside an item (the bracketed run then does not parse)."""
+        cut = self.buf.rfind(boundary, self.pos)
+        if cut <= self.pos or cut == self._failed:
+            return None
+        try:
+            batch = json.loads("[" + self.buf[self.pos:cut + 1] + "]")
+        except json.JSONDecodeError:
+            self._failed = cut
+            return None
+        self.pos = cut + 1
+        return batch
+
+    def items(self) -> Iterator:
+        """Decodes the items of the array at the current position.
+
+        The first item is decoded alone to learn the text separating items;
+        after that every complete item up to the last separator in the
+        buffer is decoded in one call, falling back to one item at a time
+        around a separator that does not parse."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        boundary = None
+        while True:
+            batch = self._batch(boundary) if boundary else None
+            if batch is not None:
+                yield from batch
+            else:
+                yield self.value()
+                if boundary is None:
+                    boundary = self._boundary(self.pos)
+            if not self.separator("]"):
+                return
+
+
+def iterArray(source, path: Sequence[str], chunk_size: int = READ_CHUNK_BYTES) -> Iterator:
+    """Yields the items of the array at the key path of a JSON document,
+    one decoded item at a time. Yields nothing when the path is missing."""
+    stream = JsonStream(source, chunk_size)
+    if stream.seek(path):
+        yield from stream.items()
+
+
+def flattenedPaths(record: Dict, normalize: Callable[[str], str],
+                   prefix: str = "") -> Dict[str, Tuple[str, ...]]:
+    """Maps the normalized json_normalize column name of every leaf of a
+    nested record to its key path."""
+    paths = {}
+    for key, value in record.items():
+        name = prefix + key
+        if isinstance(value, dict) and value:
+            for column, path in flattenedPaths(value, normalize, name + ".").items():
+                paths[column] = (key,) + path
+        else:
+            paths[normalize(name)] = (key,)
+    return paths
+
+
+def _get(record: Dict, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def _chunkFrame(columns: Dict[str, List], labels: Sequence[str],
+                values: Sequence[str], dtype) -> pd.DataFrame:
+    frame = pd.DataFrame({name: pd.Categorical(columns[name]) if name in labels
+                          else np.array(columns[name], dtype=dtype if name in values else object)
+                          for name in columns})
+    for rows in columns.values():
+        rows.clear()
+    return frame
+
+
+def weatherChunks(source, features: Sequence[str], normalize: Callable[[str], str],
+                  stations: Optional[Iterable[str]] = None,
+                  chunk_rows: int = CHUNK_ROWS, dtype=np.float32,
+                  chunk_size: int = READ_CHUNK_BYTES) -> Iterator[pd.DataFrame]:
+    """Frames of timestamp, station and features from a weather.gov
+    observations payload (GeoJSON "features").
+
+    Features are json_normalize column names of the properties after
+    normalize (temperature_value for properties.temperature.value); values
+    are read as dtype, missing ones as NaN. stations, when given, keeps only
+    observations of those station URLs."""
+    keep = None if stations is None else set([stations] if isinstance(stations, str) else stations)
+    features = list(features)
+    paths: Dict[str, Tuple[str, ...]] = {}
+    columns = {name: [] for name in ["timestamp", "station"] + features}
+    for feature in iterArray(source, ["features"], chunk_size):
+        props = feature.get("properties") or {}
+        station = props.get("station")
+        if keep is not None and station not in keep:
+            continue
+        if len(paths) < len(features):
+            # Resolve feature paths from the first records that hold them
+            found = flattenedPaths(props, normalize, "properties.")
+            paths.update({f: found[f] for f in features if f in found})
+        columns["timestamp"].append(props.get("timestamp"))
+        columns["station"].append(station)
+        for f in features:
+            columns[f].append(_get(props, paths[f]) if f in paths else None)
+        if len(columns["timestamp"]) >= chunk_rows:
+            yield _chunkFrame(columns, ["station"], features, dtype)
+    if columns["timestamp"]:
+        yield _chunkFrame(columns, ["station"], features, dtype)
+
+
+def electricityChunks(source, respondents: Optional[Iterable[str]] = None,
+                      columns: Optional[Sequence[str]] = None,
+                      chunk_rows: int = CHUNK_ROWS, dtype=np.float32,
+                      chunk_size: int = READ_CHUNK_BYTES) -> Iterator[pd.DataFrame]:
+    """Long-format frames of period, respondent, value_units, column and
+    value from an EIA API v2 payload ("response.data").
+
+    column is the wide column each row pivots into (value_ plus the
+    cleaned type-name, value_demand for "Demand"). respondents and columns,
+    when given, keep only those respondents and columns."""
+    keep = None if respondents is None else set([respondents] if isinstance(respondents, str) else respondents)
+    wanted = None if columns is None else set(columns)
+    names: Dict[str, str] = {}
+    out = {name: [] for name in ["period", "respondent", "value_units", "column", "value"]}
+    for row in iterArray(source, ["response", "data"], chunk_size):
+        respondent = row.get("respondent")
+        if keep is not None and respondent not in keep:
+            continue
+        type_name = row.get("type-name")
+        column = names.get(type_name)
+        if column is None:
+            column = names[type_name] = ("value_" + str(type_name)).replace("-", "_").lower().strip()
+        if wanted is not None and column not in wanted:
+            continue
+        out["period"].append(row.get("period"))
+        out["respondent"].append(respondent)
+        out["value_units"].append(row.get("value-units"))
+        out["column"].append(column)
+        out["value"].append(row.get("value"))
+        if len(out["period"]) >= chunk_rows:
+            yield _chunkFrame(out, ["respondent", "value_units", "column"], ["value"], dtype)
+    if out["period"]:
+        yield _chunkFrame(out, ["respondent", "value_units", "column"], ["value"], dtype)
@@ -0,0 +1,131 @@
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.timestamps import formatTimestamps, hourlyRange
+
+DEEPAR_KEYS = ("start", "target", "cat", "dynamic_feat")
+NAN_TOKEN = '"NaN"'
+
+
+def formatNumbers(values) -> str:
+    """Formats a 1-d numeric array as a JSON array, matching json.dumps.
+
+    Non-finite floats are written as the DeepAR "NaN" string. float32
+    values are written with their shortest float32 repr (12.3, not
+    12.300000190734863)."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iub":
+        return "[" + ", ".join(map(str, arr.astype(np.int64).tolist())) + "]"
+    if arr.dtype == np.float32:
+        items = list(map(float.__repr__, map(float, arr.astype(str).tolist())))
+    else:
+        arr = arr.astype(np.float64, copy=False)
+        items = list(map(float.__repr__, arr.tolist()))
+    if not np.isfinite(arr).all():
+        for i in np.flatnonzero(~np.isfinite(arr)).tolist():
+            items[i] = NAN_TOKEN
+    return "[" + ", ".join(items) + "]"
+
+
+def floatDtype(dtypes) -> type:
+    """float32 when every column is float32, else float64."""
+    return np.float32 if all(d == np.float32 for d in dtypes) and len(dtypes) else np.float64
+
+
+def formatStart(start) -> str:
+    """Formats a series start timestamp the way the serving file expects."""
+    return formatTimestamps(hourlyRange(start, 1))[0]
+
+
+def deepARRecord(start, target, cat=None, dynamic_feat=None,
+                 target_key: str = "target") -> str:
+    """Builds one DeepAR JSON Lines record (without the newline)."""
+    if not isinstance(start, str):
+        start = formatStart(start)
+    parts = [
+        '"start": ' + json.dumps(start),
+        json.dumps("null" if target_key is None else target_key)
+        + ": " + formatNumbers(target),
+    ]
+    if cat is not None:
+        parts.append('"cat": ' + json.dumps(cat))
+    if dynamic_feat is not None:
+        parts.append('"dynamic_feat": ['
+                     + ", ".join(formatNumbers(f) for f in dynamic_feat) + "]")
+    return "{" + ", ".join(parts) + "}"
+
+
+def encodeRecord(d: Dict) -> str:
+    """Encodes a record dict, using the fast path for DeepAR-shaped dicts."""
+    if "start" in d and "target" in d and set(d) <= set(DEEPAR_KEYS):
+        return deepARRecord(d["start"], d["target"], d.get("cat"),
+                            d.get("dynamic_feat"))
+    return json.dumps(d)
+
+
+def frameRecords(X: pd.DataFrame, start=None, cat: Optional[List] = None,
+                 dynamic_feat=None, fill_nan: Optional[float] = 0.0) -> Iterator[str]:
+    """Yields one DeepAR record per column of a merged numeric frame.
+
+    Values are read straight from the frame's columns; NaNs are replaced
+    with fill_nan (as preprocessQuant does) unless fill_nan is None. cat,
+    when given, holds one category entry per column. An all-float32 frame
+    is serialized without widening to float64."""
+    if start is None:
+        start = X.index[0]
+    start = formatStart(start)
+    values = X.to_numpy(dtype=floatDtype(X.dtypes), copy=True)
+    if fill_nan is not None:
+        np.nan_to_num(values, copy=False, nan=fill_nan)
+    for i in range(values.shape[1]):
+        yield deepARRecord(start, values[:, i],
+                           cat=None if cat is None else cat[i],
+                           dynamic_feat=dynamic_feat)
+
+
+def writeLines(out, lines: Iterable[str], encoding: str = "utf-8") -> int:
+    """Streams records into a binary file object or a path, one per line.
+
+    Returns the number of bytes written."""
+    if isinstance(out, str):
+        with open(out, "wb") as fp:
+            return writeLines(fp, lines, encoding)
+    written = 0
+    for line in lines:
+        data = (line + "\n").encode(encoding)
+        out.write(data)
+        written += len(data)
+    return written
+
+
+def writeFrameRecords(out, X: pd.DataFrame, encoding: str = "utf-8",
+                      **kwargs) -> int:
+    """Writes a merged frame as DeepAR JSON Lines to a file, path or buffer."""
+    return writeLines(out, frameRecords(X, **kwargs), encoding)
+
+
+def frameToJSONLines(X: pd.DataFrame, encoding: str = "utf-8", **kwargs) -> bytes:
+    """Serializes a merged frame into an in-memory JSON Lines payload."""
+    buf = io.BytesIO()
+    writeFrameRecords(buf, X, encoding, **kwargs)
+    return buf.getvalue()
+
+
+def writeShards(lines: List[str], shards: List[List[int]], directory: str,
+                name_format: str = "part-{:05d}.json",
+                encoding: str = "utf-8") -> List[Dict]:
+    """Writes each shard's records to its own JSON Lines file.
+
+    Returns, per shard, the file path, byte size and record indices."""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for s, shard in enumerate(shards):
+        path = os.path.join(directory, name_format.format(s))
+        size = writeLines(path, (lines[i] for i in shard), encoding)
+        written.append({"path": path, "bytes": size, "series": list(shard)})
+    return written
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ISO_OFFSET_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def _toSeries(values) -> pd.Series:
+    if isinstance(values, pd.Series):
+        return values
+    return pd.Series(np.asarray(values, dtype=object))
+
+
+def parseWallClock(values) -> np.ndarray:
+    """Parses ISO timestamps into datetime64, keeping each value's local wall
+    clock time and ignoring any UTC offset (the behaviour of roundUpHour)."""
+    series = _toSeries(values)
+    if series.dtype.kind in "OUT":
+        # Values already in TIMESTAMP_FORMAT (the loaders' index) need no slicing
+        try:
+            return pd.to_datetime(series, format=TIMESTAMP_FORMAT).to_numpy(
+                dtype="datetime64[ns]")
+        except (ValueError, TypeError):
+            pass
+    wall = series.astype(str).str.slice(0, 19).str.replace(
+        "T", " ", regex=False)
+    try:
+        parsed = pd.to_datetime(wall, format=TIMESTAMP_FORMAT)
+    except ValueError:
+        parsed = pd.to_datetime(wall)
+    return parsed.to_numpy(dtype="datetime64[ns]")
+
+
+def parseUtc(values) -> np.ndarray:
+    """Parses timestamps and normalizes them to naive UTC datetime64."""
+    parsed = pd.to_datetime(_toSeries(values), utc=True)
+    return parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def parseIsoOffset(values) -> pd.DatetimeIndex:
+    """Parses '%Y-%m-%dT%H:%M:%S%z' timestamps into a tz-aware index.
+
+    Values sharing one offset keep it; mixed offsets are normalized to UTC."""
+    series = _toSeries(values)
+    try:
+        parsed = pd.to_datetime(series, format=ISO_OFFSET_FORMAT)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(series, format=ISO_OFFSET_FORMAT, utc=True)
+    if parsed.dtype == object:
+        parsed = pd.to_datetime(series, format=ISO_OFFSET_FORMAT, utc=True)
+    return pd.DatetimeIndex(parsed)
+
+
+def roundUpHours(values: np.ndarray) -> np.ndarray:
+    """Rounds each timestamp up to the next hour, as roundUpHour does: the
+    hour is always advanced, even for values already on the hour."""
+    hours = np.asarray(values, dtype="datetime64[ns]").astype("datetime64[h]")
+    return (hours + np.timedelta64(1, "h")).astype("datetime64[ns]")
+
+
+def hourlyRange(start, periods: int) -> np.ndarray:
+    """Builds a contiguous hourly datetime64 range from a start timestamp,
+    using the start's wall clock time when it is tz-aware."""
+    ts = pd.Timestamp(start)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    base = np.datetime64(ts.to_datetime64(), "ns")
+    return base + np.arange(periods) * np.timedelta64(1, "h")
+
+
+def formatTimestamps(values) -> np.ndarray:
+    """Formats datetime64 values as '%Y-%m-%d %H:%M:%S' strings."""
+    iso = np.datetime_as_string(
+        np.asarray(values, dtype="datetime64[ns]").astype("datetime64[s]"),
+        unit="s")
+    if not iso.size:
+        # np.char.replace fails on empty input with numpy 2
+        return iso.astype(object)
+    return np.char.replace(iso, "T", " ").astype(object)
+
+
+def _arrowHours(values):
+    """Epoch hours of '%Y-%m-%d %H:%M:%S' strings parsed by pyarrow, or None
+    when pyarrow is unavailable or any value is missing or formatted
+    otherwise."""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return None
+    try:
+        if isinstance(values, (pd.Index, pd.Series)):
+            array = pa.array(values.array)
+        else:
+            array = pa.array(np.asarray(values, dtype=object))
+        parsed = pc.strptime(array, format=TIMESTAMP_FORMAT, unit="s")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError):
+        return None
+    if parsed.null_count:
+        return None
+    return parsed.to_numpy(zero_copy_only=False).astype("datetime64[h]").astype(np.int64)
+
+
+def epochHours(values) -> np.ndarray:
+    """Converts timestamps (datetime64 or '%Y-%m-%d %H:%M:%S' strings) to
+    integer hours since the Unix epoch, truncating minutes and seconds.
+
+    Strings are parsed by pyarrow when available (the loaders' timestamp
+    index is parsed several times a run), else by pandas."""
+    if getattr(values, "dtype", np.dtype(object)).kind != "M":
+        hours = _arrowHours(values)
+        if hours is not None:
+            return hours
+    arr = np.asarray(values)
+    if arr.dtype.kind != "M":
+        arr = parseWallClock(arr)
+    return arr.astype("datetime64[h]").astype(np.int64)
+
+
+def hoursToTimestamps(hours) -> np.ndarray:
+    """Converts integer epoch hours back to datetime64 values."""
+    return np.asarray(hours, dtype=np.int64).astype("datetime64[h]")
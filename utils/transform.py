@@ -0,0 +1,182 @@
+import heapq
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+MB = 1024 * 1024
+# SageMaker caps MaxPayloadInMB and MaxConcurrentTransforms * MaxPayloadInMB
+MAX_PAYLOAD_MB = 100
+
+# vCPUs per instance; DeepAR serves one request per core
+INSTANCE_VCPUS = {
+    "ml.m5.large": 2,
+    "ml.m5.xlarge": 4,
+    "ml.m5.2xlarge": 8,
+    "ml.m5.4xlarge": 16,
+    "ml.c5.large": 2,
+    "ml.c5.xlarge": 4,
+    "ml.c5.2xlarge": 8,
+    "ml.c5.4xlarge": 16,
+}
+
+# Settings used when no plan is given (a single serving.json payload)
+DEFAULT_PLAN = {
+    "ShardCount": 1,
+    "BatchStrategy": "SingleRecord",
+    "SplitType": "None",
+    "MaxPayloadInMB": 30,
+    "MaxConcurrentTransforms": 1,
+    "InstanceCount": 1,
+}
+
+
+def transformJobName(prefix: str = "WeatherBatchTransform") -> str:
+    """Builds a unique transform job name from the current time."""
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")[:-3]
+    return f"{prefix}-{timestamp}"
+
+
+def planTransform(record_sizes: Sequence[int],
+                  instance_type: str = "ml.m5.xlarge",
+                  max_instances: int = 4,
+                  series_per_instance: int = 500,
+                  shards_per_instance: int = 2) -> Dict:
+    """Picks shard count, batching, payload size, concurrency and instance
+    count for a transform job from the serving records' sizes.
+
+    Instances scale with the series count (DeepAR's cost is per series).
+    Each instance gets shards_per_instance input files and one concurrent
+    request per vCPU. The payload is sized so every worker gets a request
+    but still fits the largest record."""
+    n = len(record_sizes)
+    if n == 0:
+        raise ValueError("Cannot plan a transform job without records")
+    largest_mb = max(1, math.ceil(max(record_sizes) / MB))
+    if largest_mb > MAX_PAYLOAD_MB:
+        raise ValueError(
+            f"A serving record of {largest_mb}MB exceeds the {MAX_PAYLOAD_MB}MB payload limit")
+
+    instances = min(max_instances, max(1, math.ceil(n / series_per_instance)))
+    shards = 1 if instances == 1 else min(n, instances * shards_per_instance)
+    concurrency = INSTANCE_VCPUS.get(instance_type, 1)
+
+    budget_mb = MAX_PAYLOAD_MB // concurrency
+    if largest_mb > budget_mb:
+        concurrency = max(1, MAX_PAYLOAD_MB // largest_mb)
+        payload_mb = largest_mb
+    else:
+        per_worker = sum(record_sizes) / (instances * concurrency)
+        payload_mb = min(budget_mb, max(largest_mb, math.ceil(per_worker / MB)))
+
+    return {
+        "ShardCount": shards,
+        "BatchStrategy": "MultiRecord",
+        "SplitType": "Line",
+        "MaxPayloadInMB": payload_mb,
+        "MaxConcurrentTransforms": concurrency,
+        "InstanceCount": instances,
+        "RecordCount": n,
+        "TotalBytes": int(sum(record_sizes)),
+    }
+
+
+def shardRecords(record_sizes: Sequence[int], shard_count: int) -> List[List[int]]:
+    """Assigns records to shard_count size-balanced shards (largest record
+    first onto the lightest shard). Each shard keeps its records in input
+    order."""
+    shard_count = max(1, min(shard_count, len(record_sizes)))
+    heap = [(0, s) for s in range(shard_count)]
+    shards: List[List[int]] = [[] for _ in range(shard_count)]
+    for i in sorted(range(len(record_sizes)), key=lambda i: -record_sizes[i]):
+        load, s = heapq.heappop(heap)
+        shards[s].append(i)
+        heapq.heappush(heap, (load + record_sizes[i], s))
+    return [sorted(shard) for shard in shards]
+
+
+def transformJobRequest(job_name: str, model_name: str, input_uri: str,
+                        output_uri: str,
+                        instance_type: str = "ml.m5.xlarge",
+                        plan: Optional[Dict] = None,
+                        compression: str = "None") -> Dict:
+    """CreateTransformJob arguments for the DeepAR batch transform job over
+    the serving input. compression is the input's CompressionType, "None"
+    or "Gzip"."""
+    plan = plan or DEFAULT_PLAN
+    return dict(
+        TransformJobName=job_name,
+        ModelName=model_name,
+        MaxConcurrentTransforms=plan["MaxConcurrentTransforms"],
+        ModelClientConfig={
+            "InvocationsTimeoutInSeconds": 600,
+            "InvocationsMaxRetries": 3,
+        },
+        MaxPayloadInMB=plan["MaxPayloadInMB"],
+        BatchStrategy=plan["BatchStrategy"],
+        TransformInput={
+            "DataSource": {
+                "S3DataSource": {
+                    "S3DataType": "S3Prefix",
+                    "S3Uri": input_uri,
+                }
+            },
+            "ContentType": "application/jsonlines",
+            "CompressionType": compression,
+            "SplitType": plan["SplitType"],
+        },
+        TransformOutput={
+            "S3OutputPath": output_uri,
+            "Accept": "application/jsonlines",
+            "AssembleWith": "Line",
+        },
+        TransformResources={
+            "InstanceType": instance_type,
+            "InstanceCount": plan["InstanceCount"],
+        },
+    )
+
+
+def transformRequestProblems(request: Dict) -> List[str]:
+    """The CreateTransformJob limits SageMaker enforces server-side that
+    request breaks."""
+    payload = request.get("MaxPayloadInMB", 6)
+    concurrency = request.get("MaxConcurrentTransforms", 1)
+    split = request["TransformInput"].get("SplitType", "None")
+    problems = []
+    if not 0 <= payload <= MAX_PAYLOAD_MB:
+        problems.append(f"MaxPayloadInMB must be between 0 and {MAX_PAYLOAD_MB}")
+    if payload * concurrency > MAX_PAYLOAD_MB:
+        problems.append(f"MaxConcurrentTransforms * MaxPayloadInMB must not exceed {MAX_PAYLOAD_MB}")
+    if request.get("BatchStrategy") == "MultiRecord" and split == "None":
+        problems.append("MultiRecord batching requires a SplitType")
+    if request["TransformResources"].get("InstanceCount", 1) < 1:
+        problems.append("InstanceCount must be at least 1")
+    return problems
+
+
+def createTransformJob(client, job_name: str, model_name: str, input_uri: str,
+                       output_uri: str,
+                       instance_type: str = "ml.m5.xlarge",
+                       plan: Optional[Dict] = None,
+                       compression: str = "None") -> Dict:
+    """Submits the DeepAR batch transform job over the serving input."""
+    return client.create_transform_job(**transformJobRequest(
+        job_name, model_name, input_uri, output_uri, instance_type, plan, compression))
+
+
+def dryRunTransformJob(client, job_name: str, model_name: str, input_uri: str,
+                       output_uri: str,
+                       instance_type: str = "ml.m5.xlarge",
+                       plan: Optional[Dict] = None,
+                       compression: str = "None") -> Dict:
+    """Checks the transform job createTransformJob would submit without
+    submitting it: the request must be within SageMaker's limits and the
+    model must exist. Returns the request. CreateTransformJob has no dry-run
+    flag, so the model is checked with DescribeModel."""
+    request = transformJobRequest(job_name, model_name, input_uri, output_uri,
+                                  instance_type, plan, compression)
+    problems = transformRequestProblems(request)
+    if problems:
+        raise ValueError("Invalid transform job: " + "; ".join(problems))
+    client.describe_model(ModelName=model_name)
+    return request
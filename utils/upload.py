@@ -0,0 +1,184 @@
+"""Streaming uploads to S3.
+
+Payloads are bytes, file objects or iterables of byte chunks (such as
+encoded JSON Lines records) and never pass through local disk. The SHA-256
+of the uncompressed payload is stored as object metadata, so one HEAD
+request tells whether the object already holds the same data and the
+upload can be skipped. Payloads above the multipart threshold are sent as
+a multipart upload with parts in flight in parallel, optionally gzip
+compressed on the way.
+"""
+import hashlib
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
+
+from botocore.exceptions import ClientError
+
+MB = 1024 * 1024
+CHECKSUM_METADATA = "sha256"
+# S3 rejects multipart parts below 5MB (except the last)
+MIN_PART_SIZE = 5 * MB
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_MULTIPART_THRESHOLD = 16 * MB
+DEFAULT_MAX_WORKERS = 4
+
+
+def splitS3Uri(uri: str):
+    """(bucket, key) of an s3:// URI."""
+    assert uri.startswith("s3://")
+    split = uri.split("/")
+    return split[2], "/".join(split[3:])
+
+
+def encodeLines(lines: Iterable[str], encoding: str = "utf-8") -> Iterator[bytes]:
+    """JSON Lines records as byte chunks, one per line, as writeLines
+    would write them."""
+    for line in lines:
+        yield (line + "\n").encode(encoding)
+
+
+def _chunks(data, read_size: int = DEFAULT_PART_SIZE) -> Iterator[bytes]:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+    elif hasattr(data, "read"):
+        while True:
+            chunk = data.read(read_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from data
+
+
+def _hashed(chunks: Iterable[bytes], digest) -> Iterator[bytes]:
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def _gzipped(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _fill(chunks: Iterator[bytes], buffer: bytearray, size: int) -> bool:
+    """Appends chunks to buffer until it holds size bytes. Returns False
+    once the stream is exhausted."""
+    while len(buffer) < size:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer += chunk
+    return True
+
+
+def headObject(s3, bucket: str, key: str) -> Optional[Dict]:
+    """The object's metadata, or None when it does not exist."""
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+            raise
+        return None
+
+
+def _matches(existing: Optional[Dict], checksum: Optional[str],
+             content_encoding: Optional[str]) -> bool:
+    if existing is None or checksum is None:
+        return False
+    return (existing.get("Metadata", {}).get(CHECKSUM_METADATA) == checksum
+            and existing.get("ContentEncoding") == content_encoding)
+
+
+def uploadStream(s3, s3_uri: str, data, override: bool = True,
+                 compress: bool = False, checksum: Optional[str] = None,
+                 part_size: int = DEFAULT_PART_SIZE,
+                 multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 stats=None) -> Dict:
+    """Uploads bytes, a file object or an iterable of byte chunks.
+
+    Nothing is sent when the object exists and override is off, or when
+    its stored checksum and encoding match the payload's. checksum, the
+    hex SHA-256 of the uncompressed payload, is computed while buffering
+    when not given; a payload streamed as multipart is only stored with a
+    checksum (and so only skippable later) when one is given. At most
+    max_workers parts are uploaded, and buffered, at a time.
+
+    Returns the URI, whether it was skipped, the bytes sent and the part
+    count. stats, an IOStats, accumulates bytes_written and requests."""
+    bucket, key = splitS3Uri(s3_uri)
+    part_size = max(part_size, MIN_PART_SIZE)
+    content_encoding = "gzip" if compress else None
+    result = {"uri": s3_uri, "skipped": False, "bytes": 0, "parts": 0}
+
+    existing = headObject(s3, bucket, key)
+    if existing is not None and not override:
+        print("File {} already exists.\nSet override to upload anyway.\n".format(s3_uri))
+        return dict(result, skipped=True)
+    if _matches(existing, checksum, content_encoding):
+        print("{} is unchanged, skipping upload".format(s3_uri))
+        return dict(result, skipped=True)
+
+    digest = hashlib.sha256()
+    chunks = _hashed(_chunks(data), digest)
+    if compress:
+        chunks = _gzipped(chunks)
+    buffer = bytearray()
+    if not _fill(chunks, buffer, multipart_threshold + 1):
+        # The whole payload fits in one request
+        checksum = checksum or digest.hexdigest()
+        if _matches(existing, checksum, content_encoding):
+            print("{} is unchanged, skipping upload".format(s3_uri))
+            return dict(result, skipped=True)
+        extra = {"ContentEncoding": content_encoding} if compress else {}
+        print("Uploading file to {}".format(s3_uri))
+        s3.put_object(Bucket=bucket, Key=key, Body=bytes(buffer),
+                      Metadata={CHECKSUM_METADATA: checksum}, **extra)
+        if stats is not None:
+            stats.add("requests")
+            stats.add("bytes_written", len(buffer))
+        return dict(result, bytes=len(buffer), parts=1)
+
+    print("Uploading file to {} in parts".format(s3_uri))
+    extra = {"ContentEncoding": content_encoding} if compress else {}
+    if checksum:
+        extra["Metadata"] = {CHECKSUM_METADATA: checksum}
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+
+    def send(number, body):
+        response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                  PartNumber=number, Body=body)
+        if stats is not None:
+            stats.add("requests")
+            stats.add("bytes_written", len(body))
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    parts, pending, sent = [], [], 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            more = True
+            while more or buffer:
+                more = more and _fill(chunks, buffer, part_size)
+                if not buffer:
+                    # The payload ended on a part boundary
+                    break
+                body = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                pending.append(pool.submit(send, len(parts) + len(pending) + 1, body))
+                sent += len(body)
+                # Bound the parts held in memory
+                if len(pending) >= max_workers:
+                    parts.append(pending.pop(0).result())
+            parts.extend(f.result() for f in pending)
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                     MultipartUpload={"Parts": parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return dict(result, bytes=sent, parts=len(parts))
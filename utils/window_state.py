@@ -0,0 +1,188 @@
+import io
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from utils.align import GRID_EXTENTS, fillGaps, gridExtent, lastWrites, seriesIndex
+from utils.serialization import deepARRecord
+from utils.timestamps import epochHours, formatTimestamps, hoursToTimestamps
+from utils.upload import splitS3Uri
+
+STATE_VERSION = 1
+
+
+class RollingWindow:
+    """Ring buffer of hourly, aligned feature values.
+
+    The hour h lives in slot h % capacity, so advancing the window only
+    clears the slots of hours that enter it; nothing is shifted or
+    recomputed. The window covers the `capacity` hours ending at end_hour;
+    missing values are NaN. Values are stored as dtype."""
+
+    def __init__(self, features: Sequence[str], capacity: int,
+                 dtype=np.float64):
+        self.features = list(features)
+        self.capacity = int(capacity)
+        self.values = np.full((self.capacity, len(self.features)), np.nan,
+                              dtype=dtype)
+        self.end_hour: Optional[int] = None
+        self.first_hour: Optional[int] = None
+
+    @property
+    def start_hour(self) -> Optional[int]:
+        if self.end_hour is None:
+            return None
+        return max(self.first_hour, self.end_hour - self.capacity + 1)
+
+    def _advance(self, new_end: int):
+        if self.end_hour is None:
+            self.values[:] = np.nan
+            self.end_hour = new_end
+            return
+        if new_end <= self.end_hour:
+            return
+        if new_end - self.end_hour >= self.capacity:
+            self.values[:] = np.nan
+        else:
+            entering = np.arange(self.end_hour + 1, new_end + 1) % self.capacity
+            self.values[entering] = np.nan
+        self.end_hour = new_end
+
+    def update(self, hours: np.ndarray, values: np.ndarray,
+               features: Sequence[str]) -> int:
+        """Writes rows (epoch hour, values for `features`) into the window.
+
+        Newer hours advance the window and older hours still inside it are
+        overwritten (last write wins). Rows older than the window are
+        dropped. Returns the number of rows applied."""
+        hours = np.asarray(hours, dtype=np.int64)
+        if len(hours) == 0:
+            return 0
+        columns = [self.features.index(f) for f in features]
+        self._advance(int(hours.max()))
+        low = self.end_hour - self.capacity + 1
+        inside = hours >= low
+        hours, values = hours[inside], np.asarray(values, dtype=self.values.dtype)[inside]
+        if len(hours) == 0:
+            return 0
+        lowest = int(hours.min())
+        self.first_hour = lowest if self.first_hour is None else min(self.first_hour, lowest)
+
+        rows = lastWrites(hours)
+        slots = hours[rows] % self.capacity
+        block = self.values[slots]
+        block[:, columns] = values[rows]
+        self.values[slots] = block
+        return len(rows)
+
+    def updateFrame(self, df: pd.DataFrame) -> int:
+        """Writes a timestamp-indexed frame's feature columns into the window."""
+        return self.update(epochHours(df.index), df.to_numpy(dtype=self.values.dtype),
+                           list(df.columns))
+
+    def toArray(self) -> np.ndarray:
+        """Window contents ordered oldest to newest (one copy)."""
+        if self.end_hour is None:
+            return np.empty((0, len(self.features)), dtype=self.values.dtype)
+        slots = np.arange(self.start_hour, self.end_hour + 1) % self.capacity
+        return self.values[slots]
+
+    def trimmed(self, fill: str = "nan", max_gap: Optional[int] = None,
+                extent: str = "overlap",
+                sources: Optional[Sequence[Sequence[str]]] = None):
+        """(first hour, values) of the window trimmed to the grid alignSources
+        builds: the hours every source spans ("overlap") or any source spans
+        ("union"), with gaps inside it filled as fillGaps does. sources
+        groups the features by source (each feature its own source by
+        default); a source spans the hours where any of its features has a
+        value. The first hour is None when the grid is empty."""
+        if extent not in GRID_EXTENTS:
+            raise ValueError(f"Unknown grid extent: {extent}")
+        data = self.toArray()
+        spans = []
+        for names in sources or [[f] for f in self.features]:
+            columns = [self.features.index(f) for f in names]
+            present = np.flatnonzero(~np.isnan(data[:, columns]).all(axis=1))
+            spans.append((present, None, names))
+        span = gridExtent(spans, extent)
+        if span is None:
+            return None, data[:0]
+        first, last = span
+        return self.start_hour + first, fillGaps(data[first:last + 1], fill, max_gap)
+
+    def records(self, fill: str = "nan", max_gap: Optional[int] = None,
+                extent: str = "overlap",
+                sources: Optional[Sequence[Sequence[str]]] = None) -> List[str]:
+        """DeepAR records for each feature over the trimmed window; gaps
+        left after filling are written as "NaN"."""
+        first_hour, data = self.trimmed(fill, max_gap, extent, sources)
+        if first_hour is None:
+            return []
+        start = formatTimestamps(hoursToTimestamps([first_hour]))[0]
+        return [deepARRecord(start, data[:, i])
+                for i in range(len(self.features))]
+
+    def seriesIndex(self, fill: str = "nan", max_gap: Optional[int] = None,
+                    extent: str = "overlap",
+                    sources: Optional[Sequence[Sequence[str]]] = None) -> List[Dict]:
+        first_hour, data = self.trimmed(fill, max_gap, extent, sources)
+        return seriesIndex(self.features, first_hour, len(data))
+
+    def lastTimestamp(self) -> Optional[datetime]:
+        """End of the newest hour in the window, as an aware UTC datetime."""
+        if self.end_hour is None:
+            return None
+        ts = pd.Timestamp(hoursToTimestamps([self.end_hour])[0])
+        return ts.to_pydatetime().replace(tzinfo=timezone.utc)
+
+    def dumps(self) -> bytes:
+        """Serializes the window into a compact .npz payload."""
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf, version=STATE_VERSION, values=self.values,
+            features=np.array(self.features),
+            end_hour=-1 if self.end_hour is None else self.end_hour,
+            first_hour=-1 if self.first_hour is None else self.first_hour)
+        return buf.getvalue()
+
+    @classmethod
+    def loads(cls, payload: bytes) -> "RollingWindow":
+        data = np.load(io.BytesIO(payload), allow_pickle=False)
+        if int(data["version"]) != STATE_VERSION:
+            raise ValueError("Unsupported rolling window state version")
+        window = cls([str(f) for f in data["features"]], len(data["values"]),
+                     dtype=data["values"].dtype)
+        window.values = data["values"].copy()
+        end_hour, first_hour = int(data["end_hour"]), int(data["first_hour"])
+        window.end_hour = None if end_hour < 0 else end_hour
+        window.first_hour = None if first_hour < 0 else first_hour
+        return window
+
+
+def loadWindowState(s3, uri: str, features: Sequence[str],
+                    capacity: int, dtype=np.float64) -> RollingWindow:
+    """Loads the persisted window, or starts an empty one when none exists
+    or the stored features/capacity no longer match the configuration.
+    A window stored with another dtype is converted."""
+    bucket, key = splitS3Uri(uri)
+    try:
+        payload = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return RollingWindow(features, capacity, dtype)
+    window = RollingWindow.loads(payload)
+    if window.features != list(features) or window.capacity != capacity:
+        print("Rolling window configuration changed, rebuilding state")
+        return RollingWindow(features, capacity, dtype)
+    window.values = window.values.astype(dtype, copy=False)
+    return window
+
+
+def saveWindowState(s3, uri: str, window: RollingWindow):
+    """Persists the window to S3."""
+    bucket, key = splitS3Uri(uri)
+    s3.put_object(Bucket=bucket, Key=key, Body=window.dumps())
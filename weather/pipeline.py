@@ -0,0 +1,406 @@
+import json
+from datetime import timedelta
+import numpy as np
+from utils.preprocessing import *
+from utils.clients import getClient
+from utils.config import loadRunConfig
+from utils.ingest import s3ClientConfig
+from utils.align import alignSources, sourceArrays
+from utils.batch import alignGroups, batchRecords, loadGroupIds, saveGroupIds
+from utils.backtest import BACKTEST_ACTUALS_FILE, BACKTEST_RUN_FILE, gridBacktest, groupBacktest
+from utils.cache import FrameCache
+from utils.chunked import CompactSource, StreamedRecords, chunkBytes
+from utils.metrics import StageTimer, emitMetrics
+from utils.profiling import profiled
+from utils.window_state import loadWindowState, saveWindowState
+from utils.transform import DEFAULT_PLAN, createTransformJob, dryRunTransformJob, planTransform, shardRecords, transformJobName
+from utils.online import MB, forecastOnline, sagemakerInvoker
+from utils.ledger import contentHash, loadLedger, reusableRun, saveLedger
+from utils.upload import encodeLines, uploadStream
+from utils.forecasts import SERIES_INDEX_FILE
+from params import WEATHER_FEATURES, ELECTRICITY_FEATURES
+from params import INGEST_MAX_WORKERS, INGEST_MAX_IN_FLIGHT_MB
+from params import UPLOAD_PART_SIZE_MB, UPLOAD_MULTIPART_THRESHOLD_MB, UPLOAD_MAX_WORKERS
+from params import FRAME_CACHE_DIR, FRAME_CACHE_MAX_MB, FRAME_CACHE_S3_URI
+from params import WEATHER_GROUP_COLUMN, ELECTRICITY_GROUP_COLUMN
+from params import WEATHER_CATEGORICAL_COLUMNS, ELECTRICITY_CATEGORICAL_COLUMNS
+
+# Created once per container so warm invocations reuse parsed partitions
+frame_cache = None
+
+
+def getFrameCache(s3):
+    """Returns the container-wide parsed partition cache."""
+    global frame_cache
+    if frame_cache is None:
+        frame_cache = FrameCache(
+            local_dir=FRAME_CACHE_DIR,
+            max_bytes=FRAME_CACHE_MAX_MB * 1024 * 1024,
+            s3=s3 if FRAME_CACHE_S3_URI else None,
+            s3_uri=FRAME_CACHE_S3_URI,
+        )
+    return frame_cache
+
+
+def runPipeline(event, context, timer=None, properties=None):
+    """Runs one forecast refresh: load, align, serialize, upload and submit
+    the transform job. properties are added to the run's metrics record."""
+    timer = timer or StageTimer()
+    run_id = getattr(context, "aws_request_id", None) or transformJobName("local")
+    status = "Failed"
+    inference_mode = "batch"
+    skipped = False
+    config = None
+    try:
+        # Resolve run settings from params.py, environment and event
+        config = loadRunConfig(event)
+
+        # Initialize AWS clients (cached, or injected by the offline harness)
+        s3 = getClient("s3", config=s3ClientConfig(INGEST_MAX_WORKERS))
+        client = getClient("sagemaker")
+
+        # Backtests write under their own run prefix and never replace serving data or reuse a forecast
+        backtest = None
+        if config["backtest_mode"]:
+            backtest_uri = config["backtest_prefix_uri"] + run_id + "/"
+            config.update(serving_prefix_uri=backtest_uri, serving_input_uri=backtest_uri + "serving.json",
+                          forecast_prefix_uri=backtest_uri + "forecasts/", inference_mode="batch",
+                          incremental_mode=False, skip_unchanged_input=False)
+            backtest_window = {
+                "cutoffs": int(config["backtest_cutoffs"]),
+                "stride": int(config["backtest_stride_hours"]),
+                "context_length": int(config["backtest_context_hours"]),
+                "prediction_length": int(config["backtest_prediction_hours"]),
+            }
+
+        # Canaries write under their own prefix, forecast nothing and never touch serving data or state
+        if config["canary_mode"]:
+            canary_uri = config["canary_prefix_uri"]
+            config.update(serving_prefix_uri=canary_uri, serving_input_uri=canary_uri + "serving.json",
+                          forecast_prefix_uri=canary_uri + "forecasts/", inference_mode="batch",
+                          incremental_mode=False, skip_unchanged_input=False)
+
+        # Retrieve model name from environment variables
+        model_name = config["model_name"]
+        print("Model name: {}".format(model_name))
+
+        encoding = 'utf-8'
+
+        # Get rolling window of data
+        today = config["today"]
+        lag_days = config["lag_days"]
+
+        # Streaming upload settings; serving inputs are optionally gzip compressed
+        upload_limits = {
+            "part_size": UPLOAD_PART_SIZE_MB * MB,
+            "multipart_threshold": UPLOAD_MULTIPART_THRESHOLD_MB * MB,
+            "max_workers": UPLOAD_MAX_WORKERS,
+        }
+        compress = config["serving_compression"] == "gzip"
+
+        # Ingest limits shared by both loaders
+        ingest_limits = {
+            "max_workers": INGEST_MAX_WORKERS,
+            "max_in_flight_bytes": INGEST_MAX_IN_FLIGHT_MB * 1024 * 1024,
+            "cache": getFrameCache(s3),
+            "feature_dtype": config["feature_dtype"],
+            "columnar_prefix": config["columnar_prefix"] if config["raw_data_format"] == "parquet" else None,
+            "manifest_key": config["key_manifest_key"] if config["use_key_manifest"] else None,
+        }
+        weather_categories = list(dict.fromkeys(WEATHER_CATEGORICAL_COLUMNS + [WEATHER_GROUP_COLUMN]))
+        electricity_categories = list(dict.fromkeys(ELECTRICITY_CATEGORICAL_COLUMNS + [ELECTRICITY_GROUP_COLUMN]))
+
+        with profiled(run_id, s3):
+            # Data-time loaders end the window at the newest data, so runs while the feeds are late
+            # load the same hours (and can reuse the last forecast) instead of dropping the oldest one
+            if ((ingest_limits["columnar_prefix"] or ingest_limits["manifest_key"]) and not config["backtest_mode"]) or config["canary_mode"]:
+                with timer.stage("latest_data"):
+                    # Canaries also look up the newest CSVs by LastModified
+                    listing = {"prefix": config["prefix"]} if config["canary_mode"] else {}
+                    latest = [latestDataTime(s3, bucket, today, lag_days, column, ingest_limits["columnar_prefix"], ingest_limits["manifest_key"], **listing)
+                              for bucket, column in [(config["bucket_weather_data"], "timestamp"), (config["bucket_electric_data"], "period")]]
+                    latest = [t for t in latest if t is not None]
+                if config["canary_mode"]:
+                    # Canaries read the newest CANARY_DAY_WINDOW days both sources hold, so a late feed
+                    # still exercises every stage; with nothing to read they report no_data, not a failure
+                    if len(latest) < 2:
+                        print("No data in canary window: nothing from {} to {}".format(lag_days, today))
+                        status = "NoData"
+                        return {
+                            "statusCode": 200,
+                            "body": "No data in canary window",
+                            "transformJobName": None,
+                            "inferenceMode": inference_mode,
+                            "inputUri": None,
+                            "forecastUri": None,
+                            "backtestUri": None,
+                            "skipped": False,
+                            "canary": True,
+                            "canaryResult": "no_data",
+                            "timings": timer.summary(),
+                        }
+                    today = min(latest)
+                    lag_days = today - timedelta(days=int(config["canary_day_window"]))
+                    print("Canary run over {} to {}".format(lag_days, today))
+                elif latest:
+                    today = max(latest)
+                    lag_days = today - timedelta(days=int(config["day_window"]))
+                    print("Window ends at the newest data: {}".format(today))
+
+            # In incremental mode only load data newer than the persisted window
+            window = None
+            if config["incremental_mode"] and not config["batch_mode"]:
+                with timer.stage("load_state"):
+                    window = loadWindowState(s3, config["window_state_uri"], WEATHER_FEATURES + ELECTRICITY_FEATURES, int(config["day_window"]) * 24, dtype=config["feature_dtype"])
+                if window.end_hour is not None:
+                    resume = window.lastTimestamp() - timedelta(hours=config["incremental_overlap_hours"])
+                    lag_days = max(lag_days, resume)
+                print("Loading data modified since: {}".format(lag_days))
+
+            chunked = config["memory_budget_mb"] > 0 and not config["batch_mode"] and window is None
+            if chunked:
+                # Load, clean and compact each source in time-ordered chunks sized from the memory budget
+                window_hours = int((today - lag_days).total_seconds() // 3600) + 1
+                chunk_bytes = chunkBytes(int(config["memory_budget_mb"] * MB), window_hours, len(WEATHER_FEATURES + ELECTRICITY_FEATURES), np.dtype(config["feature_dtype"]).itemsize)
+                print("Loading {} hours in chunks of up to {:.1f}MB".format(window_hours, chunk_bytes / MB))
+                sources = []
+                for stage, load, bucket, features, categories in [
+                        ("load_weather", iterPreprocessedWeatherData, config["bucket_weather_data"], WEATHER_FEATURES, weather_categories),
+                        ("load_electricity", iterPreprocessedElectricityData, config["bucket_electric_data"], ELECTRICITY_FEATURES, electricity_categories)]:
+                    with timer.stage(stage) as stats:
+                        compact = CompactSource(features, config["feature_dtype"])
+                        for df in load(s3, bucket, config["prefix"], today, lag_days, chunk_bytes, stats=stats, features=features, categories=categories, **ingest_limits):
+                            compact.add(df)
+                        stats["rows_out"] = compact.rows
+                    sources.append(compact.arrays())
+            else:
+                # Get preprocessed weather data
+                with timer.stage("load_weather") as stats:
+                    weather_df = getPreprocessedWeatherData(s3, config["bucket_weather_data"], config["prefix"], today, lag_days, stats=stats, features=WEATHER_FEATURES, categories=weather_categories, **ingest_limits)
+                    stats["rows_out"] = len(weather_df)
+
+                # Get preprocessed electricity data
+                with timer.stage("load_electricity") as stats:
+                    electricity_df = getPreprocessedElectricityData(s3, config["bucket_electric_data"], config["prefix"], today, lag_days, stats=stats, features=ELECTRICITY_FEATURES, categories=electricity_categories, **ingest_limits)
+                    stats["rows_out"] = len(electricity_df)
+
+            file_name = "serving.json"
+            gap_fill = {"fill": config["align_fill_method"], "max_gap": config["align_max_gap_hours"]}
+            if config["batch_mode"]:
+                # Persisted group ids, so a station keeps its cat id when others have no rows
+                with timer.stage("group_ids"):
+                    group_ids = loadGroupIds(s3, config["group_ids_uri"])
+                    group_ids.extend("weather", config["weather_stations"])
+                    group_ids.extend("electricity", config["respondents"])
+
+                # Align every station and respondent to its own hourly grid
+                with timer.stage("align") as stats:
+                    stats["rows_in"] = len(weather_df) + len(electricity_df)
+                    groups = [
+                        ("weather", alignGroups(weather_df, WEATHER_GROUP_COLUMN, WEATHER_FEATURES, config["weather_stations"], **gap_fill)),
+                        ("electricity", alignGroups(electricity_df, ELECTRICITY_GROUP_COLUMN, ELECTRICITY_FEATURES, config["respondents"], **gap_fill)),
+                    ]
+                    if config["backtest_mode"]:
+                        backtest = groupBacktest(groups, **backtest_window, group_ids=group_ids)
+                    else:
+                        records, series_index = batchRecords(groups, group_ids)
+                        stats["rows_out"] = len(records)
+                        print("batch series: ", len(records))
+                if group_ids.changed and not config["canary_mode"]:
+                    saveGroupIds(s3, config["group_ids_uri"], group_ids)
+            elif window is not None:
+                # Append new hours to the rolling window and rebuild the series from it
+                with timer.stage("window_update") as stats:
+                    stats["rows_in"] = len(weather_df) + len(electricity_df)
+                    window.updateFrame(weather_df.reindex(columns=WEATHER_FEATURES))
+                    window.updateFrame(electricity_df.reindex(columns=ELECTRICITY_FEATURES))
+                    stats["rows_out"] = len(window.toArray())
+                with timer.stage("serialize") as stats:
+                    grid = {"extent": config["align_grid_extent"], "sources": [WEATHER_FEATURES, ELECTRICITY_FEATURES]}
+                    records = window.records(**grid, **gap_fill)
+                    series_index = window.seriesIndex(**grid, **gap_fill)
+                    stats["rows_out"] = len(records)
+                with timer.stage("save_state"):
+                    saveWindowState(s3, config["window_state_uri"], window)
+            else:
+                # Align weather and electricity on one contiguous hourly grid
+                with timer.stage("align") as stats:
+                    if not chunked:
+                        sources = [
+                            sourceArrays(weather_df, WEATHER_FEATURES),
+                            sourceArrays(electricity_df, ELECTRICITY_FEATURES),
+                        ]
+                    stats["rows_in"] = sum(len(hours) for hours, _, _ in sources)
+                    aligned = alignSources(sources, extent=config["align_grid_extent"], **gap_fill)
+                    stats["rows_out"] = len(aligned.values)
+                for feature in aligned.features:
+                    print('feature name: ', feature)
+
+                # Build one DeepAR series per feature
+                if config["backtest_mode"]:
+                    backtest = gridBacktest(aligned, **backtest_window)
+                else:
+                    with timer.stage("serialize") as stats:
+                        stats["rows_in"] = len(aligned.values)
+                        # Out-of-core runs build each record when it is measured (or hashed) and when uploaded
+                        records = StreamedRecords(aligned) if chunked else aligned.records()
+                        series_index = aligned.seriesIndex()
+                        stats["rows_out"] = len(records)
+
+            if backtest is not None:
+                # One request per (cutoff, series), read from strided views of the aligned grids
+                with timer.stage("backtest") as stats:
+                    records = backtest.records()
+                    series_index = backtest.index()
+                    stats["rows_out"] = len(records)
+                if not records:
+                    raise ValueError("Not enough history for a backtest cutoff")
+                print("backtest requests: ", len(records))
+                uploadStream(s3, config["serving_prefix_uri"] + BACKTEST_ACTUALS_FILE, backtest.actualsNpz())
+
+            # Small runs go to the real-time endpoint; larger ones (or runs without an endpoint) use batch transform
+            if config["inference_mode"] == "online":
+                if not config["online_endpoint_name"]:
+                    print("No online endpoint configured, using batch transform")
+                elif len(records) > config["online_max_series"]:
+                    print("{} series exceeds the online limit of {}, using batch transform".format(len(records), config["online_max_series"]))
+                else:
+                    inference_mode = "online"
+
+            # Reuse the latest forecast when the serving records and model are unchanged
+            previous = None
+            content_hash = None
+            record_sizes = None
+            if config["skip_unchanged_input"]:
+                with timer.stage("hash") as stats:
+                    stats["rows_in"] = len(records)
+                    # Measure the records while hashing them, so streamed ones are built once before upload
+                    record_sizes = []
+                    content_hash = contentHash(records, encoding, sizes=record_sizes)
+                with timer.stage("ledger"):
+                    ledger = loadLedger(s3, config["run_ledger_uri"], config["run_ledger_max_entries"])
+                    previous = reusableRun(ledger, content_hash, model_name, inference_mode, client)
+
+            if previous is not None:
+                print("Serving data unchanged since run {}, reusing {}".format(previous["runId"], previous["forecastUri"]))
+                transform_job_name = previous["transformJobName"]
+                input_uri = previous["inputUri"]
+                forecast_uri = previous["forecastUri"]
+                skipped = True
+            else:
+                # Upload the index describing each series, read back with its forecast
+                uploadStream(s3, config["serving_prefix_uri"] + SERIES_INDEX_FILE, json.dumps(series_index).encode(encoding))
+
+                # Plan shards and transform resources from the record sizes
+                with timer.stage("plan"):
+                    if record_sizes is None:
+                        record_sizes = [len(r) + 1 for r in records]
+                    if inference_mode == "online":
+                        plan = dict(DEFAULT_PLAN)
+                    else:
+                        plan = planTransform(
+                            record_sizes,
+                            config["transform_instance_type"],
+                            max_instances=config["transform_max_instances"],
+                            series_per_instance=config["transform_series_per_instance"],
+                            shards_per_instance=config["transform_shards_per_instance"],
+                        )
+                print("transform plan: ", plan)
+
+                # Stream a single serving.json, or size-balanced shards under a run-specific prefix, to S3
+                with timer.stage("upload") as stats:
+                    if plan["ShardCount"] == 1:
+                        input_uri = config["serving_input_uri"]
+                        uploadStream(s3, config["serving_prefix_uri"] + file_name, encodeLines(records, encoding),
+                                     compress=compress, checksum=content_hash, stats=stats, **upload_limits)
+                    else:
+                        shard_prefix = "shards/{}/".format(run_id)
+                        input_uri = config["serving_prefix_uri"] + shard_prefix
+                        shards = []
+                        for number, shard in enumerate(shardRecords(record_sizes, plan["ShardCount"])):
+                            shard_file = "part-{:05d}.json".format(number)
+                            uploadStream(s3, input_uri + shard_file, encodeLines((records[i] for i in shard), encoding),
+                                         compress=compress, stats=stats, **upload_limits)
+                            shards.append({"file": shard_file, "bytes": sum(record_sizes[i] for i in shard), "series": list(shard)})
+
+                        # Manifest mapping each shard file to its series, outside the input prefix
+                        manifest_file = "shards/{}.manifest.json".format(run_id)
+                        manifest = {"input_uri": input_uri, "plan": plan, "shards": shards}
+                        uploadStream(s3, config["serving_prefix_uri"] + manifest_file, json.dumps(manifest).encode(encoding), stats=stats)
+
+                transform_job_name = None
+                forecast_uri = config["forecast_prefix_uri"] + file_name + ".out"
+                if inference_mode == "online":
+                    # Forecast through the endpoint in micro-batches, written where batch transform would write
+                    with timer.stage("online_forecast") as stats:
+                        stats["rows_in"] = len(records)
+                        invoke = sagemakerInvoker(getClient("sagemaker-runtime"), config["online_endpoint_name"])
+                        forecasts = forecastOnline(
+                            invoke,
+                            records,
+                            max_instances=config["online_max_instances_per_request"],
+                            max_bytes=int(config["online_max_payload_mb"] * MB),
+                            concurrency=config["online_concurrency"],
+                            stats=stats,
+                        )
+                        stats["rows_out"] = len(forecasts)
+                        uploadStream(s3, forecast_uri, encodeLines(forecasts, encoding), **upload_limits)
+                else:
+                    # Create the TransformJobName with a timestamp
+                    transform_job_name = transformJobName()
+                    if plan["ShardCount"] > 1:
+                        forecast_uri = config["forecast_prefix_uri"]
+
+                    # Create transform job, or only check it in a canary run
+                    with timer.stage("transform"):
+                        submit = dryRunTransformJob if config["canary_mode"] else createTransformJob
+                        response = submit(
+                            client,
+                            transform_job_name,
+                            model_name,
+                            input_uri,
+                            config["forecast_prefix_uri"],
+                            instance_type=config["transform_instance_type"],
+                            plan=plan,
+                            compression="Gzip" if compress else "None",
+                        )
+                    if config["canary_mode"]:
+                        print("Canary transform job not submitted: ", transform_job_name)
+                        transform_job_name = None
+
+                # Record the submitted forecast for later runs
+                if config["skip_unchanged_input"]:
+                    with timer.stage("ledger_update"):
+                        ledger.record(content_hash, model_name, inference_mode, input_uri, forecast_uri, transform_job_name, run_id)
+                        saveLedger(s3, config["run_ledger_uri"], ledger)
+
+                # Describe the backtest run for scoring once its forecasts are written
+                if backtest is not None:
+                    run = {"runId": run_id, "modelName": model_name, "transformJobName": transform_job_name,
+                           "inputUri": input_uri, "forecastUri": forecast_uri, **backtest_window}
+                    uploadStream(s3, config["serving_prefix_uri"] + BACKTEST_RUN_FILE, json.dumps(run).encode(encoding))
+        status = "Succeeded"
+
+    except Exception as e:
+        print(e)
+        raise e
+
+    finally:
+        # One machine-readable metrics record per invocation
+        emitMetrics(timer, {"Service": "weather"},
+                    dict(properties or {}, RunId=run_id, Status=status, InferenceMode=inference_mode, Skipped=skipped,
+                         Canary=bool(config and config["canary_mode"])))
+
+    return {
+        "statusCode": 200,
+        "body": "Lambda execution completed",
+        "transformJobName": transform_job_name,
+        "inferenceMode": inference_mode,
+        "inputUri": input_uri,
+        "forecastUri": forecast_uri,
+        "backtestUri": config["serving_prefix_uri"] if backtest is not None else None,
+        "skipped": skipped,
+        "canary": config["canary_mode"],
+        "canaryResult": "passed" if config["canary_mode"] else None,
+        "timings": timer.summary(),
+    }